@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def user_cache_key(user_id):
+    return f"auth:user-fields:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    """Drop a cached user now and again after commit (a request may re-cache the old row meanwhile)"""
+    key = user_cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that caches the user looked up for a token
+    
+    The signature and expiry are still checked on every request; the user's
+    id, email and is_active flag are read from the default cache (in-process,
+    or Redis when REDIS_URL is set) for AUTH_USER_CACHE_TTL seconds instead
+    of queried. The password hash and profile fields are never cached: the
+    user is rebuilt with them deferred, so they load on first access (see
+    load_user_fields).
+    
+    Saving or deleting a user invalidates the entry (see accounts.signals),
+    so deactivation and account deletion take effect immediately. Queryset
+    .update() and bulk writes send no signals: after User.objects.filter(...)
+    .update(is_active=False) a user stays signed in until the entry expires,
+    unless invalidate_cached_user is called for each of them.
+    """
+    
+    CACHED_FIELDS = ('id', 'email', 'is_active')
+    
+    def get_user(self, validated_token):
+        ttl = settings.AUTH_USER_CACHE_TTL
+        if not ttl:
+            return super().get_user(validated_token)
+        
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+        
+        key = user_cache_key(user_id)
+        cached = cache.get(key)
+        if cached is None:
+            user = super().get_user(validated_token)  # Queries and checks the user
+            cached = {field: getattr(user, field) for field in self.CACHED_FIELDS}
+            if api_settings.CHECK_REVOKE_TOKEN:
+                cached['password_hash'] = get_md5_hash_password(user.password)
+            cache.set(key, cached, ttl)
+            return user
+        
+        if api_settings.CHECK_USER_IS_ACTIVE and not cached['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != cached.get('password_hash'):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        
+        return self.user_model.from_db(
+            self.user_model.objects.db, self.CACHED_FIELDS, [cached[field] for field in self.CACHED_FIELDS]
+        )
+
+
+def load_user_fields(user, fields=None):
+    """
+    Load fields CachedJWTAuthentication left deferred in one query
+    
+    Args:
+        user: request.user
+        fields: Field names needed (defaults to all)
+    
+    Returns:
+        User: The same instance with those fields loaded
+    """
+    deferred = user.get_deferred_fields()
+    if fields is not None:
+        deferred &= set(fields)
+    if deferred:
+        user.refresh_from_db(fields=deferred)
+    return user
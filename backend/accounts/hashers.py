@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+from django.conf import settings
+from django.contrib.auth import hashers
+import threading
+
+_slots = None
+_slots_lock = threading.Lock()
+_local = threading.local()
+
+
+class PasswordHashingBusy(Exception):
+    """No hashing slot became free within PASSWORD_HASH_WAIT_TIMEOUT"""
+
+
+def _semaphore():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_WORKERS)
+        return _slots
+
+
+@contextmanager
+def hashing_slot():
+    """
+    Hold one of PASSWORD_HASH_WORKERS slots while hashing
+    
+    Caps the cores a burst of logins and registrations can use, so the
+    chat endpoints on the same worker keep running. Re-entrant, because
+    some hashers call encode() from verify().
+    
+    Raises:
+        PasswordHashingBusy: If no slot frees up in PASSWORD_HASH_WAIT_TIMEOUT seconds
+    """
+    if getattr(_local, 'held', False):
+        yield
+        return
+    
+    slots = _semaphore()
+    if not slots.acquire(timeout=settings.PASSWORD_HASH_WAIT_TIMEOUT):
+        raise PasswordHashingBusy()
+    _local.held = True
+    try:
+        yield
+    finally:
+        _local.held = False
+        slots.release()
+
+
+class BoundedHasherMixin:
+    """Run encode and verify inside a hashing slot"""
+    
+    def encode(self, *args, **kwargs):
+        with hashing_slot():
+            return super().encode(*args, **kwargs)
+    
+    def verify(self, *args, **kwargs):
+        with hashing_slot():
+            return super().verify(*args, **kwargs)
+
+
+class Argon2PasswordHasher(BoundedHasherMixin, hashers.Argon2PasswordHasher):
+    """Argon2id with costs from the PASSWORD_ARGON2_* settings"""
+    
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+    
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+    
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(BoundedHasherMixin, hashers.ScryptPasswordHasher):
+    """scrypt with costs from the PASSWORD_SCRYPT_* settings"""
+    
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+    
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+    
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+    
+    @property
+    def maxmem(self):
+        # OpenSSL refuses above 32 MiB unless allowed; leave room for the configured cost
+        return max(64 * 1024 * 1024, 256 * self.block_size * (self.work_factor + self.parallelism))
+
+
+class PBKDF2PasswordHasher(BoundedHasherMixin, hashers.PBKDF2PasswordHasher):
+    """Django's default; listed so existing hashes verify and are upgraded on login"""
@@ -1,3 +1,113 @@
-from django.test import TestCase
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import user_cache_key
+from .hashers import _semaphore
+from .models import User
 
-# Create your tests here.
+
+class CachedJWTAuthenticationTests(TestCase):
+    """The user behind an access token is cached until the user changes"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='user@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.url = reverse('profile')
+    
+    def test_repeat_requests_skip_the_user_query(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['email'], 'user@example.com')
+        # Only the profile fields are loaded, never the password hash
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('password', queries[0]['sql'])
+    
+    def test_cache_holds_no_password_hash(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        
+        cached = cache.get(user_cache_key(self.user.id))
+        self.assertEqual(cached, {'id': self.user.id, 'email': 'user@example.com', 'is_active': True})
+    
+    def test_deactivation_takes_effect_immediately(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+    
+    def test_deleted_account_is_rejected(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('delete-account'), {'password': 'pass12345'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class PasswordHashingTests(TestCase):
+    """Logins upgrade outdated hashes and back off when every hashing slot is busy"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@example.com', password='pass12345')
+        self.client = APIClient()
+    
+    def login(self):
+        return self.client.post('/api/auth/login/', {'email': 'user@example.com', 'password': 'pass12345'}, format='json')
+    
+    def test_new_passwords_use_argon2(self):
+        self.assertTrue(self.user.password.startswith('argon2$'))
+    
+    def test_login_rehashes_pbkdf2_passwords(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password('pass12345', hasher='pbkdf2_sha256'))
+        
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('argon2$'))
+    
+    def test_login_rehashes_when_cost_changes(self):
+        with override_settings(PASSWORD_ARGON2_TIME_COST=3):
+            self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIn('t=3', self.user.password)
+    
+    @override_settings(PASSWORD_HASH_WAIT_TIMEOUT=0.01)
+    def test_busy_hashing_pool_returns_503(self):
+        slots = _semaphore()
+        held = 0
+        while slots.acquire(blocking=False):
+            held += 1
+        try:
+            response = self.login()
+        finally:
+            for _ in range(held):
+                slots.release()
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+    
+    @override_settings(PASSWORD_HASH_WAIT_TIMEOUT=0.1)
+    def test_busy_hashing_pool_keeps_account_on_delete(self):
+        self.client.force_authenticate(user=self.user)
+        slots = _semaphore()
+        held = 0
+        while slots.acquire(blocking=False):
+            held += 1
+        try:
+            response = self.client.delete(reverse('delete-account'), {'password': 'pass12345'}, format='json')
+        finally:
+            for _ in range(held):
+                slots.release()
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(User.objects.filter(id=self.user.id).exists())
@@ -1,9 +1,12 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate, get_user_model
+from chat.rate_limit import LoginRateThrottle, RegisterRateThrottle
+from .authentication import load_user_fields
+from .hashers import PasswordHashingBusy
 from .serializers import (
     UserRegistrationSerializer,
     UserLoginSerializer,
@@ -14,8 +17,18 @@ from .serializers import (
 User = get_user_model()
 
 
+def hashing_busy_response():
+    """503 for a request that found every password hashing slot taken"""
+    response = Response({
+        'error': 'Too many sign-ins right now, please try again in a few seconds'
+    }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = '5'
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RegisterRateThrottle])
 def register_view(request):
     """
     User Registration Endpoint
@@ -24,7 +37,10 @@ def register_view(request):
     serializer = UserRegistrationSerializer(data=request.data)
     
     if serializer.is_valid():
-        user = serializer.save()
+        try:
+            user = serializer.save()
+        except PasswordHashingBusy:
+            return hashing_busy_response()
         
         # Generate JWT tokens
         refresh = RefreshToken.for_user(user)
@@ -48,6 +64,7 @@ def register_view(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginRateThrottle])
 def login_view(request):
     """
     User Login Endpoint
@@ -59,8 +76,11 @@ def login_view(request):
         email = serializer.validated_data['email']
         password = serializer.validated_data['password']
         
-        # Authenticate user
-        user = authenticate(request, username=email, password=password)
+        # Authenticate user (rehashes the password if its hasher or cost is outdated)
+        try:
+            user = authenticate(request, username=email, password=password)
+        except PasswordHashingBusy:
+            return hashing_busy_response()
         
         if user is not None:
             # Generate JWT tokens
@@ -118,7 +138,7 @@ def user_profile_view(request):
     Get Current User Profile
     GET /api/auth/profile/
     """
-    serializer = UserSerializer(request.user)
+    serializer = UserSerializer(load_user_fields(request.user, UserSerializer.Meta.fields))
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -133,10 +153,15 @@ def delete_account_view(request):
     
     if serializer.is_valid():
         password = serializer.validated_data['password']
-        user = request.user
+        user = load_user_fields(request.user)
         
         # Verify password before deletion
-        if user.check_password(password):
+        try:
+            password_ok = user.check_password(password)
+        except PasswordHashingBusy:
+            return hashing_busy_response()
+        
+        if password_ok:
             # Delete all user data (conversations and messages will be deleted via CASCADE)
             user.delete()
             
@@ -1,13 +1,17 @@
 from django.contrib import admin
-from .models import Conversation, Message
+from .models import Conversation, Message, ReplyJob
+from .search import MessageSearch
 
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'title', 'created_at', 'updated_at', 'is_archived')
+    list_display = ('id', 'user', 'title', 'message_count', 'created_at', 'updated_at', 'is_archived')
     list_filter = ('is_archived', 'created_at')
     search_fields = ('user__email', 'title')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = (
+        'created_at', 'updated_at',
+        'message_count', 'last_message_preview', 'last_sender_type', 'last_message_at'
+    )
 
 
 @admin.register(Message)
@@ -17,6 +21,21 @@ class MessageAdmin(admin.ModelAdmin):
     search_fields = ('message_text', 'conversation__user__email')
     readonly_fields = ('created_at',)
     
+    def get_search_results(self, request, queryset, search_term):
+        """Match message text through the full-text index instead of an icontains scan"""
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        if '@' in search_term:
+            return queryset.filter(conversation__user__email__icontains=search_term), False
+        return MessageSearch.filter_queryset(queryset, search_term), False
+    
     def message_preview(self, obj):
         return obj.message_text[:50] + '...' if len(obj.message_text) > 50 else obj.message_text
-    message_preview.short_description = 'Message'
\ No newline at end of file
+    message_preview.short_description = 'Message'
+
+
+@admin.register(ReplyJob)
+class ReplyJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'conversation', 'status', 'attempts', 'available_at', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'updated_at')
@@ -0,0 +1,280 @@
+"""
+Benchmark harness for the chat API
+
+FakeN8NServer stands in for the N8N webhook (run it with manage.py fake_n8n
+and point N8N_WEBHOOK_URL at it); run_benchmark drives the API with
+scripted user sessions and reports latency percentiles per endpoint
+(manage.py run_benchmark).
+
+Start the server under test with RATE_LIMIT_ENABLED=False: the scripted
+sessions share one client IP and would otherwise mostly be answered 429.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import httpx
+import json
+import random
+import threading
+import time
+import uuid
+
+RESPONSE_SHAPES = ('dict', 'list', 'json')
+
+
+class FakeN8NServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the N8N webhook
+    
+    Args:
+        address: (host, port) to listen on (port 0 picks a free one)
+        latency: Seconds to wait before answering
+        jitter: Random +/- seconds added to the latency
+        error_rate: Fraction of calls answered with HTTP 500
+        shape: One of RESPONSE_SHAPES, or 'mixed' to rotate through them
+        stream: Answer as N8N streaming items (NDJSON) instead of JSON
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, shape='mixed', stream=False):
+        super().__init__(address, FakeN8NHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.shape = shape
+        self.stream = stream
+        self.calls = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/webhook/mental-health"
+    
+    def next_call(self):
+        with self._lock:
+            self.calls += 1
+            return self.calls
+    
+    def start(self):
+        """Serve from a daemon thread (for tests and in-process benchmarks)"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeN8NHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+    
+    def send_body(self, status_code, content_type, body):
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_POST(self):
+        server = self.server
+        call = server.next_call()
+        
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            payload = {}
+        
+        time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        
+        if random.random() < server.error_rate:
+            self.send_body(500, 'application/json', b'{"error": "fake failure"}')
+            return
+        
+        reply = f"Echo: {str(payload.get('current_message', ''))[:200]}"
+        
+        if server.stream:
+            lines = [{'type': 'begin'}]
+            lines += [{'type': 'item', 'content': word + ' '} for word in reply.split()]
+            lines.append({'type': 'end'})
+            body = ''.join(json.dumps(line) + '\n' for line in lines).encode()
+            self.send_body(200, 'application/x-ndjson', body)
+            return
+        
+        shape = server.shape
+        if shape == 'mixed':
+            shape = RESPONSE_SHAPES[call % len(RESPONSE_SHAPES)]
+        
+        item = {'bot_response': reply, 'metadata': {'fake': True, 'shape': shape}}
+        if shape == 'list':
+            data = [item]
+        elif shape == 'json':
+            data = {'json': item}
+        else:
+            data = item
+        self.send_body(200, 'application/json', json.dumps(data).encode())
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class Recorder:
+    """Latencies and errors per endpoint"""
+    
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+    
+    def record(self, endpoint, seconds, ok):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+    
+    async def call(self, endpoint, request, expected=(200, 201, 202)):
+        started = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError:
+            self.record(endpoint, time.perf_counter() - started, ok=False)
+            return None
+        self.record(endpoint, time.perf_counter() - started, ok=response.status_code in expected)
+        return response
+    
+    def summary(self, elapsed):
+        """
+        Per-endpoint report
+        
+        Returns:
+            dict: endpoint -> count, errors, throughput and p50/p95/p99/max in ms
+        """
+        report = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            report[endpoint] = {
+                'count': len(values),
+                'errors': self.errors.get(endpoint, 0),
+                'throughput_rps': round(len(values) / elapsed, 2) if elapsed else None,
+                'p50_ms': round(percentile(values, 50) * 1000, 1),
+                'p95_ms': round(percentile(values, 95) * 1000, 1),
+                'p99_ms': round(percentile(values, 99) * 1000, 1),
+                'max_ms': round(max(values) * 1000, 1),
+            }
+        return report
+
+
+async def _send(client, recorder, conversation_id, text, send_mode):
+    url = f"/api/chat/conversations/{conversation_id}/send/"
+    body = {'message_text': text}
+    
+    if send_mode == 'stream':
+        started = time.perf_counter()
+        first_byte = None
+        try:
+            async with client.stream('POST', url + '?stream=1', json=body) as response:
+                async for _ in response.aiter_bytes():
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        recorder.record('send_stream', time.perf_counter() - started, ok)
+        if first_byte is not None:
+            recorder.record('send_stream_first_byte', first_byte, ok)
+        return
+    
+    if send_mode == 'async':
+        started = time.perf_counter()
+        response = await recorder.call('send_async', client.post(url + '?async=1', json=body))
+        if response is None or response.status_code != 202:
+            return
+        job_url = f"/api/chat/jobs/{response.json()['job']['id']}/"
+        while True:
+            job = await recorder.call('job_poll', client.get(job_url))
+            if job is None or job.json().get('status') in ('done', 'failed'):
+                break
+            await asyncio.sleep(0.1)
+        recorder.record('send_async_reply', time.perf_counter() - started, job is not None)
+        return
+    
+    if send_mode == 'async-view':
+        url = f"/api/chat/conversations/{conversation_id}/send-async/"
+    await recorder.call('send', client.post(url, json=body))
+
+
+async def _user_session(base_url, recorder, run_id, index, messages, reads, send_mode):
+    """One scripted user: register, log in, chat, then reread the conversation"""
+    
+    email = f"bench-{run_id}-{index}@example.com"
+    password = 'Bench-pass-4821!'
+    
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        await recorder.call('register', client.post('/api/auth/register/', json={
+            'email': email,
+            'password': password,
+            'confirm_password': password,
+            'first_name': 'Bench',
+            'last_name': str(index),
+        }))
+        response = await recorder.call('login', client.post('/api/auth/login/', json={
+            'email': email,
+            'password': password,
+        }))
+        if response is None or response.status_code != 200:
+            return
+        client.headers['Authorization'] = f"Bearer {response.json()['tokens']['access']}"
+        
+        response = await recorder.call('conversation_create', client.post(
+            '/api/chat/conversations/', json={'title': f'Benchmark {index}'}
+        ))
+        if response is None or response.status_code != 201:
+            return
+        conversation_id = response.json()['id']
+        
+        for number in range(messages):
+            await _send(client, recorder, conversation_id, f"Benchmark message {number} from user {index}", send_mode)
+        
+        # Reopen the now long conversation the way the chat page does
+        for _ in range(reads):
+            await recorder.call('conversation_list', client.get('/api/chat/conversations/'))
+            await recorder.call('conversation_detail', client.get(f'/api/chat/conversations/{conversation_id}/'))
+            await recorder.call('messages', client.get(f'/api/chat/conversations/{conversation_id}/messages/'))
+
+
+async def run_benchmark(base_url, users=10, messages=5, reads=3, concurrency=10, send_mode='sync'):
+    """
+    Run the scripted scenario against a running server
+    
+    Args:
+        base_url: Server root, e.g. http://127.0.0.1:8000
+        users: Number of simulated users (each registers a new account)
+        messages: Messages each user sends in their conversation
+        reads: Times each user reopens the conversation afterwards
+        concurrency: Users active at the same time
+        send_mode: 'sync', 'async-view', 'async' (job queue) or 'stream'
+    
+    Returns:
+        dict: Per-endpoint report (see Recorder.summary) plus totals
+    """
+    
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    limit = asyncio.Semaphore(concurrency)
+    
+    async def session(index):
+        async with limit:
+            await _user_session(base_url, recorder, run_id, index, messages, reads, send_mode)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(session(index) for index in range(users)))
+    elapsed = time.perf_counter() - started
+    
+    return {
+        'elapsed_seconds': round(elapsed, 2),
+        'requests': sum(len(values) for values in recorder.latencies.values()),
+        'endpoints': recorder.summary(elapsed),
+    }
@@ -0,0 +1,225 @@
+from collections import deque
+from django.conf import settings
+from .structured_logging import log_event
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for an upstream dependency
+    
+    closed: calls go through; failures are counted over a sliding window.
+    open: calls are rejected immediately until the reset timeout passes.
+    half_open: a few trial calls go through; success closes the circuit,
+    failure opens it again.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, name, failure_threshold, error_rate_threshold, window_size,
+                 min_calls, reset_timeout, half_open_calls):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._consecutive_failures = 0
+        self._outcomes = deque(maxlen=window_size)  # True for failure
+        self._half_open_in_flight = 0
+        self._rejected = 0
+    
+    def _set_state(self, state):
+        if state != self._state:
+            log_event(logger, logging.WARNING, 'circuit.transition',
+                      circuit=self.name, from_state=self._state, to_state=state)
+            self._state = state
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        if state != self.HALF_OPEN:
+            self._half_open_in_flight = 0
+        if state == self.CLOSED:
+            self._consecutive_failures = 0
+            self._outcomes.clear()
+    
+    def allow(self):
+        """Return True if a call may go through now"""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._rejected += 1
+                    return False
+                self._set_state(self.HALF_OPEN)
+            
+            if self._state == self.HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_calls:
+                    self._rejected += 1
+                    return False
+                self._half_open_in_flight += 1
+            
+            return True
+    
+    def record(self, failed):
+        """Record the outcome of a call that allow() let through"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._set_state(self.OPEN if failed else self.CLOSED)
+                return
+            
+            self._outcomes.append(failed)
+            self._consecutive_failures = self._consecutive_failures + 1 if failed else 0
+            
+            failures = sum(self._outcomes)
+            error_rate = failures / len(self._outcomes)
+            if (self._consecutive_failures >= self.failure_threshold or
+                    (len(self._outcomes) >= self.min_calls and error_rate >= self.error_rate_threshold)):
+                self._set_state(self.OPEN)
+    
+    def snapshot(self):
+        """Current state for monitoring"""
+        with self._lock:
+            failures = sum(self._outcomes)
+            return {
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                'window_calls': len(self._outcomes),
+                'window_error_rate': round(failures / len(self._outcomes), 3) if self._outcomes else 0.0,
+                'open_for_seconds': round(time.monotonic() - self._opened_at, 1) if self._state == self.OPEN else 0.0,
+                'rejected': self._rejected,
+            }
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limit in-flight calls, adapting the limit to upstream latency (AIMD)
+    
+    Fast successes raise the limit by one; failures or calls slower than
+    the latency target shrink it multiplicatively. Calls over the limit are
+    rejected at once instead of queueing behind a degraded upstream.
+    """
+    
+    def __init__(self, name, min_limit, max_limit, latency_target, decrease_factor=0.75):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        
+        self._lock = threading.Lock()
+        self._limit = float(max_limit)
+        self._in_flight = 0
+        self._rejected = 0
+    
+    def try_acquire(self):
+        """Take a slot; return False if the limit is reached"""
+        with self._lock:
+            if self._in_flight >= int(self._limit):
+                self._rejected += 1
+                return False
+            self._in_flight += 1
+            return True
+    
+    def cancel(self):
+        """Give back a slot whose call never started"""
+        with self._lock:
+            self._in_flight = max(self._in_flight - 1, 0)
+    
+    def release(self, latency, failed):
+        """Give the slot back and adapt the limit"""
+        with self._lock:
+            self._in_flight = max(self._in_flight - 1, 0)
+            if failed or latency > self.latency_target:
+                self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+            else:
+                self._limit = min(self.max_limit, self._limit + 1)
+    
+    def snapshot(self):
+        """Current state for monitoring"""
+        with self._lock:
+            return {
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'rejected': self._rejected,
+            }
+
+
+class N8NGuard:
+    """Process-wide circuit breaker and concurrency limiter for the N8N webhook"""
+    
+    _lock = threading.Lock()
+    _breaker = None
+    _limiter = None
+    
+    @classmethod
+    def breaker(cls):
+        with cls._lock:
+            if cls._breaker is None:
+                cls._breaker = CircuitBreaker(
+                    name='n8n',
+                    failure_threshold=settings.N8N_CIRCUIT_FAILURE_THRESHOLD,
+                    error_rate_threshold=settings.N8N_CIRCUIT_ERROR_RATE,
+                    window_size=settings.N8N_CIRCUIT_WINDOW,
+                    min_calls=settings.N8N_CIRCUIT_MIN_CALLS,
+                    reset_timeout=settings.N8N_CIRCUIT_RESET_TIMEOUT,
+                    half_open_calls=settings.N8N_CIRCUIT_HALF_OPEN_CALLS
+                )
+            return cls._breaker
+    
+    @classmethod
+    def limiter(cls):
+        with cls._lock:
+            if cls._limiter is None:
+                cls._limiter = AdaptiveConcurrencyLimiter(
+                    name='n8n',
+                    min_limit=settings.N8N_CONCURRENCY_MIN,
+                    max_limit=settings.N8N_CONCURRENCY_MAX,
+                    latency_target=settings.N8N_LATENCY_TARGET
+                )
+            return cls._limiter
+    
+    @classmethod
+    def admit(cls):
+        """
+        Decide whether an N8N call may start
+        
+        Returns:
+            str: None if admitted, otherwise the reason ('circuit_open' or 'overloaded')
+        """
+        if not cls.limiter().try_acquire():
+            return 'overloaded'
+        if not cls.breaker().allow():
+            cls.limiter().cancel()
+            return 'circuit_open'
+        return None
+    
+    @classmethod
+    def record(cls, latency, success):
+        """Record the outcome of an admitted call"""
+        failed = not success or latency > settings.N8N_CIRCUIT_SLOW_CALL_SECONDS
+        cls.breaker().record(failed)
+        cls.limiter().release(latency, failed=not success)
+    
+    @classmethod
+    def snapshot(cls):
+        return {
+            'circuit': cls.breaker().snapshot(),
+            'concurrency': cls.limiter().snapshot(),
+        }
+    
+    @classmethod
+    def reset(cls):
+        """Forget all state (used in tests)"""
+        with cls._lock:
+            cls._breaker = None
+            cls._limiter = None
@@ -0,0 +1,47 @@
+"""
+ETag functions for django.views.decorators.http.condition
+
+Each one reads only conversation rows (the denormalized message summary
+and updated_at change with every message write), so a revalidation costs
+one indexed query and a 304 skips serializing messages. The full path is
+part of the tag because pages and cursors select different bodies.
+"""
+from django.db.models import Count, Max, Sum
+from .models import Conversation
+import hashlib
+
+
+def _etag(*parts):
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def conversation_list_etag(request):
+    if request.method != 'GET':
+        return None
+    state = Conversation.objects.filter(
+        user=request.user,
+        is_archived=False
+    ).aggregate(
+        conversations=Count('id'),
+        last_updated=Max('updated_at'),
+        messages=Sum('message_count')
+    )
+    return _etag(
+        request.user.id, state['conversations'], state['last_updated'], state['messages'],
+        request.get_full_path()
+    )
+
+
+def conversation_etag(request, conversation_id):
+    """Tag for the detail and messages endpoints of one conversation"""
+    if request.method != 'GET':
+        return None
+    state = Conversation.objects.filter(
+        id=conversation_id,
+        user=request.user
+    ).values_list(
+        'updated_at', 'message_count', 'last_message_at', 'title', 'is_archived'
+    ).first()
+    if state is None:
+        return None  # Let the view answer 404
+    return _etag(conversation_id, *state, request.get_full_path())
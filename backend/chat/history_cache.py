@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.core.cache import cache
+
+
+class HistoryCache:
+    """
+    Write-through cache of recent formatted history per conversation
+    
+    Each conversation keeps a small ring buffer of N8N-ready history entries
+    in the default cache backend. Message writes append to it (see
+    chat.signals), deletes invalidate it, so building the N8N payload for a
+    new turn needs no database query once the buffer is warm.
+    """
+    
+    KEY_PREFIX = 'chat:history:'
+    
+    @staticmethod
+    def key(conversation_id):
+        return f"{HistoryCache.KEY_PREFIX}{conversation_id}"
+    
+    @staticmethod
+    def size():
+        """
+        Entries kept per conversation
+        
+        A few more than CHAT_HISTORY_LIMIT: one for the message being sent and
+        slack so turns leaving the window can still be folded into the summary.
+        """
+        return settings.CHAT_HISTORY_LIMIT + 3
+    
+    @staticmethod
+    def format_message(message):
+        """Format one Message the way N8N expects it in conversation_history"""
+        return {
+            'sender': message.sender_type,
+            'text': message.message_text,
+            'timestamp': message.created_at.isoformat()
+        }
+    
+    @staticmethod
+    def _store(conversation_id, entries):
+        entries = sorted(entries, key=lambda entry: entry[0])[-HistoryCache.size():]
+        cache.set(HistoryCache.key(conversation_id), entries, settings.CHAT_HISTORY_CACHE_TTL)
+    
+    @staticmethod
+    def load(conversation_id):
+        """Rebuild the buffer for a conversation from the database"""
+        from .models import Message
+        
+        messages = list(
+            Message.objects.filter(conversation_id=conversation_id)
+            .order_by('-created_at', '-id')[:HistoryCache.size()]
+        )
+        entries = [(message.id, HistoryCache.format_message(message)) for message in messages]
+        HistoryCache._store(conversation_id, entries)
+        return sorted(entries, key=lambda entry: entry[0])
+    
+    @staticmethod
+    def append(message):
+        """
+        Add a newly saved message to a warm buffer
+        
+        A read-modify-write, not atomic: when two messages of one conversation
+        are appended at the same moment (two tabs sending at once), one write
+        can drop the other's entry. The buffer then misses that turn until it
+        is invalidated or expires (CHAT_HISTORY_CACHE_TTL). The database is not
+        affected, and a turn's own messages are appended one after the other.
+        """
+        key = HistoryCache.key(message.conversation_id)
+        entries = cache.get(key)
+        
+        # Cold buffer: the next read rebuilds it from the database
+        if entries is None:
+            return
+        
+        if any(entry_id == message.id for entry_id, _ in entries):
+            return
+        
+        entries.append((message.id, HistoryCache.format_message(message)))
+        HistoryCache._store(message.conversation_id, entries)
+    
+    @staticmethod
+    def invalidate(conversation_id):
+        cache.delete(HistoryCache.key(conversation_id))
+    
+    @staticmethod
+    def invalidate_many(conversation_ids):
+        cache.delete_many([HistoryCache.key(conversation_id) for conversation_id in conversation_ids])
+    
+    @staticmethod
+    def get_entries(conversation_id, exclude_id=None):
+        """Get cached (message_id, entry) pairs in chronological order"""
+        entries = cache.get(HistoryCache.key(conversation_id))
+        if entries is None:
+            entries = HistoryCache.load(conversation_id)
+        return [(entry_id, entry) for entry_id, entry in entries if entry_id != exclude_id]
+    
+    @staticmethod
+    def get_history(conversation_id, exclude_id=None, limit=None):
+        """
+        Get formatted history in chronological order
+        
+        Args:
+            conversation_id: ID of the conversation
+            exclude_id: Message ID to leave out (the message being sent)
+            limit: Maximum number of entries (defaults to CHAT_HISTORY_LIMIT)
+        
+        Returns:
+            list: Formatted conversation history
+        """
+        
+        if limit is None:
+            limit = settings.CHAT_HISTORY_LIMIT
+        
+        history = [entry for _, entry in HistoryCache.get_entries(conversation_id, exclude_id)]
+        return history[-limit:] if limit else []
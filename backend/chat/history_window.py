@@ -0,0 +1,132 @@
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from .history_cache import HistoryCache
+
+
+class HistoryWindow:
+    """
+    Build the conversation history sent to N8N within a size budget
+    
+    History is filled from newest to oldest until CHAT_HISTORY_CHAR_BUDGET
+    characters (a rough proxy for prompt tokens) or CHAT_HISTORY_LIMIT
+    messages are used. Turns that fall out of the window can be folded into
+    a short rolling summary stored on the Conversation.
+    """
+    
+    # Approximate JSON overhead of the sender/timestamp fields per entry
+    ENTRY_OVERHEAD = 64
+    
+    @staticmethod
+    def entry_size(entry):
+        return len(entry['text']) + HistoryWindow.ENTRY_OVERHEAD
+    
+    @staticmethod
+    def select(entries, char_budget=None, max_messages=None):
+        """
+        Pick the newest entries that fit the budget
+        
+        Args:
+            entries: (message_id, entry) pairs in chronological order
+            char_budget: Maximum total size of the selected entries
+            max_messages: Maximum number of entries
+        
+        Returns:
+            tuple: (selected, dropped) lists of pairs, both chronological
+        """
+        
+        if char_budget is None:
+            char_budget = settings.CHAT_HISTORY_CHAR_BUDGET
+        if max_messages is None:
+            max_messages = settings.CHAT_HISTORY_LIMIT
+        
+        selected = []
+        used = 0
+        cutoff = len(entries)  # entries[:cutoff] are left out
+        
+        for index in range(len(entries) - 1, -1, -1):
+            entry_id, entry = entries[index]
+            size = HistoryWindow.entry_size(entry)
+            
+            if len(selected) >= max_messages:
+                break
+            
+            if used + size > char_budget:
+                # Always keep the latest turn, truncated to what fits
+                if not selected:
+                    room = max(char_budget - HistoryWindow.ENTRY_OVERHEAD, 0)
+                    selected.append((entry_id, dict(entry, text=entry['text'][:room])))
+                    cutoff = index
+                break
+            
+            selected.append((entry_id, entry))
+            used += size
+            cutoff = index
+        
+        selected.reverse()
+        dropped = entries[:cutoff]
+        return selected, dropped
+    
+    @staticmethod
+    def fold_summary(summary, dropped, max_chars=None):
+        """
+        Append one short line per dropped turn to the rolling summary
+        
+        Only the most recent max_chars characters of the summary are kept.
+        """
+        
+        if max_chars is None:
+            max_chars = settings.CHAT_HISTORY_SUMMARY_CHARS
+        
+        lines = [summary] if summary else []
+        for _, entry in dropped:
+            text = ' '.join(entry['text'].split())
+            if len(text) > settings.CHAT_HISTORY_SUMMARY_LINE_CHARS:
+                text = text[:settings.CHAT_HISTORY_SUMMARY_LINE_CHARS].rstrip() + '...'
+            lines.append(f"{entry['sender']}: {text}")
+        
+        summary = '\n'.join(lines)
+        if len(summary) > max_chars:
+            summary = summary[-max_chars:]
+            # Do not start mid-line
+            summary = summary[summary.find('\n') + 1:] if '\n' in summary else summary
+        return summary
+    
+    @staticmethod
+    def build(conversation, exclude_id=None):
+        """
+        Build the N8N history and rolling summary for a conversation
+        
+        Turns newly dropped from the window are folded into the summary on
+        the conversation instance; TurnWriter saves it with the turn.
+        
+        Args:
+            conversation: Conversation the message is sent in
+            exclude_id: ID of the message being sent
+        
+        Returns:
+            tuple: (conversation_history, conversation_summary)
+        """
+        
+        entries = HistoryCache.get_entries(conversation.id, exclude_id=exclude_id)
+        selected, dropped = HistoryWindow.select(entries)
+        history = [entry for _, entry in selected]
+        
+        if not settings.CHAT_HISTORY_SUMMARY_CHARS:
+            return history, ''
+        
+        # Fold turns that left the window since the last summary update
+        through_id = conversation.summary_through_message_id or 0
+        newly_dropped = [(entry_id, entry) for entry_id, entry in dropped if entry_id > through_id]
+        
+        if newly_dropped:
+            conversation.history_summary = HistoryWindow.fold_summary(
+                conversation.history_summary, newly_dropped
+            )
+            conversation.summary_through_message_id = newly_dropped[-1][0]
+        
+        return history, conversation.history_summary
+    
+    @staticmethod
+    async def abuild(conversation, exclude_id=None):
+        """Async wrapper around build"""
+        return await sync_to_async(HistoryWindow.build)(conversation, exclude_id)
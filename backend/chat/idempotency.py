@@ -0,0 +1,214 @@
+from django.conf import settings
+from django.core.cache import cache
+import asyncio
+import hashlib
+import time
+import uuid
+
+
+class SendDeduplicator:
+    """
+    Idempotency keys and in-flight coalescing for the send endpoints
+    
+    A send claims its keys with atomic cache.add: the client's
+    Idempotency-Key, if it sent one, and a key for the conversation and
+    message text. A retry with the same Idempotency-Key replays the stored
+    response for CHAT_IDEMPOTENCY_TTL. The content key only exists while
+    the send is in flight, so an identical message sent meanwhile (a double
+    click) gets the first response, while the same text sent again later is
+    a new message. Either way duplicates never create extra Message rows or
+    N8N calls.
+    
+    Requests that find a send in flight read its outcome from the result key
+    named in its pending record, written by complete() or abort().
+    """
+    
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    
+    IDEMPOTENCY_PREFIX = 'chat:idem:'
+    
+    @staticmethod
+    def keys(user_id, conversation_id, message_text, idempotency_key=None):
+        """Cache keys identifying a send, the Idempotency-Key one first"""
+        keys = []
+        if idempotency_key:
+            digest = hashlib.sha256(idempotency_key.encode()).hexdigest()
+            keys.append(f"{SendDeduplicator.IDEMPOTENCY_PREFIX}{user_id}:{conversation_id}:{digest}")
+        digest = hashlib.sha256(message_text.encode()).hexdigest()
+        keys.append(f"chat:inflight:{user_id}:{conversation_id}:{digest}")
+        return keys
+    
+    @staticmethod
+    def _idempotency_keys(keys):
+        return [key for key in keys if key.startswith(SendDeduplicator.IDEMPOTENCY_PREFIX)]
+    
+    @staticmethod
+    def _pending_ttl():
+        # Pending claims expire on their own if the leader dies mid-request
+        return settings.N8N_READ_TIMEOUT + settings.N8N_CONNECT_TIMEOUT + 5
+    
+    @staticmethod
+    def _pending_record(result_key=None):
+        return {'state': SendDeduplicator.PENDING, 'result': result_key or f"chat:result:{uuid.uuid4().hex}"}
+    
+    @staticmethod
+    def _done_record(status_code, data):
+        return {'state': SendDeduplicator.DONE, 'status': status_code, 'data': data}
+    
+    @staticmethod
+    def begin(keys):
+        """
+        Claim a send
+        
+        Stops at the first key another request holds. Keys claimed before it
+        (the Idempotency-Key) then follow that request's result, so retries
+        of this request replay it too.
+        
+        Returns:
+            tuple: (claim, record). record is None if this request owns the
+                send; pass claim to complete() or abort(). Otherwise record
+                is the other request's, to pass to wait().
+        """
+        pending = SendDeduplicator._pending_record()
+        claimed = []
+        for key in keys:
+            while not cache.add(key, pending, SendDeduplicator._pending_ttl()):
+                record = cache.get(key)
+                if record is not None:
+                    if claimed:
+                        follow = SendDeduplicator._pending_record(record.get('result'))
+                        cache.set_many({claimed_key: follow for claimed_key in claimed}, SendDeduplicator._pending_ttl())
+                    return None, record
+            claimed.append(key)
+        return {'keys': claimed, 'result': pending['result'], 'refreshed': time.monotonic()}, None
+    
+    @staticmethod
+    def _split(keys):
+        idempotency_keys = SendDeduplicator._idempotency_keys(keys)
+        return idempotency_keys, [key for key in keys if key not in idempotency_keys]
+    
+    @staticmethod
+    def complete(claim, status_code, data):
+        """Store the response for retries and waiters and end the in-flight window"""
+        record = SendDeduplicator._done_record(status_code, data)
+        idempotency_keys, content_keys = SendDeduplicator._split(claim['keys'])
+        cache.set(claim['result'], record, settings.CHAT_DEDUP_RESULT_TTL)
+        if idempotency_keys:
+            cache.set_many({key: record for key in idempotency_keys}, settings.CHAT_IDEMPOTENCY_TTL)
+        cache.delete_many(content_keys)
+    
+    @staticmethod
+    def abort(claim):
+        """Release the claim after a failure so the client can retry"""
+        cache.set(claim['result'], {'state': SendDeduplicator.FAILED}, settings.CHAT_DEDUP_RESULT_TTL)
+        cache.delete_many(claim['keys'])
+    
+    @staticmethod
+    def _settle(keys, record, result):
+        """Turn the result of a followed send into this request's outcome"""
+        if result is None:
+            return record  # Still in flight
+        idempotency_keys = SendDeduplicator._idempotency_keys(keys)
+        if result['state'] == SendDeduplicator.DONE:
+            if idempotency_keys:
+                cache.set_many({key: result for key in idempotency_keys}, settings.CHAT_IDEMPOTENCY_TTL)
+            return result
+        # It failed: a retry of this request is a new send
+        cache.delete_many(idempotency_keys)
+        return None
+    
+    @staticmethod
+    def wait(keys, record, timeout=None):
+        """
+        Wait for the send a record belongs to
+        
+        Holds the worker thread, so the sync views pass a short timeout
+        (CHAT_DEDUP_SYNC_WAIT) and answer 409 while it is still pending.
+        
+        Returns:
+            dict: The done record, the pending record if it did not finish
+                within `timeout`, or None if it failed
+        """
+        if timeout is None:
+            timeout = settings.N8N_READ_TIMEOUT + settings.N8N_CONNECT_TIMEOUT
+        deadline = time.monotonic() + timeout
+        while record['state'] == SendDeduplicator.PENDING:
+            settled = SendDeduplicator._settle(keys, record, cache.get(record['result']))
+            if settled is not record or time.monotonic() >= deadline:
+                return settled
+            time.sleep(settings.CHAT_DEDUP_POLL_INTERVAL)
+        return record
+    
+    @staticmethod
+    async def abegin(keys):
+        pending = SendDeduplicator._pending_record()
+        claimed = []
+        for key in keys:
+            while not await cache.aadd(key, pending, SendDeduplicator._pending_ttl()):
+                record = await cache.aget(key)
+                if record is not None:
+                    if claimed:
+                        follow = SendDeduplicator._pending_record(record.get('result'))
+                        await cache.aset_many(
+                            {claimed_key: follow for claimed_key in claimed}, SendDeduplicator._pending_ttl()
+                        )
+                    return None, record
+            claimed.append(key)
+        return {'keys': claimed, 'result': pending['result'], 'refreshed': time.monotonic()}, None
+    
+    @staticmethod
+    async def arefresh(claim):
+        """
+        Keep a streamed send's claim alive; call it for every chunk
+        
+        The pending TTL covers one read timeout, which httpx applies per read,
+        so a long stream can outlive it. An expired claim would let a retry
+        with the same Idempotency-Key save the message twice. The keys are
+        touched at most every third of the TTL.
+        """
+        ttl = SendDeduplicator._pending_ttl()
+        now = time.monotonic()
+        if now - claim['refreshed'] < ttl / 3:
+            return
+        claim['refreshed'] = now
+        for key in claim['keys']:
+            await cache.atouch(key, ttl)
+    
+    @staticmethod
+    async def acomplete(claim, status_code, data):
+        record = SendDeduplicator._done_record(status_code, data)
+        idempotency_keys, content_keys = SendDeduplicator._split(claim['keys'])
+        await cache.aset(claim['result'], record, settings.CHAT_DEDUP_RESULT_TTL)
+        if idempotency_keys:
+            await cache.aset_many({key: record for key in idempotency_keys}, settings.CHAT_IDEMPOTENCY_TTL)
+        await cache.adelete_many(content_keys)
+    
+    @staticmethod
+    async def aabort(claim):
+        await cache.aset(claim['result'], {'state': SendDeduplicator.FAILED}, settings.CHAT_DEDUP_RESULT_TTL)
+        await cache.adelete_many(claim['keys'])
+    
+    @staticmethod
+    async def _asettle(keys, record, result):
+        if result is None:
+            return record
+        idempotency_keys = SendDeduplicator._idempotency_keys(keys)
+        if result['state'] == SendDeduplicator.DONE:
+            if idempotency_keys:
+                await cache.aset_many({key: result for key in idempotency_keys}, settings.CHAT_IDEMPOTENCY_TTL)
+            return result
+        await cache.adelete_many(idempotency_keys)
+        return None
+    
+    @staticmethod
+    async def await_done(keys, record):
+        """Async variant of wait, without holding a thread for the full timeout"""
+        deadline = time.monotonic() + settings.N8N_READ_TIMEOUT + settings.N8N_CONNECT_TIMEOUT
+        while record['state'] == SendDeduplicator.PENDING:
+            settled = await SendDeduplicator._asettle(keys, record, await cache.aget(record['result']))
+            if settled is not record or time.monotonic() >= deadline:
+                return settled
+            await asyncio.sleep(settings.CHAT_DEDUP_POLL_INTERVAL)
+        return record
@@ -0,0 +1,183 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import ReplyJob
+from .n8n_service import N8NService
+from .persistence import TurnWriter
+from .structured_logging import log_event
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ReplyJobQueue:
+    """
+    Database-backed queue for N8N round trips
+    
+    The send endpoint enqueues a ReplyJob and returns immediately; a worker
+    process (manage.py run_reply_worker) claims jobs, calls N8N with bounded
+    concurrency, retries transient failures and saves the bot Message.
+    """
+    
+    @staticmethod
+    def enqueue(conversation, user_message, conversation_history, conversation_summary=''):
+        """Create a pending job for a saved user message"""
+        return ReplyJob.objects.create(
+            conversation=conversation,
+            user_message=user_message,
+            conversation_history=conversation_history,
+            conversation_summary=conversation_summary
+        )
+    
+    @staticmethod
+    def requeue_stale():
+        """Make jobs held by a worker that died runnable again"""
+        cutoff = timezone.now() - timedelta(seconds=settings.CHAT_JOB_LOCK_TIMEOUT)
+        return ReplyJob.objects.filter(
+            status=ReplyJob.STATUS_RUNNING,
+            locked_at__lt=cutoff
+        ).update(status=ReplyJob.STATUS_PENDING, locked_at=None, updated_at=timezone.now())
+    
+    @staticmethod
+    def claim(limit):
+        """
+        Claim up to `limit` runnable jobs
+        
+        Each job is taken with a conditional UPDATE, so concurrent workers
+        never process the same job (works on SQLite and PostgreSQL alike).
+        
+        Returns:
+            list: Claimed ReplyJob objects
+        """
+        
+        now = timezone.now()
+        candidate_ids = list(
+            ReplyJob.objects.filter(
+                status=ReplyJob.STATUS_PENDING,
+                available_at__lte=now
+            ).order_by('available_at', 'id').values_list('id', flat=True)[:limit]
+        )
+        
+        claimed = []
+        for job_id in candidate_ids:
+            updated = ReplyJob.objects.filter(
+                id=job_id,
+                status=ReplyJob.STATUS_PENDING
+            ).update(
+                status=ReplyJob.STATUS_RUNNING,
+                locked_at=now,
+                attempts=F('attempts') + 1,
+                updated_at=now
+            )
+            if updated:
+                claimed.append(job_id)
+        
+        return list(
+            ReplyJob.objects.filter(id__in=claimed).select_related('conversation', 'user_message')
+        )
+    
+    @staticmethod
+    def process(job):
+        """
+        Run one claimed job: call N8N and store the reply or schedule a retry
+        
+        Returns:
+            str: Final status of the job
+        """
+        
+        conversation = job.conversation
+        n8n_response = N8NService.send_message_to_n8n(
+            user_id=conversation.user_id,
+            conversation_id=conversation.id,
+            current_message=job.user_message.message_text,
+            conversation_history=job.conversation_history,
+            conversation_summary=job.conversation_summary
+        )
+        
+        if not n8n_response['success'] and job.attempts < settings.CHAT_JOB_MAX_ATTEMPTS:
+            delay = settings.CHAT_JOB_RETRY_DELAY * (2 ** (job.attempts - 1))
+            error = str(n8n_response.get('metadata', {}).get('error', ''))
+            log_event(logger, logging.WARNING, 'reply_job.retry',
+                      job_id=job.id, attempt=job.attempts, delay_seconds=delay, error=error)
+            
+            ReplyJob.objects.filter(id=job.id).update(
+                status=ReplyJob.STATUS_PENDING,
+                locked_at=None,
+                available_at=timezone.now() + timedelta(seconds=delay),
+                last_error=error,
+                updated_at=timezone.now()
+            )
+            return ReplyJob.STATUS_PENDING
+        
+        # Save bot response (the apology text once retries are exhausted)
+        final_status = ReplyJob.STATUS_DONE if n8n_response['success'] else ReplyJob.STATUS_FAILED
+        with transaction.atomic():
+            bot_message = TurnWriter.save_bot_message(conversation, n8n_response)
+            ReplyJob.objects.filter(id=job.id).update(
+                status=final_status,
+                bot_message=bot_message,
+                locked_at=None,
+                last_error='' if n8n_response['success'] else str(n8n_response.get('metadata', {}).get('error', '')),
+                updated_at=timezone.now()
+            )
+        return final_status
+    
+    @staticmethod
+    def _process_safely(job):
+        try:
+            return ReplyJobQueue.process(job)
+        except Exception as e:
+            log_event(logger, logging.ERROR, 'reply_job.crashed', exc_info=True, job_id=job.id, error=str(e))
+            ReplyJob.objects.filter(id=job.id).update(
+                status=ReplyJob.STATUS_PENDING,
+                locked_at=None,
+                available_at=timezone.now() + timedelta(seconds=settings.CHAT_JOB_RETRY_DELAY),
+                last_error=str(e),
+                updated_at=timezone.now()
+            )
+        finally:
+            close_old_connections()
+    
+    @staticmethod
+    def run_worker(concurrency=None, stop_event=None, once=False):
+        """
+        Poll the queue and process jobs with at most `concurrency` in flight
+        
+        Args:
+            concurrency: Number of worker threads (defaults to CHAT_JOB_WORKERS)
+            stop_event: threading.Event that ends the loop when set
+            once: Process the currently runnable jobs and return
+        """
+        
+        concurrency = concurrency or settings.CHAT_JOB_WORKERS
+        stop_event = stop_event or threading.Event()
+        in_flight = set()
+        
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='reply-job') as executor:
+            while not stop_event.is_set():
+                in_flight = {future for future in in_flight if not future.done()}
+                free_slots = concurrency - len(in_flight)
+                
+                jobs = []
+                if free_slots > 0:
+                    ReplyJobQueue.requeue_stale()
+                    jobs = ReplyJobQueue.claim(free_slots)
+                    for job in jobs:
+                        in_flight.add(executor.submit(ReplyJobQueue._process_safely, job))
+                
+                if once and not jobs:
+                    for future in in_flight:
+                        future.result()
+                    if not ReplyJob.objects.filter(
+                        status=ReplyJob.STATUS_PENDING,
+                        available_at__lte=timezone.now()
+                    ).exists():
+                        break
+                    continue
+                
+                if not jobs:
+                    stop_event.wait(settings.CHAT_JOB_POLL_INTERVAL)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from chat.benchmark import RESPONSE_SHAPES, FakeN8NServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the N8N webhook (set N8N_WEBHOOK_URL to its URL)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=5678)
+        parser.add_argument('--latency', type=float, default=0.5, help='Seconds before answering')
+        parser.add_argument('--jitter', type=float, default=0.2, help='Random +/- seconds added to the latency')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with HTTP 500')
+        parser.add_argument(
+            '--shape',
+            choices=RESPONSE_SHAPES + ('mixed',),
+            default='mixed',
+            help='Response shape (mixed rotates through all of them)'
+        )
+        parser.add_argument('--stream', action='store_true', help='Answer with N8N streaming items (NDJSON)')
+    
+    def handle(self, *args, **options):
+        server = FakeN8NServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            shape=options['shape'],
+            stream=options['stream']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Fake N8N listening on {server.url}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping fake N8N...')
+        finally:
+            server.server_close()
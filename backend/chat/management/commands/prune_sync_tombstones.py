@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from chat.sync import DeltaSync
+
+
+class Command(BaseCommand):
+    help = 'Delete delta sync tombstones older than CHAT_SYNC_TOMBSTONE_TTL'
+    
+    def handle(self, *args, **options):
+        deleted = DeltaSync.prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstones'))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from chat.benchmark import run_benchmark
+import asyncio
+import json
+
+
+class Command(BaseCommand):
+    help = 'Drive a running server with scripted chat sessions and report latency percentiles'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--users', type=int, default=10, help='Simulated users (each registers an account)')
+        parser.add_argument('--messages', type=int, default=5, help='Messages sent per user')
+        parser.add_argument('--reads', type=int, default=3, help='Times each user reopens the conversation')
+        parser.add_argument('--concurrency', type=int, default=10, help='Users active at the same time')
+        parser.add_argument(
+            '--send-mode',
+            choices=('sync', 'async-view', 'async', 'stream'),
+            default='sync',
+            help='send/ as is, send-async/, send/?async=1 (needs run_reply_worker) or send/?stream=1'
+        )
+        parser.add_argument('--output', help='Also write the report as JSON to this file')
+    
+    def handle(self, *args, **options):
+        report = asyncio.run(run_benchmark(
+            options['base_url'],
+            users=options['users'],
+            messages=options['messages'],
+            reads=options['reads'],
+            concurrency=options['concurrency'],
+            send_mode=options['send_mode']
+        ))
+        
+        self.stdout.write(f"{report['requests']} requests in {report['elapsed_seconds']}s")
+        self.stdout.write(
+            f"{'endpoint':<24}{'count':>7}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        )
+        for endpoint, row in report['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<24}{row['count']:>7}{row['errors']:>8}{row['throughput_rps']:>9}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}"
+            )
+        
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from chat.jobs import ReplyJobQueue
+import signal
+import threading
+
+
+class Command(BaseCommand):
+    help = 'Process queued N8N reply jobs (messages sent with ?async=1)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=None,
+            help='Maximum N8N calls in flight (defaults to CHAT_JOB_WORKERS)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the jobs that are currently runnable and exit'
+        )
+    
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+        
+        # Finish in-flight jobs on SIGTERM/SIGINT instead of dropping them
+        def stop(signum, frame):
+            self.stdout.write('Stopping reply worker...')
+            stop_event.set()
+        
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        
+        self.stdout.write(self.style.SUCCESS('Reply worker started'))
+        ReplyJobQueue.run_worker(
+            concurrency=options['concurrency'],
+            stop_event=stop_event,
+            once=options['once']
+        )
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Substr
+from chat.models import Conversation, ConversationQuerySet, Message
+
+
+class Command(BaseCommand):
+    help = 'Verify and backfill the denormalized message summary columns of conversations'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report conversations whose summary is out of date (exit status 1 if any)'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def stale_ids(self, batch_size):
+        """Yield IDs of conversations whose columns differ from their messages"""
+        messages = Message.objects.filter(conversation=OuterRef('pk'))
+        last_message = messages.order_by('-created_at', '-id')
+        
+        actual = Conversation.objects.annotate(
+            actual_count=Subquery(
+                messages.order_by().values('conversation').annotate(total=Count('id')).values('total')
+            ),
+            actual_preview=Subquery(
+                last_message.annotate(
+                    preview=Substr('message_text', 1, ConversationQuerySet.PREVIEW_CHARS)
+                ).values('preview')[:1]
+            ),
+            actual_sender=Subquery(last_message.values('sender_type')[:1]),
+            actual_at=Subquery(last_message.values('created_at')[:1]),
+        ).order_by('id').values_list(
+            'id', 'message_count', 'last_message_preview', 'last_sender_type', 'last_message_at',
+            'actual_count', 'actual_preview', 'actual_sender', 'actual_at'
+        )
+        
+        for row in actual.iterator(chunk_size=batch_size):
+            conversation_id, count, preview, sender, at, actual_count, actual_preview, actual_sender, actual_at = row
+            if (count, preview, sender, at) != (actual_count or 0, actual_preview or '', actual_sender or '', actual_at):
+                yield conversation_id
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        stale = list(self.stale_ids(batch_size))
+        total = Conversation.objects.count()
+        self.stdout.write(f'{len(stale)} of {total} conversations have an out-of-date message summary')
+        
+        if options['check']:
+            if stale:
+                raise CommandError(f'Stale conversation summaries, e.g. IDs {stale[:10]}')
+            return
+        
+        for start in range(0, len(stale), batch_size):
+            Conversation.objects.filter(pk__in=stale[start:start + batch_size]).refresh_summaries()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {len(stale)} conversations'))
@@ -0,0 +1,169 @@
+"""
+Prometheus metrics for the chat API
+
+With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR (an empty
+directory, before the workers start) so every process writes its samples
+to files there and /metrics aggregates all of them.
+"""
+from contextvars import ContextVar
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+import collections
+import os
+import time
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+SEND_LATENCY = Histogram(
+    'chat_send_latency_seconds',
+    'End-to-end latency of a send, by how it was answered',
+    ['mode'],
+    buckets=LATENCY_BUCKETS
+)
+
+N8N_LATENCY = Histogram(
+    'chat_n8n_latency_seconds',
+    'N8N webhook round trip, by outcome',
+    ['mode', 'outcome'],
+    buckets=LATENCY_BUCKETS
+)
+
+N8N_REJECTED = Counter(
+    'chat_n8n_rejected_total',
+    'N8N calls refused by the circuit breaker or concurrency limit',
+    ['reason']
+)
+
+N8N_PAYLOAD_BYTES = Histogram(
+    'chat_n8n_payload_bytes',
+    'Size of the JSON payload posted to N8N',
+    buckets=(512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+)
+
+VIEW_LATENCY = Histogram(
+    'chat_view_latency_seconds',
+    'Time spent in a view until the response is returned',
+    ['view', 'method'],
+    buckets=LATENCY_BUCKETS
+)
+
+VIEW_DB_QUERIES = Histogram(
+    'chat_view_db_queries',
+    'Database queries issued per request',
+    ['view', 'method'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+
+VIEW_DB_SECONDS = Histogram(
+    'chat_view_db_seconds',
+    'Time spent in database queries per request',
+    ['view', 'method'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+
+RATE_LIMITED = Counter(
+    'chat_rate_limited_total',
+    'Requests refused by a token-bucket rate limit',
+    ['scope']
+)
+
+REALTIME_SUBSCRIBERS = Gauge(
+    'chat_realtime_subscribers',
+    'Open realtime event streams',
+    multiprocess_mode='livesum'
+)
+
+# Query stats collectors active for the current request (the metrics and
+# profiling middleware each add one). The dicts are mutable so ORM calls made
+# through sync_to_async, which copies the context, still update them.
+_query_stats = ContextVar('chat_query_stats', default=())
+
+
+def count_queries(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the active collectors"""
+    collectors = _query_stats.get()
+    if not collectors:
+        return execute(sql, params, many, context)
+    
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for stats in collectors:
+            stats['queries'] += 1
+            stats['seconds'] += elapsed
+            if 'statements' in stats:
+                stats['statements'][sql] += 1
+
+
+def collect_queries(record_sql=False):
+    """
+    Begin collecting query stats in the current context
+    
+    Args:
+        record_sql: Also count each distinct SQL statement (for N+1 reports)
+    
+    Returns:
+        tuple: (stats dict, token to pass to stop_collecting)
+    """
+    stats = {'queries': 0, 'seconds': 0.0, 'started': time.perf_counter()}
+    if record_sql:
+        stats['statements'] = collections.Counter()
+    return stats, _query_stats.set(_query_stats.get() + (stats,))
+
+
+def stop_collecting(token):
+    _query_stats.reset(token)
+
+
+def start_request():
+    """Begin collecting query stats for the current request"""
+    return collect_queries()
+
+
+def finish_request(request, stats, token):
+    """Stop collecting and record the request's view metrics"""
+    stop_collecting(token)
+    
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return  # Unrouted requests (404s, static files) would only add noise
+    
+    labels = (match.view_name, request.method)
+    VIEW_LATENCY.labels(*labels).observe(time.perf_counter() - stats['started'])
+    VIEW_DB_QUERIES.labels(*labels).observe(stats['queries'])
+    VIEW_DB_SECONDS.labels(*labels).observe(stats['seconds'])
+
+
+def observe_send(mode, started):
+    """Record a send answered in `mode`, started at time.monotonic() `started`"""
+    SEND_LATENCY.labels(mode).observe(time.monotonic() - started)
+
+
+def observe_n8n_call(mode, outcome, latency, payload_bytes):
+    N8N_LATENCY.labels(mode, outcome).observe(latency)
+    N8N_PAYLOAD_BYTES.observe(payload_bytes)
+
+
+def render():
+    """
+    Render all metrics in the Prometheus text format
+    
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,171 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from accounts.authentication import CachedJWTAuthentication
+from . import metrics
+from .structured_logging import log_event
+import cProfile
+import logging
+import pstats
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Record per-view latency, DB query count and DB time
+    
+    Queries are counted by the execute wrapper installed on every database
+    connection (see signals.py). Work done while a streaming response is
+    consumed happens after the view returns and is not included.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        stats, token = metrics.start_request()
+        try:
+            return self.get_response(request)
+        finally:
+            metrics.finish_request(request, stats, token)
+    
+    async def __acall__(self, request):
+        stats, token = metrics.start_request()
+        try:
+            return await self.get_response(request)
+        finally:
+            metrics.finish_request(request, stats, token)
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in per-request profile: wall time, ORM query count and SQL time
+    
+    Enabled for every request by CHAT_PROFILING_ENABLED, or for one request
+    by a staff user sending `X-Profile: 1` (add `X-Profile: cprofile` for a
+    cProfile of the view, sync views only). Results come back as
+    Server-Timing and X-Query-Count headers; slow requests and requests
+    profiled on demand are also logged as 'request.profile' with the most
+    repeated SQL statements (N+1 candidates) and the hottest functions.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    @staticmethod
+    def requested_mode(request):
+        """Return the X-Profile mode if the header asks for one ('1' or 'cprofile')"""
+        mode = request.headers.get('X-Profile', '').lower()
+        return mode if mode in ('1', 'cprofile') else None
+    
+    @staticmethod
+    def is_staff(request):
+        """Check staff status for session or JWT clients (JWT runs later, in DRF)"""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        try:
+            result = CachedJWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return bool(result and result[0].is_staff)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        mode = self.requested_mode(request)
+        if mode and not self.is_staff(request):
+            mode = None
+        if not mode and not settings.CHAT_PROFILING_ENABLED:
+            return self.get_response(request)
+        
+        profiler = cProfile.Profile() if mode == 'cprofile' else None
+        stats, token = metrics.collect_queries(record_sql=True)
+        try:
+            if profiler:
+                response = profiler.runcall(self.get_response, request)
+            else:
+                response = self.get_response(request)
+        finally:
+            metrics.stop_collecting(token)
+        
+        self.report(request, response, stats, profiler, on_demand=bool(mode))
+        return response
+    
+    async def __acall__(self, request):
+        mode = self.requested_mode(request)
+        if mode and not await sync_to_async(self.is_staff)(request):
+            mode = None
+        if not mode and not settings.CHAT_PROFILING_ENABLED:
+            return await self.get_response(request)
+        
+        stats, token = metrics.collect_queries(record_sql=True)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.stop_collecting(token)
+        
+        self.report(request, response, stats, None, on_demand=bool(mode))
+        return response
+    
+    @staticmethod
+    def top_functions(profiler, limit):
+        """The `limit` functions with the most cumulative time"""
+        profile = pstats.Stats(profiler)
+        rows = sorted(profile.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return [
+            {
+                'function': f"{filename}:{line}({name})",
+                'calls': calls,
+                'own_ms': round(own_time * 1000, 2),
+                'cumulative_ms': round(cumulative_time * 1000, 2),
+            }
+            for (filename, line, name), (_, calls, own_time, cumulative_time, _) in rows
+        ]
+    
+    def report(self, request, response, stats, profiler, on_demand):
+        total_ms = (time.perf_counter() - stats['started']) * 1000
+        db_ms = stats['seconds'] * 1000
+        
+        response['Server-Timing'] = (
+            f'app;dur={total_ms:.1f}, db;dur={db_ms:.1f};desc="{stats["queries"]} queries"'
+        )
+        response['X-Query-Count'] = str(stats['queries'])
+        
+        if not on_demand and total_ms < settings.CHAT_PROFILING_SLOW_MS:
+            return
+        
+        match = getattr(request, 'resolver_match', None)
+        repeated = [
+            {'sql': sql[:300], 'count': count}
+            for sql, count in stats['statements'].most_common(5)
+            if count > 1
+        ]
+        log_event(
+            logger, logging.WARNING if not on_demand else logging.INFO, 'request.profile',
+            view=match.view_name if match else None,
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            duration_ms=round(total_ms, 1),
+            queries=stats['queries'],
+            db_ms=round(db_ms, 1),
+            repeated_queries=repeated,
+            functions=lambda: self.top_functions(profiler, settings.CHAT_PROFILING_TOP_FUNCTIONS) if profiler else None
+        )
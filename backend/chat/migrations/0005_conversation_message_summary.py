@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+
+
+def backfill_message_summary(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    
+    messages = Message.objects.filter(conversation=OuterRef('pk'))
+    last_message = messages.order_by('-created_at', '-id')
+    message_count = messages.order_by().values('conversation').annotate(total=Count('id')).values('total')
+    
+    Conversation.objects.update(
+        message_count=Coalesce(Subquery(message_count), 0),
+        last_message_preview=Coalesce(
+            Subquery(last_message.annotate(preview=Substr('message_text', 1, 100)).values('preview')[:1]),
+            Value('')
+        ),
+        last_sender_type=Coalesce(Subquery(last_message.values('sender_type')[:1]), Value('')),
+        last_message_at=Subquery(last_message.values('created_at')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_replyjob'),
+    ]
+    
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_sender_type',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_message_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+from django.db import migrations
+
+# SQLite: external-content FTS5 table over chat_message, kept current by triggers.
+# SQLite drops a table's triggers when a migration remakes it (most AlterField,
+# RemoveField or constraint changes on chat_message), so such a migration must
+# run the CREATE TRIGGER statements below again; MessageSearch refuses to use a
+# stale index and chat.tests checks the triggers after migrate.
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE chat_message_fts USING fts5(
+        message_text, content='chat_message', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts(rowid, message_text) VALUES (new.id, new.message_text);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_delete AFTER DELETE ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, message_text)
+        VALUES ('delete', old.id, old.message_text);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_update AFTER UPDATE OF message_text ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, message_text)
+        VALUES ('delete', old.id, old.message_text);
+        INSERT INTO chat_message_fts(rowid, message_text) VALUES (new.id, new.message_text);
+    END
+    """,
+    "INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS chat_message_fts_insert',
+    'DROP TRIGGER IF EXISTS chat_message_fts_delete',
+    'DROP TRIGGER IF EXISTS chat_message_fts_update',
+    'DROP TABLE IF EXISTS chat_message_fts',
+]
+
+POSTGRES_INDEX = 'chat_msg_fts_idx'
+
+
+def postgres_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+    
+    # Same expression as MessageSearch uses, so the planner can match it
+    return GinIndex(SearchVector('message_text', config='english'), name=POSTGRES_INDEX)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQLITE_CREATE:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('chat', 'Message'), postgres_index())
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for sql in SQLITE_DROP:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('chat', 'Message'), postgres_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_conversation_message_summary'),
+    ]
+    
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
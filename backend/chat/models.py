@@ -1,8 +1,125 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Substr
 from django.conf import settings
+from django.utils import timezone
 from datetime import datetime
 
 
+class ConversationQuerySet(models.QuerySet):
+    """QuerySet helpers keeping the denormalized message summary in sync"""
+    
+    PREVIEW_CHARS = 100
+    
+    def record_new_messages(self, messages, **fields):
+        """
+        Count newly inserted messages in one UPDATE
+        
+        Adds them to message_count and moves the last message columns to the
+        newest of them unless a later message is already recorded. Extra
+        `fields` are set in the same UPDATE.
+        
+        Args:
+            messages: Saved messages of the conversations in this queryset
+        """
+        
+        last = max(messages, key=lambda message: (message.created_at, message.id))
+        newest = Q(last_message_at__isnull=True) | Q(last_message_at__lte=last.created_at)
+        
+        def if_newest(column, value, output_field):
+            return Case(When(newest, then=Value(value, output_field=output_field)), default=F(column))
+        
+        fields.setdefault('updated_at', timezone.now())
+        return self.update(
+            message_count=F('message_count') + len(messages),
+            last_message_preview=if_newest(
+                'last_message_preview', last.message_text[:self.PREVIEW_CHARS], models.CharField()
+            ),
+            last_sender_type=if_newest('last_sender_type', last.sender_type, models.CharField()),
+            last_message_at=if_newest('last_message_at', last.created_at, models.DateTimeField()),
+            **fields
+        )
+    
+    def refresh_summaries(self, **fields):
+        """
+        Recompute the message summary columns from the Message table (one UPDATE)
+        
+        Pass updated_at when messages changed so delta sync picks the
+        conversations up; extra `fields` are set in the same UPDATE.
+        """
+        messages = Message.objects.filter(conversation=OuterRef('pk'))
+        last_message = messages.order_by('-created_at', '-id')
+        message_count = messages.order_by().values('conversation').annotate(total=Count('id')).values('total')
+        
+        return self.update(
+            message_count=Coalesce(Subquery(message_count), 0),
+            last_message_preview=Coalesce(
+                Subquery(last_message.annotate(
+                    preview=Substr('message_text', 1, self.PREVIEW_CHARS)
+                ).values('preview')[:1]),
+                Value('')
+            ),
+            last_sender_type=Coalesce(Subquery(last_message.values('sender_type')[:1]), Value('')),
+            last_message_at=Subquery(last_message.values('created_at')[:1]),
+            **fields
+        )
+
+
+class MessageQuerySet(models.QuerySet):
+    """
+    Keep conversation summaries right on bulk writes
+    
+    Single saves and deletes are handled by signals (see chat.signals);
+    bulk_create and update send no signals, and delete sends one per row,
+    so they refresh once per affected conversation here and drop those
+    conversations' history buffers.
+    """
+    
+    def bulk_create(self, objs, *args, sync_summary=True, **kwargs):
+        """
+        bulk_create; pass sync_summary=False when the caller updates the
+        conversations and the history cache itself
+        """
+        from .history_cache import HistoryCache
+        
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if sync_summary and objs:
+            conversation_ids = {message.conversation_id for message in objs}
+            Conversation.objects.filter(pk__in=conversation_ids).refresh_summaries(updated_at=timezone.now())
+            HistoryCache.invalidate_many(conversation_ids)
+        return objs
+    
+    def update(self, **kwargs):
+        from .history_cache import HistoryCache
+        
+        conversation_ids = set(self.values_list('conversation_id', flat=True).distinct())
+        rows = super().update(**kwargs)
+        if rows:
+            if 'conversation' in kwargs:
+                conversation_ids.add(getattr(kwargs['conversation'], 'pk', kwargs['conversation']))
+            if 'conversation_id' in kwargs:
+                conversation_ids.add(kwargs['conversation_id'])
+            Conversation.objects.filter(pk__in=conversation_ids).refresh_summaries(updated_at=timezone.now())
+            HistoryCache.invalidate_many(conversation_ids)
+        return rows
+    
+    def delete(self):
+        from .history_cache import HistoryCache
+        
+        with transaction.atomic(using=self.db):
+            deleted = list(self.only('id', 'conversation_id'))
+            conversation_ids = {message.conversation_id for message in deleted}
+            result = super().delete()
+            if result[0]:
+                Conversation.objects.filter(pk__in=conversation_ids).refresh_summaries(updated_at=timezone.now())
+                Tombstone.objects.record(deleted)
+        HistoryCache.invalidate_many(conversation_ids)
+        return result
+    
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class Conversation(models.Model):
     """Model for storing user conversations"""
     
@@ -16,10 +133,36 @@ class Conversation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_archived = models.BooleanField(default=False)
     
+    # Rolling summary of turns that no longer fit the N8N history window
+    history_summary = models.TextField(blank=True, default='')
+    summary_through_message_id = models.BigIntegerField(null=True, blank=True)
+    
+    # Denormalized from the messages so the list needs no join (ConversationQuerySet)
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_preview = models.CharField(max_length=100, blank=True, default='')
+    last_sender_type = models.CharField(max_length=10, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = ConversationQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-updated_at']
         verbose_name = 'Conversation'
         verbose_name_plural = 'Conversations'
+        indexes = [
+            # Sidebar: a user's conversations, most recently updated first
+            models.Index(
+                fields=['user', 'is_archived', '-updated_at'],
+                name='chat_conv_user_updated_idx'
+            ),
+            # Same listing restricted to active conversations (partial index
+            # where the backend supports it, e.g. SQLite and PostgreSQL)
+            models.Index(
+                fields=['user', '-updated_at', '-id'],
+                condition=Q(is_archived=False),
+                name='chat_conv_active_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.title or f'Conversation {self.id}'}"
@@ -50,10 +193,142 @@ class Message(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     n8n_metadata = models.JSONField(null=True, blank=True)
     
+    objects = MessageQuerySet.as_manager()
+    
     class Meta:
         ordering = ['created_at']
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
+        indexes = [
+            # History for N8N and message listing: one conversation by time
+            models.Index(
+                fields=['conversation', 'created_at', 'id'],
+                name='chat_msg_conv_created_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.sender_type}: {self.message_text[:50]}..."
+
+
+class ReplyJob(models.Model):
+    """Queued N8N round trip for a user message (asynchronous send mode)"""
+    
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    )
+    
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='reply_jobs'
+    )
+    user_message = models.OneToOneField(
+        Message,
+        on_delete=models.CASCADE,
+        related_name='reply_job'
+    )
+    bot_message = models.OneToOneField(
+        Message,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    
+    # Snapshot of what is sent to N8N, taken when the job is enqueued
+    conversation_history = models.JSONField(default=list)
+    conversation_summary = models.TextField(blank=True, default='')
+    
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Reply job'
+        verbose_name_plural = 'Reply jobs'
+        indexes = [
+            # Worker polling: oldest runnable job first
+            models.Index(fields=['status', 'available_at'], name='chat_job_status_avail_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+
+class TombstoneQuerySet(models.QuerySet):
+
+    def record(self, instances):
+        """
+        Remember deleted conversations or messages for delta sync
+        
+        One INSERT, plus one query for the owners of deleted messages.
+        
+        Args:
+            instances: Deleted Conversation or Message objects of one kind
+        """
+        instances = list(instances)
+        if instances and not isinstance(instances[0], Conversation):
+            owners = dict(
+                Conversation.objects.filter(
+                    pk__in={message.conversation_id for message in instances}
+                ).values_list('id', 'user_id')
+            )
+        
+        rows = []
+        for instance in instances:
+            if isinstance(instance, Conversation):
+                rows.append(Tombstone(user_id=instance.user_id, conversation_id=instance.id))
+            else:
+                rows.append(Tombstone(
+                    user_id=owners[instance.conversation_id],
+                    conversation_id=instance.conversation_id,
+                    message_id=instance.id
+                ))
+        return self.bulk_create(rows)
+
+
+class Tombstone(models.Model):
+    """
+    A deleted conversation (message_id empty) or message, kept for delta sync
+    
+    Clients that synced before deleted_at learn about the deletion from
+    GET /api/chat/sync/. Rows older than CHAT_SYNC_TOMBSTONE_TTL are pruned
+    (manage.py prune_sync_tombstones); clients that last synced before that
+    are told to reload.
+    """
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    conversation_id = models.BigIntegerField()
+    message_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+    
+    objects = TombstoneQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['deleted_at']
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='chat_tomb_user_deleted_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.sender_type}: {self.message_text[:50]}..."
\ No newline at end of file
+        if self.message_id:
+            return f"Deleted message {self.message_id} of conversation {self.conversation_id}"
+        return f"Deleted conversation {self.conversation_id}"
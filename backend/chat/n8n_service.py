@@ -1,15 +1,238 @@
 import requests
+import httpx
+from requests.adapters import HTTPAdapter
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .circuit_breaker import N8NGuard
+from .history_cache import HistoryCache
+from .metrics import N8N_REJECTED, observe_n8n_call
+from .structured_logging import log_event
+import asyncio
+import json
 import logging
+import os
+import threading
+import time
+import weakref
 
 logger = logging.getLogger(__name__)
 
 
+class N8NConnectionPool:
+    """
+    Process-wide keep-alive HTTP clients for the N8N webhook
+    
+    One requests.Session (sync views) and one httpx.AsyncClient per event
+    loop (async views) are reused across messages, so a chat turn skips the
+    DNS lookup, TCP connect and TLS handshake. Clients are dropped when the
+    process id changes, so gunicorn workers never share sockets with the
+    master they were forked from.
+    """
+    
+    _lock = threading.Lock()
+    _pid = None
+    _session = None
+    _session_last_used = 0.0
+    _async_clients = weakref.WeakKeyDictionary()
+    
+    @staticmethod
+    def timeout():
+        """Return (connect, read) timeouts from settings"""
+        return (settings.N8N_CONNECT_TIMEOUT, settings.N8N_READ_TIMEOUT)
+    
+    @classmethod
+    def _check_pid(cls):
+        """Forget clients inherited from a parent process"""
+        pid = os.getpid()
+        if cls._pid != pid:
+            cls._pid = pid
+            cls._session = None
+            cls._async_clients = weakref.WeakKeyDictionary()
+    
+    @classmethod
+    def get_session(cls):
+        """Return the shared requests.Session, creating it on first use"""
+        with cls._lock:
+            cls._check_pid()
+            now = time.monotonic()
+            
+            # urllib3 has no idle expiry, so recycle a session left idle too long.
+            # Closing it is safe only once no request can still be reading from
+            # it, so the idle time is at least a full connect plus read timeout
+            # even when N8N_KEEPALIVE_EXPIRY is shorter
+            idle_limit = max(settings.N8N_KEEPALIVE_EXPIRY, sum(cls.timeout()))
+            if cls._session is not None and now - cls._session_last_used > idle_limit:
+                cls._session.close()
+                cls._session = None
+            
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=settings.N8N_POOL_CONNECTIONS,
+                    pool_maxsize=settings.N8N_POOL_MAXSIZE
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                cls._session = session
+            
+            cls._session_last_used = now
+            return cls._session
+    
+    @classmethod
+    def get_async_client(cls):
+        """Return the shared httpx.AsyncClient for the running event loop"""
+        loop = asyncio.get_running_loop()
+        with cls._lock:
+            cls._check_pid()
+            client = cls._async_clients.get(loop)
+            if client is None or client.is_closed:
+                connect_timeout, read_timeout = cls.timeout()
+                client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                    limits=httpx.Limits(
+                        max_connections=settings.N8N_POOL_MAXSIZE,
+                        max_keepalive_connections=settings.N8N_POOL_MAXSIZE,
+                        keepalive_expiry=settings.N8N_KEEPALIVE_EXPIRY
+                    )
+                )
+                cls._async_clients[loop] = client
+            return client
+    
+    @classmethod
+    def _after_fork(cls):
+        """Start the child with a fresh lock and no inherited clients"""
+        cls._lock = threading.Lock()
+        cls._check_pid()
+    
+    @classmethod
+    def reset(cls):
+        """Drop all pooled clients (used after fork and in tests)"""
+        with cls._lock:
+            if cls._session is not None and cls._pid == os.getpid():
+                cls._session.close()
+            cls._pid = None
+            cls._session = None
+            cls._async_clients = weakref.WeakKeyDictionary()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=N8NConnectionPool._after_fork)
+
+
 class N8NService:
     """Service to communicate with N8N webhook"""
     
+    TIMEOUT_RESPONSE = 'I apologize, the response is taking too long. Please try again.'
+    CONNECTION_RESPONSE = 'I apologize, but I am having trouble connecting right now. Please try again in a moment.'
+    UNEXPECTED_RESPONSE = 'I apologize, but something went wrong. Please try again.'
+    FALLBACK_RESPONSE = "I apologize, but I couldn't process that properly."
+    
+    @staticmethod
+    def build_payload(user_id, conversation_id, current_message, conversation_history, conversation_summary=''):
+        """Build the JSON body sent to the N8N webhook"""
+        return {
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "current_message": current_message,
+            "conversation_history": conversation_history,
+            "conversation_summary": conversation_summary
+        }
+    
+    @staticmethod
+    def parse_n8n_response(data):
+        """
+        Extract the bot response from parsed N8N JSON
+        
+        Args:
+            data: Parsed JSON body returned by the webhook
+        
+        Returns:
+            dict: success flag, bot_response, metadata and outcome
+        """
+        
+        # Handle different response formats
+        bot_response = None
+        metadata = {}
+        
+        # Case 1: Direct object with bot_response
+        if isinstance(data, dict) and 'bot_response' in data:
+            bot_response = data['bot_response']
+            metadata = data.get('metadata', {})
+        
+        # Case 2: Array with first item containing bot_response
+        elif isinstance(data, list) and len(data) > 0:
+            if isinstance(data[0], dict) and 'bot_response' in data[0]:
+                bot_response = data[0]['bot_response']
+                metadata = data[0].get('metadata', {})
+        
+        # Case 3: Nested in 'json' key
+        elif isinstance(data, dict) and 'json' in data:
+            if 'bot_response' in data['json']:
+                bot_response = data['json']['bot_response']
+                metadata = data['json'].get('metadata', {})
+        
+        # Fallback
+        outcome = 'success'
+        if not bot_response:
+            log_event(
+                logger, logging.ERROR, 'n8n.unparsed_response',
+                response_type=type(data).__name__,
+                response_keys=lambda: sorted(data.keys())[:20] if isinstance(data, dict) else None
+            )
+            bot_response = N8NService.FALLBACK_RESPONSE
+            outcome = 'fallback_parse'
+        
+        return {
+            'success': True,
+            'bot_response': bot_response,
+            'metadata': metadata,
+            'outcome': outcome
+        }
+    
+    @staticmethod
+    def error_response(bot_response, error, outcome='request_error'):
+        """Build the apology response returned when N8N cannot be reached"""
+        return {
+            'success': False,
+            'bot_response': bot_response,
+            'metadata': {'error': error},
+            'outcome': outcome
+        }
+    
+    @staticmethod
+    def record_call(mode, payload, result, latency):
+        """Log and measure one N8N call (the message text is never logged)"""
+        payload_bytes = len(json.dumps(payload, cls=DjangoJSONEncoder))
+        observe_n8n_call(mode, result.get('outcome'), latency, payload_bytes)
+        log_event(
+            logger, logging.WARNING if not result['success'] else logging.INFO, 'n8n.call',
+            mode=mode,
+            conversation_id=payload['conversation_id'],
+            outcome=result.get('outcome'),
+            latency_ms=round(latency * 1000, 1),
+            payload_bytes=payload_bytes,
+            history_messages=len(payload['conversation_history']),
+            reply_chars=len(result['bot_response']),
+            error=result['metadata'].get('error') if not result['success'] else None
+        )
+    
+    @staticmethod
+    def admit():
+        """
+        Ask the circuit breaker and concurrency limiter for a slot
+        
+        Returns:
+            dict: None if the call may proceed, otherwise the apology response
+        """
+        reason = N8NGuard.admit()
+        if reason is None:
+            return None
+        N8N_REJECTED.labels(reason).inc()
+        log_event(logger, logging.WARNING, 'n8n.rejected', reason=reason)
+        return N8NService.error_response(N8NService.CONNECTION_RESPONSE, reason, outcome=reason)
+    
     @staticmethod
-    def send_message_to_n8n(user_id, conversation_id, current_message, conversation_history):
+    def send_message_to_n8n(user_id, conversation_id, current_message, conversation_history, conversation_summary=''):
         """
         Send message and conversation history to N8N
         
@@ -18,94 +241,270 @@ class N8NService:
             conversation_id: ID of the conversation
             current_message: The new message from user
             conversation_history: List of previous messages
-            
+            conversation_summary: Rolling summary of older turns
+        
         Returns:
             dict: Response from N8N with bot message
         """
         
-        payload = {
-            "user_id": user_id,
-            "conversation_id": conversation_id,
-            "current_message": current_message,
-            "conversation_history": conversation_history
-        }
+        payload = N8NService.build_payload(
+            user_id, conversation_id, current_message, conversation_history, conversation_summary
+        )
         
-        logger.info(f"Sending to N8N: {settings.N8N_WEBHOOK_URL}")
-        logger.info(f"Payload: {payload}")
+        # Shed load fast while N8N is degraded
+        rejection = N8NService.admit()
+        if rejection:
+            return rejection
+        
+        started = time.monotonic()
+        result = N8NService._post(payload)
+        latency = time.monotonic() - started
+        N8NGuard.record(latency, result['success'])
+        N8NService.record_call('sync', payload, result, latency)
+        return result
+    
+    @staticmethod
+    def _post(payload):
+        """POST the payload with the pooled session and parse the reply"""
         
         try:
-            response = requests.post(
+            response = N8NConnectionPool.get_session().post(
                 settings.N8N_WEBHOOK_URL,
                 json=payload,
-                timeout=30
+                timeout=N8NConnectionPool.timeout()
             )
             
-            logger.info(f"N8N Status Code: {response.status_code}")
-            logger.info(f"N8N Response Text: {response.text}")
+            log_event(
+                logger, logging.DEBUG, 'n8n.response',
+                conversation_id=payload['conversation_id'],
+                status_code=response.status_code,
+                response_bytes=len(response.content),
+                response_text=lambda: response.text
+            )
             
             response.raise_for_status()
             
             # Parse response
             data = response.json()
-            logger.info(f"N8N Parsed Data: {data}")
             
-            # Handle different response formats
-            bot_response = None
-            metadata = {}
+            return N8NService.parse_n8n_response(data)
+        
+        except requests.exceptions.Timeout:
+            return N8NService.error_response(N8NService.TIMEOUT_RESPONSE, 'timeout', outcome='timeout')
+        
+        except requests.exceptions.RequestException as e:
+            return N8NService.error_response(N8NService.CONNECTION_RESPONSE, str(e))
+        
+        except Exception as e:
+            log_event(logger, logging.ERROR, 'n8n.unexpected_error', exc_info=True,
+                      conversation_id=payload['conversation_id'], error=str(e))
+            return N8NService.error_response(N8NService.UNEXPECTED_RESPONSE, str(e), outcome='unexpected_error')
+    
+    @staticmethod
+    async def async_send_message_to_n8n(user_id, conversation_id, current_message, conversation_history, conversation_summary=''):
+        """
+        Async variant of send_message_to_n8n built on httpx
+        
+        Awaiting the webhook yields the event loop, so a single ASGI worker
+        can hold many LLM round trips open at once.
+        
+        Returns:
+            dict: Response from N8N with bot message
+        """
+        
+        payload = N8NService.build_payload(
+            user_id, conversation_id, current_message, conversation_history, conversation_summary
+        )
+        
+        # Shed load fast while N8N is degraded
+        rejection = N8NService.admit()
+        if rejection:
+            return rejection
+        
+        started = time.monotonic()
+        result = await N8NService._apost(payload)
+        latency = time.monotonic() - started
+        N8NGuard.record(latency, result['success'])
+        N8NService.record_call('async', payload, result, latency)
+        return result
+    
+    @staticmethod
+    async def _apost(payload):
+        """POST the payload with the pooled async client and parse the reply"""
+        
+        try:
+            client = N8NConnectionPool.get_async_client()
+            response = await client.post(
+                settings.N8N_WEBHOOK_URL,
+                json=payload
+            )
             
-            # Case 1: Direct object with bot_response
-            if isinstance(data, dict) and 'bot_response' in data:
-                bot_response = data['bot_response']
-                metadata = data.get('metadata', {})
+            log_event(
+                logger, logging.DEBUG, 'n8n.response',
+                conversation_id=payload['conversation_id'],
+                status_code=response.status_code,
+                response_bytes=len(response.content),
+                response_text=lambda: response.text
+            )
             
-            # Case 2: Array with first item containing bot_response
-            elif isinstance(data, list) and len(data) > 0:
-                if isinstance(data[0], dict) and 'bot_response' in data[0]:
-                    bot_response = data[0]['bot_response']
-                    metadata = data[0].get('metadata', {})
+            response.raise_for_status()
             
-            # Case 3: Nested in 'json' key
-            elif isinstance(data, dict) and 'json' in data:
-                if 'bot_response' in data['json']:
-                    bot_response = data['json']['bot_response']
-                    metadata = data['json'].get('metadata', {})
+            # Parse response
+            data = response.json()
             
-            # Fallback
+            return N8NService.parse_n8n_response(data)
+        
+        except httpx.TimeoutException:
+            return N8NService.error_response(N8NService.TIMEOUT_RESPONSE, 'timeout', outcome='timeout')
+        
+        except httpx.HTTPError as e:
+            return N8NService.error_response(N8NService.CONNECTION_RESPONSE, str(e))
+        
+        except Exception as e:
+            log_event(logger, logging.ERROR, 'n8n.unexpected_error', exc_info=True,
+                      conversation_id=payload['conversation_id'], error=str(e))
+            return N8NService.error_response(N8NService.UNEXPECTED_RESPONSE, str(e), outcome='unexpected_error')
+    
+    @staticmethod
+    def parse_stream_line(line):
+        """
+        Extract the text carried by one line of a streamed N8N response
+        
+        Accepts N8N's streaming items ({"type": "item", "content": ...}),
+        SSE "data:" lines, the regular bot_response shapes and plain text.
+        
+        Returns:
+            str: Text to append to the bot reply ('' for control lines)
+        """
+        
+        line = line.strip()
+        if line.startswith('data:'):
+            line = line[5:].strip()
+        if not line or line == '[DONE]':
+            return ''
+        
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return line
+        
+        if isinstance(data, dict):
+            if data.get('type') in ('begin', 'end', 'error'):
+                return ''
+            if 'content' in data:
+                return data.get('content') or ''
+            if 'text' in data:
+                return data.get('text') or ''
+        
+        if isinstance(data, str):
+            return data
+        
+        parsed = N8NService.parse_n8n_response(data)
+        return parsed['bot_response']
+    
+    @staticmethod
+    async def async_stream_message_to_n8n(user_id, conversation_id, current_message, conversation_history, conversation_summary=''):
+        """
+        Send message to N8N and yield the bot reply as it arrives
+        
+        Yields:
+            dict: {'type': 'delta', 'text': ...} for each chunk, then a final
+            {'type': 'done', 'result': ...} with the same shape returned by
+            send_message_to_n8n
+        """
+        
+        payload = N8NService.build_payload(
+            user_id, conversation_id, current_message, conversation_history, conversation_summary
+        )
+        
+        # Shed load fast while N8N is degraded
+        rejection = N8NService.admit()
+        if rejection:
+            yield {'type': 'delta', 'text': rejection['bot_response']}
+            yield {'type': 'done', 'result': rejection}
+            return
+        
+        started = time.monotonic()
+        first_byte = None
+        result = None
+        try:
+            async for chunk in N8NService._astream(payload):
+                if chunk['type'] == 'delta' and first_byte is None:
+                    first_byte = time.monotonic() - started
+                if chunk['type'] == 'done':
+                    result = chunk['result']
+                yield chunk
+        finally:
+            latency = time.monotonic() - started
+            # Judge N8N by its time to first byte: a long answer streams for as
+            # long as it needs. A client disconnect is not an N8N failure
+            N8NGuard.record(latency if first_byte is None else first_byte, result['success'] if result else True)
+            if result:
+                N8NService.record_call('stream', payload, result, latency)
+    
+    @staticmethod
+    async def _astream(payload):
+        """POST the payload and yield delta chunks followed by a done chunk"""
+        
+        chunks = []
+        
+        try:
+            client = N8NConnectionPool.get_async_client()
+            async with client.stream('POST', settings.N8N_WEBHOOK_URL, json=payload) as response:
+                response.raise_for_status()
+                
+                content_type = response.headers.get('content-type', '')
+                
+                # Non-streaming webhook: relay the whole reply as one chunk
+                if 'application/json' in content_type:
+                    data = json.loads(await response.aread())
+                    result = N8NService.parse_n8n_response(data)
+                    yield {'type': 'delta', 'text': result['bot_response']}
+                    yield {'type': 'done', 'result': result}
+                    return
+                
+                async for line in response.aiter_lines():
+                    text = N8NService.parse_stream_line(line)
+                    if text:
+                        chunks.append(text)
+                        yield {'type': 'delta', 'text': text}
+            
+            bot_response = ''.join(chunks)
+            outcome = 'success'
             if not bot_response:
-                logger.error(f"Could not extract bot_response from: {data}")
-                bot_response = "I apologize, but I couldn't process that properly."
+                log_event(logger, logging.ERROR, 'n8n.empty_stream', conversation_id=payload['conversation_id'])
+                bot_response = N8NService.FALLBACK_RESPONSE
+                outcome = 'fallback_parse'
+                yield {'type': 'delta', 'text': bot_response}
             
-            return {
+            yield {'type': 'done', 'result': {
                 'success': True,
                 'bot_response': bot_response,
-                'metadata': metadata
-            }
-            
-        except requests.exceptions.Timeout:
-            logger.error(f"N8N timeout")
-            return {
-                'success': False,
-                'bot_response': 'I apologize, the response is taking too long. Please try again.',
-                'metadata': {'error': 'timeout'}
-            }
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"N8N request failed: {str(e)}")
-            return {
-                'success': False,
-                'bot_response': 'I apologize, but I am having trouble connecting right now. Please try again in a moment.',
-                'metadata': {'error': str(e)}
-            }
-            
+                'metadata': {'streamed': True},
+                'outcome': outcome
+            }}
+        
+        except httpx.TimeoutException:
+            result = N8NService.error_response(N8NService.TIMEOUT_RESPONSE, 'timeout', outcome='timeout')
+        
+        except httpx.HTTPError as e:
+            result = N8NService.error_response(N8NService.CONNECTION_RESPONSE, str(e))
+        
         except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            return {
-                'success': False,
-                'bot_response': 'I apologize, but something went wrong. Please try again.',
-                'metadata': {'error': str(e)}
-            }
+            log_event(logger, logging.ERROR, 'n8n.unexpected_error', exc_info=True,
+                      conversation_id=payload['conversation_id'], error=str(e))
+            result = N8NService.error_response(N8NService.UNEXPECTED_RESPONSE, str(e), outcome='unexpected_error')
+        
+        else:
+            return
+        
+        # Keep whatever was already streamed, otherwise send the apology
+        if chunks:
+            result['bot_response'] = ''.join(chunks)
+            result['metadata']['partial'] = True
+        else:
+            yield {'type': 'delta', 'text': result['bot_response']}
+        yield {'type': 'done', 'result': result}
     
     @staticmethod
     def format_conversation_history(messages, limit=10):
@@ -115,7 +514,7 @@ class N8NService:
         Args:
             messages: QuerySet of Message objects
             limit: Maximum number of messages to include
-            
+        
         Returns:
             list: Formatted conversation history
         """
@@ -127,10 +526,6 @@ class N8NService:
         message_list.reverse()
         
         for message in message_list:
-            history.append({
-                'sender': message.sender_type,
-                'text': message.message_text,
-                'timestamp': message.created_at.isoformat()
-            })
+            history.append(HistoryCache.format_message(message))
         
         return history
\ No newline at end of file
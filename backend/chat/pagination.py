@@ -0,0 +1,83 @@
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class MessageCursorPagination(CursorPagination):
+    """
+    Keyset pagination for messages, newest first
+    
+    The first page holds the latest messages; follow `next` to load older
+    ones. The (created_at, id) ordering keeps each page an indexed range scan
+    no matter how long the conversation is.
+    """
+    
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
+
+
+class ConversationCursorPagination(CursorPagination):
+    """Keyset pagination for the conversation list, most recently updated first"""
+    
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-updated_at', '-id')
+
+
+class SearchPagination(BasePagination):
+    """
+    Page numbers for ranked search results
+    
+    Ranked results have no stable keyset, so pages are offsets; one extra
+    row is fetched to tell whether a next page exists without a COUNT.
+    """
+    
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    
+    def _positive_int(self, name, default, maximum=None):
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except (TypeError, ValueError):
+            value = default
+        value = max(value, 1)
+        return min(value, maximum) if maximum else value
+    
+    def paginate_search(self, search, request):
+        """
+        Run `search(limit, offset)` for the requested page
+        
+        Returns:
+            list: The rows of the page
+        """
+        self.request = request
+        self.page = self._positive_int('page', 1)
+        self.size = self._positive_int(self.page_size_query_param, self.page_size, self.max_page_size)
+        
+        rows = search(limit=self.size + 1, offset=(self.page - 1) * self.size)
+        self.has_next = len(rows) > self.size
+        return rows[:self.size]
+    
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), 'page', self.page + 1)
+    
+    def get_previous_link(self):
+        if self.page == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page == 2:
+            return remove_query_param(url, 'page')
+        return replace_query_param(url, 'page', self.page - 1)
+    
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
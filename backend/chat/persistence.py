@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, F, Q, TextField, Value, When
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from .history_cache import HistoryCache
+from .models import Conversation, Message
+from .realtime import RealtimeEvents
+
+
+class TurnWriter:
+    """
+    Persist the messages of a turn together with the conversation touch
+    
+    A turn is written in one short transaction: the user and bot messages
+    in a single batched INSERT, and the conversation's message summary,
+    updated_at and rolling summary (set on the instance by
+    HistoryWindow.build) in one UPDATE, so
+    the sidebar order stays correct and the SQLite write lock is held only
+    for those two statements. Nothing is written while N8N is called.
+    """
+    
+    @staticmethod
+    def _touch(conversation, messages):
+        """
+        Record the new messages, bump updated_at and store the rolling summary in one UPDATE
+        
+        The summary only moves forward: a concurrent turn that already folded
+        later messages keeps its summary.
+        """
+        conversation.updated_at = timezone.now()
+        fields = {'updated_at': conversation.updated_at}
+        
+        through_id = conversation.summary_through_message_id
+        if through_id:
+            newer = Q(summary_through_message_id__isnull=True) | Q(summary_through_message_id__lt=through_id)
+            fields['history_summary'] = Case(
+                When(newer, then=Value(conversation.history_summary, output_field=TextField())),
+                default=F('history_summary')
+            )
+            fields['summary_through_message_id'] = Case(
+                When(newer, then=Value(through_id, output_field=BigIntegerField())),
+                default=F('summary_through_message_id')
+            )
+        
+        Conversation.objects.filter(pk=conversation.pk).record_new_messages(messages, **fields)
+    
+    @staticmethod
+    def _insert(conversation, messages):
+        # bulk_create sends no post_save, so feed the history cache and push the events here
+        Message.objects.bulk_create(messages, sync_summary=False)
+        TurnWriter._touch(conversation, messages)
+        transaction.on_commit(lambda: [HistoryCache.append(message) for message in messages])
+        RealtimeEvents.messages_created(conversation.id, messages)
+        return messages
+    
+    @staticmethod
+    def bot_message(conversation, n8n_response):
+        return Message(
+            conversation=conversation,
+            sender_type='bot',
+            message_text=n8n_response['bot_response'],
+            n8n_metadata=n8n_response.get('metadata', {})
+        )
+    
+    @staticmethod
+    def save_turn(conversation, message_text, n8n_response):
+        """
+        Save a user message and the bot reply to it
+        
+        Args:
+            conversation: Conversation the turn belongs to
+            message_text: What the user sent
+            n8n_response: Result of an N8NService send
+        
+        Returns:
+            tuple: (user_message, bot_message)
+        """
+        user_message = Message(conversation=conversation, sender_type='user', message_text=message_text)
+        bot_message = TurnWriter.bot_message(conversation, n8n_response)
+        with transaction.atomic():
+            TurnWriter._insert(conversation, [user_message, bot_message])
+        return user_message, bot_message
+    
+    @staticmethod
+    def save_user_message(conversation, message_text):
+        """Save a user message whose reply comes later (queued sends); call inside atomic()"""
+        user_message = Message(conversation=conversation, sender_type='user', message_text=message_text)
+        TurnWriter._insert(conversation, [user_message])
+        return user_message
+    
+    @staticmethod
+    def save_bot_message(conversation, n8n_response):
+        """Save a bot reply to an already saved user message; call inside atomic()"""
+        bot_message = TurnWriter.bot_message(conversation, n8n_response)
+        TurnWriter._insert(conversation, [bot_message])
+        return bot_message
+    
+    @staticmethod
+    async def asave_turn(conversation, message_text, n8n_response):
+        """Async wrapper around save_turn"""
+        return await sync_to_async(TurnWriter.save_turn)(conversation, message_text, n8n_response)
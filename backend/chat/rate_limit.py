@@ -0,0 +1,255 @@
+from asgiref.sync import sync_to_async
+from collections import OrderedDict
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+from .metrics import RATE_LIMITED
+import hashlib
+import math
+import threading
+import time
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Parse '<requests>/<period>' (period s, min, hour or day, as in DRF)
+    
+    Returns:
+        tuple: (capacity, tokens refilled per second)
+    """
+    count, period = rate.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+class LocalBucketStore:
+    """
+    Token buckets in process memory (one worker, or a per-worker limit)
+    
+    A check is a dict lookup and some arithmetic under a lock, a few
+    microseconds. Buckets are kept least recently used first: those at the
+    front that have refilled (the same as no bucket) are dropped on every
+    check, and beyond RATE_LIMIT_LOCAL_MAX_KEYS the oldest go regardless,
+    so memory stays bounded and pruning costs O(1) per check on average.
+    """
+    
+    def __init__(self):
+        self._buckets = OrderedDict()  # key: (tokens, updated, full_at)
+        self._lock = threading.Lock()
+    
+    def take(self, buckets):
+        """
+        Take one token from every bucket, or from none if any is empty
+        
+        Args:
+            buckets: list of (key, capacity, rate per second)
+        
+        Returns:
+            float: None if allowed, otherwise seconds until it would be
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, capacity, rate in buckets:
+                tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                levels.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            if wait:
+                return wait
+            
+            for (key, capacity, rate), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - 1, now, now + (capacity - tokens + 1) / rate)
+                self._buckets.move_to_end(key)
+            self._prune(now)
+        return None
+    
+    def _prune(self, now):
+        # Each check adds at most a few keys, so this pops a few on average
+        while self._buckets:
+            key, (_, _, full_at) = next(iter(self._buckets.items()))
+            if full_at > now and len(self._buckets) <= settings.RATE_LIMIT_LOCAL_MAX_KEYS:
+                break
+            del self._buckets[key]
+    
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketStore:
+    """
+    Token buckets in Redis, shared by every worker
+    
+    All buckets of a check are read and updated by one Lua script, so a
+    check is a single atomic round trip and uses the Redis clock.
+    """
+    
+    SCRIPT = """
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local levels = {}
+    local wait = 0
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2 - 1])
+        local rate = tonumber(ARGV[i * 2])
+        local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        levels[i] = tokens
+        if tokens < 1 then
+            wait = math.max(wait, (1 - tokens) / rate)
+        end
+    end
+    if wait > 0 then
+        return tostring(wait)
+    end
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2 - 1])
+        local rate = tonumber(ARGV[i * 2])
+        redis.call('HSET', key, 'tokens', levels[i] - 1, 'updated', now)
+        redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+    end
+    return false
+    """
+    
+    def __init__(self):
+        import redis
+        self._client = redis.Redis.from_url(settings.REDIS_URL)
+        self._script = self._client.register_script(self.SCRIPT)
+    
+    def take(self, buckets):
+        """Same contract as LocalBucketStore.take"""
+        keys = [f"ratelimit:{key}" for key, _, _ in buckets]
+        args = [value for _, capacity, rate in buckets for value in (capacity, rate)]
+        wait = self._script(keys=keys, args=args)
+        return float(wait) if wait else None
+    
+    def clear(self):
+        for key in self._client.scan_iter('ratelimit:*'):
+            self._client.delete(key)
+
+
+class RateLimiter:
+    """
+    Token-bucket limits per user, per client IP, per submitted email and
+    global (RATE_LIMITS)
+    
+    Each scope (send, login, register) has its own buckets. A request
+    takes a token from all of its buckets at once and is refused when any
+    bucket is empty, without using up the others.
+    """
+    
+    _lock = threading.Lock()
+    _store = None
+    
+    @classmethod
+    def store(cls):
+        with cls._lock:
+            if cls._store is None:
+                cls._store = RedisBucketStore() if settings.RATE_LIMIT_STORE == 'redis' else LocalBucketStore()
+            return cls._store
+    
+    @classmethod
+    def reset(cls):
+        """Empty every bucket (tests, or after changing RATE_LIMITS)"""
+        cls.store().clear()
+    
+    @classmethod
+    def check(cls, scope, user_id=None, ip=None, email=None):
+        """
+        Take a token for a request in `scope`
+        
+        Args:
+            email: Email address the request acts on (login), hashed for the key
+        
+        Returns:
+            float: None if allowed, otherwise seconds to wait before retrying
+        """
+        if not settings.RATE_LIMIT_ENABLED:
+            return None
+        
+        if email:
+            email = hashlib.sha256(email.strip().lower().encode()).hexdigest()
+        identities = {'user': user_id, 'ip': ip, 'email': email or None, 'global': 'all'}
+        buckets = []
+        for kind, rate in settings.RATE_LIMITS.get(scope, {}).items():
+            if identities.get(kind) is None:
+                continue
+            capacity, refill = parse_rate(rate)
+            buckets.append((f"{scope}:{kind}:{identities[kind]}", capacity, refill))
+        if not buckets:
+            return None
+        
+        wait = cls.store().take(buckets)
+        if wait is not None:
+            RATE_LIMITED.labels(scope=scope).inc()
+        return wait
+    
+    @classmethod
+    async def acheck(cls, scope, user_id=None, ip=None, email=None):
+        """
+        check() for async views
+        
+        The Redis store's round trip runs in a worker thread instead of
+        blocking the event loop; the in-process store answers in
+        microseconds, so it is checked in place.
+        """
+        if settings.RATE_LIMIT_ENABLED and isinstance(cls.store(), RedisBucketStore):
+            return await sync_to_async(cls.check, thread_sensitive=False)(scope, user_id, ip, email)
+        return cls.check(scope, user_id=user_id, ip=ip, email=email)
+    
+    @staticmethod
+    def retry_after(wait):
+        """Retry-After header value for a wait in seconds"""
+        return str(max(1, math.ceil(wait)))
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle backed by RateLimiter; set `scope` in a subclass
+    
+    The client IP comes from get_ident, which trusts the last NUM_PROXIES
+    (REST_FRAMEWORK setting) entries of X-Forwarded-For.
+    """
+    
+    scope = None
+    
+    def identities(self, request):
+        """Keyword arguments for RateLimiter.check"""
+        user = getattr(request, 'user', None)
+        return {
+            'user_id': user.pk if user is not None and user.is_authenticated else None,
+            'ip': self.get_ident(request),
+        }
+    
+    def allow_request(self, request, view):
+        self.retry_wait = RateLimiter.check(self.scope, **self.identities(request))
+        return self.retry_wait is None
+    
+    def wait(self):
+        return self.retry_wait
+
+
+class SendRateThrottle(TokenBucketThrottle):
+    scope = 'send'
+
+
+class LoginRateThrottle(TokenBucketThrottle):
+    """Also limits attempts on one email address, whichever IPs they come from"""
+    
+    scope = 'login'
+    
+    def identities(self, request):
+        identities = super().identities(request)
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        identities['email'] = email if isinstance(email, str) else None
+        return identities
+
+
+class RegisterRateThrottle(TokenBucketThrottle):
+    scope = 'register'
@@ -0,0 +1,155 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+from .metrics import REALTIME_SUBSCRIBERS
+from .models import Conversation
+from .serializers import ConversationSerializer, MessageSerializer
+import asyncio
+import functools
+import json
+import threading
+
+
+class Subscription:
+    """One open event stream: a bounded queue owned by the stream's event loop"""
+    
+    def __init__(self, user_id, queue_size):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+    
+    def deliver(self, frame):
+        """Queue a frame (runs on self.loop); a client that fell behind is closed"""
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Drop the backlog and end the stream; the client reconnects and refetches
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+    
+    async def get(self):
+        """Next encoded frame, or None when the stream must end"""
+        return await self.queue.get()
+
+
+class LocalEventHub:
+    """
+    In-process fan-out of realtime events to the open streams of each user
+    
+    Events reach only clients connected to the same process, which covers a
+    single ASGI worker. With several gunicorn workers a client sees only the
+    changes handled by the worker holding its stream, and replies saved by
+    run_reply_worker reach nobody; the client's sync on reconnect and when
+    the tab becomes visible catches up. To run several workers, implement the
+    same subscribe/unsubscribe/has_subscribers/publish methods on a broker
+    such as Redis pub/sub and point CHAT_REALTIME_HUB at it.
+    """
+    
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+    
+    def subscribe(self, user_id):
+        """Open a subscription for the current event loop"""
+        subscription = Subscription(user_id, settings.CHAT_REALTIME_QUEUE_SIZE)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        REALTIME_SUBSCRIBERS.inc()
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            if subscription not in subscriptions:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+        REALTIME_SUBSCRIBERS.dec()
+    
+    def has_subscribers(self, user_id=None):
+        """Whether the user (or, without a user, anyone) has a stream open"""
+        if user_id is None:
+            return bool(self._subscriptions)
+        return user_id in self._subscriptions
+    
+    def publish(self, user_id, frame):
+        """Hand an encoded frame to every stream of the user (safe from any thread)"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, frame)
+            except RuntimeError:
+                self.unsubscribe(subscription)  # Its event loop is gone
+
+
+class RealtimeEvents:
+    """
+    Conversation and message events pushed to the owner's open streams
+    
+    Events are published after the surrounding transaction commits, and
+    payloads are built (and encoded once) only when the user has a stream
+    open. Event names:
+        conversation.created, conversation.updated: the list item
+        conversation.deleted: {'id': ...}
+        message.created: {'message': ..., 'conversation': list item}
+            (a bot message is the reply being ready)
+    """
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def hub():
+        return import_string(settings.CHAT_REALTIME_HUB)()
+    
+    @staticmethod
+    def frame(event, data):
+        """Encode one Server-Sent Event frame"""
+        return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+    
+    @staticmethod
+    def publish(user_id, event, build_data):
+        """Publish `event` to the user after commit; build_data() returns the payload"""
+        
+        def send():
+            hub = RealtimeEvents.hub()
+            if hub.has_subscribers(user_id):
+                hub.publish(user_id, RealtimeEvents.frame(event, build_data()))
+        
+        if RealtimeEvents.hub().has_subscribers():
+            transaction.on_commit(send)
+    
+    @staticmethod
+    def conversation_saved(conversation, created):
+        RealtimeEvents.publish(
+            conversation.user_id,
+            'conversation.created' if created else 'conversation.updated',
+            lambda: ConversationSerializer(conversation).data
+        )
+    
+    @staticmethod
+    def conversation_deleted(conversation):
+        conversation_id = conversation.id
+        RealtimeEvents.publish(conversation.user_id, 'conversation.deleted', lambda: {'id': conversation_id})
+    
+    @staticmethod
+    def messages_created(conversation_id, messages):
+        """Publish message.created for each message, with the conversation as stored after commit"""
+        if not RealtimeEvents.hub().has_subscribers():
+            return
+        
+        def send():
+            conversation = Conversation.objects.filter(pk=conversation_id).first()
+            hub = RealtimeEvents.hub()
+            if conversation is None or not hub.has_subscribers(conversation.user_id):
+                return
+            summary = ConversationSerializer(conversation).data
+            for message in messages:
+                hub.publish(conversation.user_id, RealtimeEvents.frame('message.created', {
+                    'message': MessageSerializer(message).data,
+                    'conversation': summary,
+                }))
+        
+        transaction.on_commit(send)
@@ -0,0 +1,205 @@
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from .models import Message
+from .structured_logging import log_event
+import html
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Sentinels around matched terms; replaced by <mark> after the text is escaped
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+
+class MessageSearch:
+    """
+    Ranked full-text search over a user's messages
+    
+    SQLite uses the FTS5 table chat_message_fts and PostgreSQL a GIN index on
+    to_tsvector('english', message_text) (both created in migration 0006).
+    The FTS5 table is kept current by triggers and the GIN index by
+    PostgreSQL itself, so every insert, update and delete path is covered.
+    Other backends, and SQLite when the triggers are gone, fall back to an
+    unindexed icontains scan.
+    """
+    
+    CONFIG = 'english'
+    SNIPPET_WORDS = 12
+    
+    # Created by migration 0006; lost if a later migration remakes chat_message
+    SQLITE_TRIGGERS = ('chat_message_fts_insert', 'chat_message_fts_delete', 'chat_message_fts_update')
+    _sqlite_index_usable = None
+    
+    @staticmethod
+    def missing_sqlite_triggers():
+        """Names of the FTS5 triggers that are not in the database"""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'chat_message'")
+            present = {row[0] for row in cursor.fetchall()}
+        return [name for name in MessageSearch.SQLITE_TRIGGERS if name not in present]
+    
+    @classmethod
+    def sqlite_index_usable(cls):
+        """
+        Whether chat_message_fts is kept current, checked once per process
+        
+        Without the triggers the FTS5 table silently stops matching new or
+        edited messages, so search falls back to a scan and logs an error.
+        """
+        if cls._sqlite_index_usable is None:
+            missing = cls.missing_sqlite_triggers()
+            if missing:
+                log_event(logger, logging.ERROR, 'search.triggers_missing', triggers=missing)
+            cls._sqlite_index_usable = not missing
+        return cls._sqlite_index_usable
+    
+    @staticmethod
+    def fts5_query(text):
+        """
+        Turn free text into a safe FTS5 query
+        
+        Every word must match; the last one also matches as a prefix so
+        results appear while typing. Quotes keep FTS5 operators literal.
+        """
+        words = re.findall(r'\w+', text)
+        if not words:
+            return ''
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += '*'
+        return ' '.join(terms)
+    
+    @staticmethod
+    def highlight(snippet):
+        """HTML-escape a snippet and turn the match sentinels into <mark> tags"""
+        escaped = html.escape(snippet or '')
+        return escaped.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+    
+    @staticmethod
+    def search(user, text, conversation_id=None, limit=20, offset=0):
+        """
+        Find the user's messages matching `text`, best match first
+        
+        Args:
+            user: Owner of the conversations searched
+            text: Free-text query
+            conversation_id: Restrict to one conversation
+            limit: Page size
+            offset: Results to skip
+        
+        Returns:
+            list: dicts with message fields, conversation_title and a highlighted snippet
+        """
+        
+        if connection.vendor == 'sqlite' and MessageSearch.sqlite_index_usable():
+            rows = MessageSearch._search_sqlite(user, text, conversation_id, limit, offset)
+        elif connection.vendor == 'postgresql':
+            rows = MessageSearch._search_postgresql(user, text, conversation_id, limit, offset)
+        else:
+            rows = MessageSearch._search_fallback(user, text, conversation_id, limit, offset)
+        
+        return [
+            {
+                'id': row['id'],
+                'conversation': row['conversation_id'],
+                'conversation_title': row['conversation__title'],
+                'sender_type': row['sender_type'],
+                'created_at': row['created_at'],
+                'snippet': MessageSearch.highlight(row['snippet']),
+            }
+            for row in rows
+        ]
+    
+    @staticmethod
+    def _search_sqlite(user, text, conversation_id, limit, offset):
+        query = MessageSearch.fts5_query(text)
+        if not query:
+            return []
+        
+        sql = '''
+            SELECT m.id, m.conversation_id, c.title, m.sender_type, m.created_at,
+                   snippet(chat_message_fts, 0, %s, %s, '...', %s)
+            FROM chat_message_fts
+            JOIN chat_message m ON m.id = chat_message_fts.rowid
+            JOIN chat_conversation c ON c.id = m.conversation_id
+            WHERE chat_message_fts MATCH %s AND c.user_id = %s
+        '''
+        params = [_MARK_START, _MARK_END, MessageSearch.SNIPPET_WORDS, query, user.id]
+        if conversation_id is not None:
+            sql += ' AND m.conversation_id = %s'
+            params.append(conversation_id)
+        sql += ' ORDER BY bm25(chat_message_fts), m.id DESC LIMIT %s OFFSET %s'
+        params += [limit, offset]
+        
+        # Raw rows skip the field's converters; this one parses the text and makes it aware
+        to_datetime = connection.ops.convert_datetimefield_value
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [
+                {
+                    'id': row[0],
+                    'conversation_id': row[1],
+                    'conversation__title': row[2],
+                    'sender_type': row[3],
+                    'created_at': to_datetime(row[4], None, connection),
+                    'snippet': row[5],
+                }
+                for row in cursor.fetchall()
+            ]
+    
+    @staticmethod
+    def _search_postgresql(user, text, conversation_id, limit, offset):
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+        
+        # Must match the indexed expression exactly for the GIN index to be used
+        vector = SearchVector('message_text', config=MessageSearch.CONFIG)
+        query = SearchQuery(text, config=MessageSearch.CONFIG, search_type='websearch')
+        
+        messages = Message.objects.filter(conversation__user=user).annotate(
+            document=vector
+        ).filter(document=query)
+        if conversation_id is not None:
+            messages = messages.filter(conversation_id=conversation_id)
+        
+        return messages.annotate(
+            rank=SearchRank(vector, query),
+            snippet=SearchHeadline(
+                'message_text',
+                query,
+                config=MessageSearch.CONFIG,
+                start_sel=_MARK_START,
+                stop_sel=_MARK_END,
+                max_words=MessageSearch.SNIPPET_WORDS,
+                min_words=min(5, MessageSearch.SNIPPET_WORDS)
+            )
+        ).order_by('-rank', '-id').values(
+            'id', 'conversation_id', 'conversation__title', 'sender_type', 'created_at', 'snippet'
+        )[offset:offset + limit]
+    
+    @staticmethod
+    def _search_fallback(user, text, conversation_id, limit, offset):
+        messages = Message.objects.filter(conversation__user=user, message_text__icontains=text)
+        if conversation_id is not None:
+            messages = messages.filter(conversation_id=conversation_id)
+        rows = messages.order_by('-created_at', '-id').values(
+            'id', 'conversation_id', 'conversation__title', 'sender_type', 'created_at', 'message_text'
+        )[offset:offset + limit]
+        return [dict(row, snippet=row['message_text'][:200]) for row in rows]
+    
+    @staticmethod
+    def filter_queryset(queryset, text):
+        """Restrict a Message queryset to full-text matches (used by the admin search)"""
+        if connection.vendor == 'sqlite' and MessageSearch.sqlite_index_usable():
+            query = MessageSearch.fts5_query(text)
+            if not query:
+                return queryset.none()
+            return queryset.filter(id__in=RawSQL(
+                'SELECT rowid FROM chat_message_fts WHERE chat_message_fts MATCH %s', [query]
+            ))
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import SearchQuery, SearchVector
+            return queryset.annotate(
+                document=SearchVector('message_text', config=MessageSearch.CONFIG)
+            ).filter(document=SearchQuery(text, config=MessageSearch.CONFIG, search_type='websearch'))
+        return queryset.filter(message_text__icontains=text)
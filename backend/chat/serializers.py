@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Conversation, Message
+from .models import Conversation, Message, ReplyJob
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -17,39 +17,67 @@ class MessageSerializer(serializers.ModelSerializer):
 class ConversationSerializer(serializers.ModelSerializer):
     """Serializer for Conversation model"""
     
-    message_count = serializers.SerializerMethodField()
     last_message = serializers.SerializerMethodField()
     
     class Meta:
         model = Conversation
         fields = ('id', 'user', 'title', 'created_at', 'updated_at', 'is_archived', 'message_count', 'last_message')
-        read_only_fields = ('id', 'user', 'created_at', 'updated_at')
-    
-    def get_message_count(self, obj):
-        """Get total number of messages in conversation"""
-        return obj.messages.count()
+        read_only_fields = ('id', 'user', 'created_at', 'updated_at', 'message_count')
     
     def get_last_message(self, obj):
-        """Get the last message preview"""
-        last_message = obj.messages.last()
-        if last_message:
-            return {
-                'text': last_message.message_text[:100],
-                'sender': last_message.sender_type,
-                'timestamp': last_message.created_at
-            }
-        return None
+        """Get the last message preview (denormalized on the conversation)"""
+        if obj.last_message_at is None:
+            return None
+        return {
+            'text': obj.last_message_preview,
+            'sender': obj.last_sender_type,
+            'timestamp': obj.last_message_at
+        }
 
 
 class ConversationDetailSerializer(serializers.ModelSerializer):
-    """Detailed serializer with all messages"""
+    """Detailed serializer with the most recent messages"""
+    
+    # Older messages are loaded through the paginated messages endpoint
+    RECENT_MESSAGES_LIMIT = 50
     
-    messages = MessageSerializer(many=True, read_only=True)
+    messages = serializers.SerializerMethodField()
+    has_older_messages = serializers.SerializerMethodField()
     
     class Meta:
         model = Conversation
-        fields = ('id', 'user', 'title', 'created_at', 'updated_at', 'is_archived', 'messages')
+        fields = ('id', 'user', 'title', 'created_at', 'updated_at', 'is_archived', 'messages', 'has_older_messages')
         read_only_fields = ('id', 'user', 'created_at', 'updated_at')
+    
+    def _recent_messages(self, obj):
+        """Fetch one message more than the limit to know if older ones exist"""
+        if not hasattr(obj, '_recent_messages_cache'):
+            recent = list(
+                obj.messages.order_by('-created_at', '-id')[:self.RECENT_MESSAGES_LIMIT + 1]
+            )
+            obj._recent_messages_cache = recent
+        return obj._recent_messages_cache
+    
+    def get_messages(self, obj):
+        """Get the latest messages in chronological order"""
+        recent = self._recent_messages(obj)[:self.RECENT_MESSAGES_LIMIT]
+        recent.reverse()
+        return MessageSerializer(recent, many=True).data
+    
+    def get_has_older_messages(self, obj):
+        """Whether messages exist before the ones included"""
+        return len(self._recent_messages(obj)) > self.RECENT_MESSAGES_LIMIT
+
+
+class ReplyJobSerializer(serializers.ModelSerializer):
+    """Serializer for the status of a queued bot reply"""
+    
+    bot_message = MessageSerializer(read_only=True)
+    
+    class Meta:
+        model = ReplyJob
+        fields = ('id', 'conversation', 'user_message', 'status', 'attempts', 'bot_message', 'created_at', 'updated_at')
+        read_only_fields = fields
 
 
 class SendMessageSerializer(serializers.Serializer):
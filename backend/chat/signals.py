@@ -0,0 +1,68 @@
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from . import metrics
+from .history_cache import HistoryCache
+from .models import Conversation, Message, Tombstone
+from .realtime import RealtimeEvents
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, raw=False, **kwargs):
+    """Keep the cached history and conversation summary in step with new or edited messages"""
+    if raw:
+        return  # Fixture loading; run sync_conversation_summaries afterwards
+    
+    conversations = Conversation.objects.filter(pk=instance.conversation_id)
+    if created:
+        HistoryCache.append(instance)
+        conversations.record_new_messages([instance])
+        RealtimeEvents.messages_created(instance.conversation_id, [instance])
+    else:
+        HistoryCache.invalidate(instance.conversation_id)
+        conversations.refresh_summaries(updated_at=timezone.now())
+
+
+def _deleted_directly(origin, model):
+    """Whether a delete started from `model` itself rather than cascading from a parent"""
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin is None or origin_model is model
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, origin=None, **kwargs):
+    # Messages removed with their conversation or user need no summary or
+    # tombstone, and conversation_deleted invalidates the cache once for them
+    if not _deleted_directly(origin, Message):
+        return
+    
+    # Queryset deletes are handled once for all rows by MessageQuerySet.delete
+    if isinstance(origin, QuerySet):
+        return
+    
+    HistoryCache.invalidate(instance.conversation_id)
+    Conversation.objects.filter(pk=instance.conversation_id).refresh_summaries(updated_at=timezone.now())
+    Tombstone.objects.record([instance])
+
+
+@receiver(post_save, sender=Conversation)
+def conversation_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        RealtimeEvents.conversation_saved(instance, created)
+
+
+@receiver(post_delete, sender=Conversation)
+def conversation_deleted(sender, instance, origin=None, **kwargs):
+    HistoryCache.invalidate(instance.id)
+    RealtimeEvents.conversation_deleted(instance)
+    if _deleted_directly(origin, Conversation):
+        Tombstone.objects.record([instance])  # Not when the user goes too
+
+
+@receiver(connection_created)
+def count_connection_queries(sender, connection, **kwargs):
+    """Count every query per request for the view metrics"""
+    if metrics.count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.count_queries)
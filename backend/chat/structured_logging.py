@@ -0,0 +1,69 @@
+from django.conf import settings
+import hashlib
+import json
+import logging
+import random
+
+# Fields that may hold what users or the bot said; never logged verbatim
+REDACTED_FIELDS = ('message_text', 'current_message', 'bot_response', 'response_text')
+
+
+class JsonFormatter(logging.Formatter):
+    """Render log records as one JSON object per line"""
+    
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': getattr(record, 'event', None) or record.getMessage(),
+        }
+        data.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def redact(text):
+    """Replace text with its size and a short fingerprint"""
+    if text is None:
+        return None
+    text = str(text)
+    return {
+        'chars': len(text),
+        'sha256': hashlib.sha256(text.encode()).hexdigest()[:12],
+    }
+
+
+def log_event(logger, level, event, exc_info=False, **fields):
+    """
+    Log a structured event cheaply
+    
+    Nothing is formatted unless the level is enabled and the event survives
+    sampling (CHAT_LOG_SAMPLE_RATES). Callable field values are evaluated
+    only then. Message text fields are redacted and other strings are capped
+    at CHAT_LOG_MAX_FIELD_CHARS.
+    """
+    
+    if not logger.isEnabledFor(level):
+        return
+    
+    rate = settings.CHAT_LOG_SAMPLE_RATES.get(event, 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        return
+    
+    max_chars = settings.CHAT_LOG_MAX_FIELD_CHARS
+    clean = {}
+    for name, value in fields.items():
+        if callable(value):
+            value = value()
+        if name in REDACTED_FIELDS:
+            value = redact(value)
+        elif isinstance(value, str) and len(value) > max_chars:
+            value = value[:max_chars] + '...'
+        clean[name] = value
+    
+    if rate < 1.0:
+        clean['sample_rate'] = rate
+    
+    logger.log(level, event, extra={'event': event, 'fields': clean}, exc_info=exc_info)
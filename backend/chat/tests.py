@@ -1,3 +1,1233 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from accounts.models import User
+from .benchmark import RESPONSE_SHAPES, FakeN8NServer, percentile
+from .circuit_breaker import CircuitBreaker, N8NGuard
+from .history_cache import HistoryCache
+from .history_window import HistoryWindow
+from .idempotency import SendDeduplicator
+from .jobs import ReplyJobQueue
+from .models import Conversation, Message, ReplyJob, Tombstone
+from .n8n_service import N8NConnectionPool, N8NService
+from .persistence import TurnWriter
+from .rate_limit import LocalBucketStore, RateLimiter, RedisBucketStore
+from .search import MessageSearch
+from .realtime import LocalEventHub, RealtimeEvents
+from .structured_logging import JsonFormatter
+from .views import _stream_bot_reply, realtime_events_view
+import asyncio
+import gc
+import json
+import os
+import threading
+import time
+import unittest
 
-# Create your tests here.
+
+class ChatTestCase(TestCase):
+    """
+    Shared fixtures: an empty cache, self.user signed in on self.client and
+    self.conversation titled `conversation_title` (None to skip it)
+    """
+    
+    conversation_title = 'Chat'
+    
+    def setUp(self):
+        cache.clear()
+        self.user = self.make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        if self.conversation_title is not None:
+            self.conversation = Conversation.objects.create(user=self.user, title=self.conversation_title)
+    
+    @staticmethod
+    def make_user(email='user@example.com'):
+        return User.objects.create_user(email=email, password='pass12345')
+    
+    @staticmethod
+    def bearer(user):
+        """Authorization header for the async views, which read the token themselves"""
+        return {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+class ConversationListQueryTests(ChatTestCase):
+    """The conversation list must not issue queries per conversation"""
+    
+    conversation_title = None
+    
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('conversation-list-create')
+    
+    def create_conversations(self, count):
+        for i in range(count):
+            conversation = Conversation.objects.create(user=self.user, title=f'Chat {i}')
+            Message.objects.create(conversation=conversation, sender_type='user', message_text='Hello')
+            Message.objects.create(conversation=conversation, sender_type='bot', message_text=f'Reply {i}')
+    
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.data['results']
+    
+    def test_query_count_is_flat(self):
+        self.create_conversations(2)
+        few_queries, _ = self.count_list_queries()
+        
+        self.create_conversations(20)
+        many_queries, data = self.count_list_queries()
+        
+        self.assertEqual(len(data), 22)
+        self.assertEqual(few_queries, many_queries)
+    
+    def test_summary_fields(self):
+        self.create_conversations(1)
+        Conversation.objects.create(user=self.user, title='Empty')
+        
+        _, data = self.count_list_queries()
+        by_title = {item['title']: item for item in data}
+        
+        self.assertEqual(by_title['Chat 0']['message_count'], 2)
+        self.assertEqual(by_title['Chat 0']['last_message']['text'], 'Reply 0')
+        self.assertEqual(by_title['Chat 0']['last_message']['sender'], 'bot')
+        self.assertEqual(by_title['Empty']['message_count'], 0)
+        self.assertIsNone(by_title['Empty']['last_message'])
+
+
+class MessagePaginationTests(ChatTestCase):
+    """Messages are served newest first in cursor-paginated pages"""
+    
+    conversation_title = 'Long chat'
+    
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            Message.objects.create(conversation=self.conversation, sender_type='user', message_text=f'Message {i}')
+        self.url = reverse('conversation-messages', args=[self.conversation.id])
+    
+    def test_pages_walk_back_through_history(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        texts = [m['message_text'] for m in response.data['results']]
+        self.assertEqual(texts, ['Message 4', 'Message 3'])
+        
+        seen = texts
+        next_url = response.data['next']
+        while next_url:
+            response = self.client.get(next_url)
+            seen += [m['message_text'] for m in response.data['results']]
+            next_url = response.data['next']
+        
+        self.assertEqual(seen, [f'Message {i}' for i in range(4, -1, -1)])
+
+
+class IndexUsageTests(ChatTestCase):
+    """EXPLAIN of the hot chat queries must use the composite indexes"""
+    
+    def setUp(self):
+        super().setUp()
+        Message.objects.create(conversation=self.conversation, sender_type='user', message_text='Hello')
+    
+    def explain(self, queryset):
+        # Tiny test tables make PostgreSQL prefer sequential scans
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        return queryset.explain()
+    
+    def test_message_history_uses_index(self):
+        queryset = self.conversation.messages.exclude(id=0).order_by('-created_at')[:10]
+        self.assertIn('chat_msg_conv_created_idx', self.explain(queryset))
+    
+    def test_message_page_uses_index(self):
+        queryset = self.conversation.messages.order_by('-created_at', '-id')[:50]
+        self.assertIn('chat_msg_conv_created_idx', self.explain(queryset))
+    
+    def test_conversation_list_uses_index(self):
+        queryset = Conversation.objects.filter(
+            user=self.user,
+            is_archived=False
+        ).order_by('-updated_at', '-id')[:50]
+        self.assertRegex(
+            self.explain(queryset),
+            'chat_conv_active_idx|chat_conv_user_updated_idx'
+        )
+
+
+class HistoryCacheTests(ChatTestCase):
+    """Building the N8N history needs no query once the cache is warm"""
+    
+    def setUp(self):
+        super().setUp()
+        for i in range(12):
+            Message.objects.create(conversation=self.conversation, sender_type='user', message_text=f'Message {i}')
+    
+    def test_write_through(self):
+        HistoryCache.get_history(self.conversation.id)
+        message = Message.objects.create(conversation=self.conversation, sender_type='user', message_text='New')
+        
+        with self.assertNumQueries(0):
+            history = HistoryCache.get_history(self.conversation.id, exclude_id=message.id)
+        
+        self.assertEqual(len(history), 10)
+        self.assertEqual(history[-1]['text'], 'Message 11')
+        self.assertEqual(history[0]['text'], 'Message 2')
+    
+    def test_conversation_delete_invalidates(self):
+        HistoryCache.get_history(self.conversation.id)
+        conversation_id = self.conversation.id
+        self.conversation.delete()
+        self.assertIsNone(cache.get(HistoryCache.key(conversation_id)))
+    
+    def test_conversation_delete_invalidates_once(self):
+        with mock.patch.object(HistoryCache, 'invalidate') as invalidate:
+            self.conversation.delete()
+        invalidate.assert_called_once()
+    
+    def test_bulk_writes_invalidate(self):
+        HistoryCache.get_history(self.conversation.id)
+        Message.objects.filter(conversation=self.conversation).update(message_text='Edited')
+        self.assertEqual(HistoryCache.get_history(self.conversation.id)[-1]['text'], 'Edited')
+        
+        Message.objects.bulk_create([Message(conversation=self.conversation, sender_type='bot', message_text='Bulk')])
+        self.assertEqual(HistoryCache.get_history(self.conversation.id)[-1]['text'], 'Bulk')
+
+
+class HistoryWindowTests(TestCase):
+    """History is filled newest first within the character budget"""
+    
+    def entries(self, *lengths):
+        return [
+            (i, {'sender': 'user', 'text': 'x' * length, 'timestamp': ''})
+            for i, length in enumerate(lengths, start=1)
+        ]
+    
+    def test_budget_drops_oldest(self):
+        entries = self.entries(5000, 100, 100)
+        selected, dropped = HistoryWindow.select(entries, char_budget=1000, max_messages=10)
+        self.assertEqual([i for i, _ in selected], [2, 3])
+        self.assertEqual([i for i, _ in dropped], [1])
+    
+    def test_latest_turn_is_truncated_not_dropped(self):
+        entries = self.entries(100, 5000)
+        selected, dropped = HistoryWindow.select(entries, char_budget=1000, max_messages=10)
+        self.assertEqual([i for i, _ in selected], [2])
+        self.assertLessEqual(HistoryWindow.entry_size(selected[0][1]), 1000)
+        self.assertEqual([i for i, _ in dropped], [1])
+    
+    def test_dropped_turns_fold_into_summary(self):
+        cache.clear()
+        user = ChatTestCase.make_user()
+        conversation = Conversation.objects.create(user=user, title='Chat')
+        for i in range(4):
+            Message.objects.create(conversation=conversation, sender_type='user', message_text=f'Turn {i} ' + 'x' * 3000)
+        
+        history, summary = HistoryWindow.build(conversation)
+        
+        self.assertEqual(len(history), 2)
+        self.assertTrue(summary.startswith('user: Turn 0'))
+        
+        # The summary is saved with the turn
+        TurnWriter.save_turn(conversation, 'Next', {'bot_response': 'Reply', 'metadata': {}})
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.history_summary, summary)
+
+
+class N8NConnectionPoolTests(TestCase):
+    """Clients are reused, recycled after idling and never shared across processes or loops"""
+    
+    def setUp(self):
+        N8NConnectionPool.reset()
+        self.addCleanup(N8NConnectionPool.reset)
+    
+    @override_settings(N8N_KEEPALIVE_EXPIRY=60, N8N_CONNECT_TIMEOUT=5, N8N_READ_TIMEOUT=30)
+    def test_session_is_recycled_after_idling(self):
+        session = N8NConnectionPool.get_session()
+        self.assertIs(N8NConnectionPool.get_session(), session)
+        
+        now = time.monotonic()
+        with mock.patch('chat.n8n_service.time.monotonic', return_value=now + 61):
+            self.assertIsNot(N8NConnectionPool.get_session(), session)
+    
+    @override_settings(N8N_KEEPALIVE_EXPIRY=1, N8N_CONNECT_TIMEOUT=5, N8N_READ_TIMEOUT=30)
+    def test_session_outlives_a_request_in_flight(self):
+        # A short keepalive must not close the session under a request still reading
+        session = N8NConnectionPool.get_session()
+        now = time.monotonic()
+        with mock.patch('chat.n8n_service.time.monotonic', return_value=now + 30):
+            self.assertIs(N8NConnectionPool.get_session(), session)
+        with mock.patch('chat.n8n_service.time.monotonic', return_value=now + 30 + 36):
+            self.assertIsNot(N8NConnectionPool.get_session(), session)
+    
+    @override_settings(N8N_POOL_MAXSIZE=7)
+    def test_one_async_client_per_event_loop(self):
+        async def clients():
+            first, second = N8NConnectionPool.get_async_client(), N8NConnectionPool.get_async_client()
+            await first.aclose()
+            return first, second
+        
+        first, second = asyncio.run(clients())
+        self.assertIs(first, second)
+        self.assertEqual(first._transport._pool._max_connections, 7)
+        
+        other, _ = asyncio.run(clients())
+        self.assertIsNot(other, first)
+        gc.collect()
+        self.assertEqual(len(N8NConnectionPool._async_clients), 0)  # Gone with their loops
+    
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_forked_child_starts_without_clients(self):
+        N8NConnectionPool.get_session()
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Child: report whether the parent's session came across, then leave at once
+            os.write(write_end, b'1' if N8NConnectionPool._session is None else b'0')
+            os._exit(0)
+        os.close(write_end)
+        result = os.read(read_end, 1)
+        os.close(read_end)
+        os.waitpid(pid, 0)
+        
+        self.assertEqual(result, b'1')
+        self.assertIsNotNone(N8NConnectionPool._session)
+
+
+class CircuitBreakerTests(TestCase):
+    """The breaker opens on failures and recovers through half-open"""
+    
+    def make_breaker(self, reset_timeout=60):
+        return CircuitBreaker(
+            name='test',
+            failure_threshold=3,
+            error_rate_threshold=0.5,
+            window_size=10,
+            min_calls=10,
+            reset_timeout=reset_timeout,
+            half_open_calls=1
+        )
+    
+    def test_opens_after_consecutive_failures(self):
+        breaker = self.make_breaker()
+        for _ in range(3):
+            self.assertTrue(breaker.allow())
+            breaker.record(failed=True)
+        
+        self.assertEqual(breaker.snapshot()['state'], CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+    
+    def test_half_open_trial_closes_circuit(self):
+        breaker = self.make_breaker(reset_timeout=0)
+        for _ in range(3):
+            breaker.allow()
+            breaker.record(failed=True)
+        
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record(failed=False)
+        self.assertEqual(breaker.snapshot()['state'], CircuitBreaker.CLOSED)
+    
+    def test_open_circuit_returns_apology_without_calling_n8n(self):
+        N8NGuard.reset()
+        breaker = N8NGuard.breaker()
+        for _ in range(settings.N8N_CIRCUIT_FAILURE_THRESHOLD):
+            breaker.allow()
+            breaker.record(failed=True)
+        
+        with mock.patch.object(N8NService, '_post') as post:
+            result = N8NService.send_message_to_n8n(1, 1, 'Hello', [])
+        
+        post.assert_not_called()
+        self.assertFalse(result['success'])
+        self.assertEqual(result['metadata']['error'], 'circuit_open')
+        N8NGuard.reset()
+
+
+class IdempotentSendTests(ChatTestCase):
+    """Repeated sends replay the first response"""
+    
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('send-message', args=[self.conversation.id])
+        self.n8n_reply = {'success': True, 'bot_response': 'Hi there', 'metadata': {}}
+    
+    def send(self, text, key=None):
+        headers = {'Idempotency-Key': key} if key else {}
+        return self.client.post(self.url, {'message_text': text}, format='json', headers=headers)
+    
+    def test_idempotency_key_replays_response(self):
+        with mock.patch.object(N8NService, 'send_message_to_n8n', return_value=self.n8n_reply) as send:
+            first = self.send('Hello', key='abc')
+            second = self.send('Hello', key='abc')
+        
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(Message.objects.count(), 2)
+    
+    async def test_long_stream_keeps_its_claim(self):
+        keys = SendDeduplicator.keys(self.user.id, self.conversation.id, 'Hello', 'abc')
+        claim, _ = await SendDeduplicator.abegin(keys)
+        ttl = SendDeduplicator._pending_ttl()
+        
+        # Midway through a stream longer than the pending TTL, a chunk refreshes the claim
+        started = time.time()
+        with mock.patch('chat.idempotency.time.monotonic', return_value=claim['refreshed'] + ttl / 2), \
+                mock.patch('django.core.cache.backends.locmem.time.time', return_value=started + ttl / 2):
+            await SendDeduplicator.arefresh(claim)
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=started + ttl + 1):
+            self.assertEqual((await cache.aget(keys[0]))['state'], SendDeduplicator.PENDING)
+    
+    def test_keys_are_scoped_by_conversation(self):
+        other = Conversation.objects.create(user=self.user, title='Other')
+        with mock.patch.object(N8NService, 'send_message_to_n8n', return_value=self.n8n_reply) as send:
+            self.send('Hello', key='abc')
+            response = self.client.post(
+                reverse('send-message', args=[other.id]), {'message_text': 'Hello'},
+                format='json', headers={'Idempotency-Key': 'abc'}
+            )
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(send.call_count, 2)
+    
+    def test_same_text_sent_again_is_a_new_message(self):
+        with mock.patch.object(N8NService, 'send_message_to_n8n', return_value=self.n8n_reply) as send:
+            first = self.send('yes', key='one')
+            second = self.send('yes', key='two')
+        
+        self.assertNotEqual(first.data['user_message']['id'], second.data['user_message']['id'])
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(Message.objects.filter(message_text='yes').count(), 2)
+    
+    def test_duplicate_in_flight_is_refused_then_replayed(self):
+        keys = SendDeduplicator.keys(self.user.id, self.conversation.id, 'Hello', 'first')
+        claim, record = SendDeduplicator.begin(keys)
+        self.assertIsNone(record)
+        
+        # A double click while the first send is in flight answers at once
+        with mock.patch.object(N8NService, 'send_message_to_n8n', return_value=self.n8n_reply) as send:
+            in_flight = self.send('Hello', key='second')
+            SendDeduplicator.complete(claim, 201, {'user_message': {'id': 1}})
+            retried = self.send('Hello', key='second')
+        
+        self.assertEqual(in_flight.status_code, 409)
+        self.assertEqual(in_flight['Retry-After'], '1')
+        self.assertEqual(retried.status_code, 201)
+        self.assertEqual(retried.data, {'user_message': {'id': 1}})
+        send.assert_not_called()
+    
+    def test_retry_after_failed_first_send_is_new(self):
+        keys = SendDeduplicator.keys(self.user.id, self.conversation.id, 'Hello')
+        claim, _ = SendDeduplicator.begin(keys)
+        
+        with mock.patch.object(N8NService, 'send_message_to_n8n', return_value=self.n8n_reply) as send:
+            self.assertEqual(self.send('Hello', key='second').status_code, 409)
+            SendDeduplicator.abort(claim)
+            self.assertEqual(self.send('Hello', key='second').status_code, 409)  # Learns it failed
+            response = self.send('Hello', key='second')
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(send.call_count, 1)
+
+
+class StructuredLoggingTests(TestCase):
+    """N8N calls log one structured event without the message text"""
+    
+    def test_call_event_is_redacted(self):
+        N8NGuard.reset()
+        reply = N8NService.parse_n8n_response({'bot_response': 'Secret reply'})
+        
+        with mock.patch.object(N8NService, '_post', return_value=reply):
+            with self.assertLogs('chat.n8n_service', level='INFO') as logs:
+                N8NService.send_message_to_n8n(1, 1, 'Secret question', [])
+        
+        record = logs.records[-1]
+        self.assertEqual(record.event, 'n8n.call')
+        self.assertEqual(record.fields['outcome'], 'success')
+        self.assertGreater(record.fields['payload_bytes'], 0)
+        output = JsonFormatter().format(record)
+        self.assertNotIn('Secret', output)
+        N8NGuard.reset()
+    
+    def test_job_crash_is_one_event_with_traceback(self):
+        user = ChatTestCase.make_user()
+        conversation = Conversation.objects.create(user=user, title='Chat')
+        message = Message.objects.create(conversation=conversation, sender_type='user', message_text='Secret')
+        job = ReplyJobQueue.enqueue(conversation, message, [])
+        
+        with mock.patch.object(ReplyJobQueue, 'process', side_effect=RuntimeError('boom')):
+            with self.assertLogs('chat.jobs', level='ERROR') as logs:
+                ReplyJobQueue._process_safely(job)
+        
+        [record] = logs.records
+        self.assertEqual(record.event, 'reply_job.crashed')
+        self.assertEqual(record.fields, {'job_id': job.id, 'error': 'boom'})
+        self.assertIsNotNone(record.exc_info)
+    
+    def test_unparsed_response_is_fallback(self):
+        result = N8NService.parse_n8n_response({'unexpected': 'Secret'})
+        self.assertEqual(result['outcome'], 'fallback_parse')
+        self.assertEqual(result['bot_response'], N8NService.FALLBACK_RESPONSE)
+
+
+class MetricsTests(ChatTestCase):
+    """Send latency, N8N outcomes and per-view query counts reach /metrics"""
+    
+    def setUp(self):
+        super().setUp()
+        N8NGuard.reset()
+    
+    def sample(self, name, labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+    
+    def test_send_is_measured(self):
+        send_labels = {'mode': 'sync'}
+        n8n_labels = {'mode': 'sync', 'outcome': 'timeout'}
+        view_labels = {'view': 'send-message', 'method': 'POST'}
+        sends = self.sample('chat_send_latency_seconds_count', send_labels)
+        timeouts = self.sample('chat_n8n_latency_seconds_count', n8n_labels)
+        views = self.sample('chat_view_db_queries_count', view_labels)
+        queries = self.sample('chat_view_db_queries_sum', view_labels)
+        
+        timeout = N8NService.error_response(N8NService.TIMEOUT_RESPONSE, 'timeout', outcome='timeout')
+        with mock.patch.object(N8NService, '_post', return_value=timeout):
+            response = self.client.post(
+                reverse('send-message', args=[self.conversation.id]),
+                {'message_text': 'Hello'},
+                format='json'
+            )
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.sample('chat_send_latency_seconds_count', send_labels), sends + 1)
+        self.assertEqual(self.sample('chat_n8n_latency_seconds_count', n8n_labels), timeouts + 1)
+        self.assertEqual(self.sample('chat_view_db_queries_count', view_labels), views + 1)
+        self.assertGreater(self.sample('chat_view_db_queries_sum', view_labels), queries)
+        N8NGuard.reset()
+    
+    @override_settings(METRICS_TOKEN='')
+    def test_endpoint_is_off_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+    
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'chat_n8n_latency_seconds', response.content)
+
+
+class ProfilingMiddlewareTests(ChatTestCase):
+    """Staff can profile a single request with the X-Profile header"""
+    
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('conversation-detail', args=[self.conversation.id])
+    
+    def get(self, user, profile):
+        return APIClient().get(self.url, headers={**self.bearer(user), 'X-Profile': profile})
+    
+    def test_staff_gets_server_timing(self):
+        self.user.is_staff = True
+        self.user.save()
+        
+        with self.assertLogs('chat.middleware', level='INFO') as logs:
+            response = self.get(self.user, 'cprofile')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertGreater(int(response['X-Query-Count']), 0)
+        self.assertTrue(logs.records[-1].fields['functions'])
+    
+    def test_ignored_for_other_users(self):
+        response = self.get(self.user, '1')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class FakeN8NServerTests(TestCase):
+    """The benchmark stand-in answers in every shape the service parses"""
+    
+    def setUp(self):
+        N8NGuard.reset()
+        self.server = FakeN8NServer(('127.0.0.1', 0))
+        self.server.start()
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        N8NGuard.reset()
+    
+    def test_each_shape_is_parsed(self):
+        with self.settings(N8N_WEBHOOK_URL=self.server.url):
+            for shape in RESPONSE_SHAPES:
+                self.server.shape = shape
+                result = N8NService.send_message_to_n8n(1, 1, 'Hello', [])
+                self.assertEqual(result['bot_response'], 'Echo: Hello')
+                self.assertEqual(result['metadata']['shape'], shape)
+    
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertIsNone(percentile([], 95))
+
+
+class TurnWriterTests(ChatTestCase):
+    """A turn is saved in one transaction and moves its conversation up"""
+    
+    conversation_title = None
+    
+    def setUp(self):
+        super().setUp()
+        self.older = Conversation.objects.create(user=self.user, title='Older')
+        self.newer = Conversation.objects.create(user=self.user, title='Newer')
+        self.reply = {'success': True, 'bot_response': 'Hi there', 'metadata': {}}
+    
+    def test_turn_is_one_insert_and_one_update(self):
+        with CaptureQueriesContext(connection) as context:
+            user_message, bot_message = TurnWriter.save_turn(self.older, 'Hello', self.reply)
+        
+        statements = [query['sql'].split()[0].upper() for query in context.captured_queries]
+        self.assertEqual(statements.count('INSERT'), 1)
+        self.assertEqual(statements.count('UPDATE'), 1)
+        self.assertLess(user_message.id, bot_message.id)
+        self.assertEqual(bot_message.message_text, 'Hi there')
+    
+    def test_send_reorders_conversation_list(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        
+        with mock.patch.object(N8NService, 'send_message_to_n8n', return_value=self.reply):
+            client.post(reverse('send-message', args=[self.older.id]), {'message_text': 'Hello'}, format='json')
+        
+        response = client.get(reverse('conversation-list-create'))
+        titles = [item['title'] for item in response.data['results']]
+        self.assertEqual(titles, ['Older', 'Newer'])
+
+
+class ConversationSummaryTests(ChatTestCase):
+    """The denormalized message summary follows every write path"""
+    
+    def summary(self):
+        self.conversation.refresh_from_db()
+        return (
+            self.conversation.message_count,
+            self.conversation.last_message_preview,
+            self.conversation.last_sender_type
+        )
+    
+    def test_create_and_delete(self):
+        Message.objects.create(conversation=self.conversation, sender_type='user', message_text='Hello')
+        last = Message.objects.create(conversation=self.conversation, sender_type='bot', message_text='Hi')
+        self.assertEqual(self.summary(), (2, 'Hi', 'bot'))
+        
+        last.delete()
+        self.assertEqual(self.summary(), (1, 'Hello', 'user'))
+        
+        Message.objects.filter(conversation=self.conversation).delete()
+        self.assertEqual(self.summary(), (0, '', ''))
+        self.assertIsNone(self.conversation.last_message_at)
+    
+    def test_bulk_paths(self):
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, sender_type='user', message_text='One'),
+            Message(conversation=self.conversation, sender_type='bot', message_text='Two'),
+        ])
+        self.assertEqual(self.summary(), (2, 'Two', 'bot'))
+        
+        Message.objects.filter(sender_type='bot').update(message_text='Edited')
+        self.assertEqual(self.summary(), (2, 'Edited', 'bot'))
+    
+    def test_queryset_delete_refreshes_each_conversation_once(self):
+        other = Conversation.objects.create(user=self.user, title='Other')
+        Message.objects.bulk_create([
+            Message(conversation=conversation, sender_type='user', message_text=f'Message {i}')
+            for conversation in (self.conversation, other) for i in range(10)
+        ])
+        
+        with CaptureQueriesContext(connection) as queries:
+            Message.objects.filter(message_text__in=['Message 8', 'Message 9']).delete()
+        
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "chat_conversation"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.summary(), (8, 'Message 7', 'user'))
+    
+    def test_command_repairs_drift(self):
+        Message.objects.create(conversation=self.conversation, sender_type='user', message_text='Hello')
+        Conversation.objects.filter(pk=self.conversation.pk).update(message_count=7)
+        
+        with self.assertRaises(CommandError):
+            call_command('sync_conversation_summaries', '--check', stdout=StringIO())
+        
+        call_command('sync_conversation_summaries', stdout=StringIO())
+        self.assertEqual(self.summary(), (1, 'Hello', 'user'))
+        call_command('sync_conversation_summaries', '--check', stdout=StringIO())
+
+
+class MessageSearchTests(ChatTestCase):
+    """Search is ranked, highlighted, scoped to the user and follows edits"""
+    
+    conversation_title = 'Sleep'
+    
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('message-search')
+        
+        self.message = Message.objects.create(
+            conversation=self.conversation, sender_type='user', message_text='I have trouble sleeping at night'
+        )
+        Message.objects.create(
+            conversation=self.conversation, sender_type='bot', message_text='Try a <b>calm</b> routine before sleep'
+        )
+        other = self.make_user('other@example.com')
+        other_conversation = Conversation.objects.create(user=other, title='Other')
+        Message.objects.create(conversation=other_conversation, sender_type='user', message_text='sleeping badly')
+    
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+    
+    def test_matches_are_highlighted_and_scoped(self):
+        data = self.search(q='trouble sleeping')
+        
+        self.assertEqual([r['id'] for r in data['results']], [self.message.id])
+        self.assertIn('<mark>trouble</mark>', data['results'][0]['snippet'])
+        self.assertEqual(data['results'][0]['conversation_title'], 'Sleep')
+    
+    def test_timestamps_are_timezone_aware(self):
+        response = self.client.get(self.url, {'q': 'trouble'})
+        created_at = json.loads(response.content)['results'][0]['created_at']
+        self.assertTrue(created_at.endswith('Z'), created_at)  # Like every other endpoint
+    
+    def test_snippet_is_escaped_and_stemmed(self):
+        data = self.search(q='calm')
+        self.assertIn('&lt;b&gt;<mark>calm</mark>&lt;/b&gt;', data['results'][0]['snippet'])
+        self.assertEqual(len(self.search(q='sleep')['results']), 2)
+    
+    def test_index_follows_updates_and_deletes(self):
+        Message.objects.filter(id=self.message.id).update(message_text='Anxious mornings')
+        self.assertEqual(self.search(q='trouble')['results'], [])
+        self.assertEqual(len(self.search(q='anxious')['results']), 1)
+        
+        self.message.delete()
+        self.assertEqual(self.search(q='anxious')['results'], [])
+    
+    def test_pages(self):
+        first = self.search(q='sleep', page_size=1)
+        self.assertEqual(len(first['results']), 1)
+        second = self.client.get(first['next']).data
+        self.assertEqual(len(second['results']), 1)
+        self.assertIsNone(second['next'])
+        self.assertNotEqual(first['results'][0]['id'], second['results'][0]['id'])
+    
+    def test_query_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+    
+    def test_triggers_survive_migrations(self):
+        # A later migration that remakes chat_message on SQLite drops them
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 triggers are SQLite only')
+        self.assertEqual(MessageSearch.missing_sqlite_triggers(), [])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'chat_message_fts'")
+            self.assertIsNotNone(cursor.fetchone())
+    
+    def test_missing_triggers_fall_back_to_scan(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 triggers are SQLite only')
+        with mock.patch.object(MessageSearch, 'missing_sqlite_triggers', return_value=['chat_message_fts_insert']), \
+                mock.patch.object(MessageSearch, '_sqlite_index_usable', None), \
+                self.assertLogs('chat.search', level='ERROR') as logs:
+            data = self.search(q='trouble')
+            self.search(q='calm')
+        
+        self.assertEqual([r['id'] for r in data['results']], [self.message.id])
+        self.assertEqual(len(logs.records), 1)  # Checked once per process
+
+
+class ConditionalGetTests(ChatTestCase):
+    """Conversation reads answer 304 to a current ETag and change with new messages"""
+    
+    def setUp(self):
+        super().setUp()
+        Message.objects.create(conversation=self.conversation, sender_type='user', message_text='Hello')
+        self.urls = [
+            reverse('conversation-list-create'),
+            reverse('conversation-detail', args=[self.conversation.id]),
+            reverse('conversation-messages', args=[self.conversation.id]),
+        ]
+    
+    def test_unchanged_state_returns_not_modified(self):
+        for url in self.urls:
+            etag = self.client.get(url)['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+    
+    def test_new_message_changes_etag(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        Message.objects.create(conversation=self.conversation, sender_type='bot', message_text='Hi')
+        
+        for url, etag in zip(self.urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+    
+    def test_other_users_conversation_has_no_etag(self):
+        other = self.make_user('other@example.com')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(self.urls[1], HTTP_IF_NONE_MATCH='*')
+        self.assertNotEqual(response.status_code, 304)
+        self.assertNotIn('ETag', response)
+
+
+class RealtimeEventsTests(ChatTestCase):
+    """Committed conversation and message changes reach the owner's open streams"""
+    
+    def save_turn(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            TurnWriter.save_turn(self.conversation, 'Hello', {'bot_response': 'Hi', 'metadata': {}})
+    
+    def delete_conversation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.delete()
+    
+    async def next_event(self, subscription):
+        frame = await asyncio.wait_for(subscription.get(), 1)
+        event, data = frame.split('\n', 1)
+        return event[len('event: '):], json.loads(data[len('data: '):])
+    
+    async def test_turn_publishes_both_messages_with_summary(self):
+        hub = RealtimeEvents.hub()
+        subscription = hub.subscribe(self.user.id)
+        try:
+            await sync_to_async(self.save_turn)()
+            
+            events = [await self.next_event(subscription) for _ in range(2)]
+            self.assertEqual([event for event, _ in events], ['message.created'] * 2)
+            self.assertEqual([data['message']['sender_type'] for _, data in events], ['user', 'bot'])
+            self.assertEqual(events[1][1]['conversation']['message_count'], 2)
+            
+            conversation_id = self.conversation.id
+            await sync_to_async(self.delete_conversation)()
+            self.assertEqual(await self.next_event(subscription), ('conversation.deleted', {'id': conversation_id}))
+        finally:
+            hub.unsubscribe(subscription)
+    
+    async def test_other_users_get_nothing(self):
+        hub = RealtimeEvents.hub()
+        subscription = hub.subscribe(self.user.id + 1)
+        try:
+            await sync_to_async(self.save_turn)()
+            self.assertTrue(subscription.queue.empty())
+        finally:
+            hub.unsubscribe(subscription)
+        self.assertFalse(hub.has_subscribers())
+    
+    @override_settings(CHAT_REALTIME_QUEUE_SIZE=2)
+    async def test_slow_client_is_closed(self):
+        hub = LocalEventHub()
+        subscription = hub.subscribe(1)
+        for number in range(3):
+            hub.publish(1, f'frame {number}')
+        await asyncio.sleep(0)
+        self.assertIsNone(await subscription.get())
+    
+    async def test_stream_requires_authentication(self):
+        response = await self.async_client.get(reverse('realtime-events'))
+        self.assertEqual(response.status_code, 401)
+    
+    async def test_stream_opens_under_asgi(self):
+        headers = await sync_to_async(self.bearer)(self.user)
+        request = AsyncRequestFactory().get(reverse('realtime-events'), headers=headers)
+        response = await realtime_events_view(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        
+        stream = response._iterator  # The view's generator, closed the way the server does
+        self.assertTrue((await anext(stream)).startswith('retry:'))
+        await stream.aclose()
+        self.assertFalse(RealtimeEvents.hub().has_subscribers())
+    
+    def test_wsgi_server_gets_not_implemented(self):
+        # runserver would buffer the endless stream in a worker thread
+        self.assertEqual(self.client.get(reverse('realtime-events')).status_code, 501)
+
+
+class DeltaSyncTests(ChatTestCase):
+    """Sync returns only what changed after the watermark, with deletions as tombstones"""
+    
+    conversation_title = None
+    
+    def setUp(self):
+        super().setUp()
+        self.changed = Conversation.objects.create(user=self.user, title='Changed')
+        self.unchanged = Conversation.objects.create(user=self.user, title='Unchanged')
+        self.first = Message.objects.create(conversation=self.changed, sender_type='user', message_text='First')
+        
+        # Everything above happened an hour before the client's last sync
+        hour_ago = timezone.now() - timedelta(hours=1)
+        Conversation.objects.update(updated_at=hour_ago)
+        self.since = (hour_ago + timedelta(minutes=30)).isoformat()
+    
+    def sync(self, since):
+        response = self.client.get(reverse('sync'), {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+    
+    def test_first_sync_asks_for_reload(self):
+        data = self.sync(None)
+        self.assertTrue(data['reset'])
+        self.assertIsNotNone(data['watermark'])
+    
+    def test_returns_changed_conversations_and_tombstones(self):
+        Message.objects.create(conversation=self.changed, sender_type='bot', message_text='Second')
+        first_id = self.first.id
+        self.first.delete()
+        deleted = Conversation.objects.create(user=self.user, title='Deleted')
+        deleted_id = deleted.id
+        deleted.delete()
+        
+        data = self.sync(self.since)
+        self.assertFalse(data['reset'])
+        self.assertEqual([c['id'] for c in data['conversations']], [self.changed.id])
+        self.assertEqual(data['conversations'][0]['last_message']['text'], 'Second')
+        self.assertEqual(data['deleted_conversations'], [deleted_id])
+        self.assertEqual(data['deleted_messages'], [{'id': first_id, 'conversation': self.changed.id}])
+        with self.settings(CHAT_SYNC_OVERLAP=0):
+            self.assertEqual(self.sync(data['watermark'])['deleted_messages'], [])
+    
+    def test_messages_after_id(self):
+        second = Message.objects.create(conversation=self.changed, sender_type='bot', message_text='Second')
+        url = reverse('conversation-messages', args=[self.changed.id])
+        
+        response = self.client.get(url, {'after': self.first.id})
+        self.assertEqual([m['id'] for m in response.data['results']], [second.id])
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 400)
+    
+    def test_invalid_or_expired_watermark(self):
+        response = self.client.get(reverse('sync'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(self.sync((timezone.now() - timedelta(days=60)).isoformat())['reset'])
+    
+    def test_user_deletion_leaves_no_tombstones(self):
+        self.user.delete()
+        self.assertFalse(Tombstone.objects.exists())
+    
+    def test_queryset_delete_queries_do_not_grow_with_rows(self):
+        def delete_messages(count):
+            Message.objects.bulk_create([
+                Message(conversation=self.unchanged, sender_type='user', message_text=f'Message {i}')
+                for i in range(count)
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                Message.objects.filter(conversation=self.unchanged).delete()
+            return len(queries)
+        
+        self.assertEqual(delete_messages(50), delete_messages(2))
+        self.assertEqual(Tombstone.objects.filter(user=self.user, conversation_id=self.unchanged.id).count(), 52)
+
+
+class RateLimitTests(ChatTestCase):
+    """Token buckets refuse bursts over the limit with 429 and Retry-After"""
+    
+    def setUp(self):
+        super().setUp()
+        RateLimiter.reset()
+        self.addCleanup(RateLimiter.reset)
+        self.url = reverse('send-message', args=[self.conversation.id])
+    
+    def test_bucket_refills_and_takes_all_or_nothing(self):
+        store = LocalBucketStore()
+        user_bucket = ('user', 2, 1.0)
+        global_bucket = ('global', 1, 0.5)
+        
+        self.assertIsNone(store.take([user_bucket]))
+        self.assertIsNone(store.take([user_bucket, global_bucket]))
+        self.assertAlmostEqual(store.take([user_bucket, global_bucket]), 2.0, places=1)
+        
+        # The refused check left the user bucket alone
+        with mock.patch('chat.rate_limit.time.monotonic', return_value=time.monotonic() + 1):
+            self.assertIsNone(store.take([user_bucket]))
+    
+    @override_settings(RATE_LIMITS={'send': {'user': '2/min', 'ip': '100/min', 'global': '1000/min'}})
+    def test_send_over_user_limit_is_refused(self):
+        reply = {'success': True, 'bot_response': 'Hi', 'metadata': {}}
+        with mock.patch.object(N8NService, 'send_message_to_n8n', return_value=reply) as send:
+            statuses = [
+                self.client.post(self.url, {'message_text': f'Hello {number}'}, format='json').status_code
+                for number in range(3)
+            ]
+            response = self.client.post(self.url, {'message_text': 'Again'}, format='json')
+        
+        self.assertEqual(statuses, [201, 201, 429])
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(send.call_count, 2)
+    
+    @override_settings(RATE_LIMITS={'login': {'ip': '1/min'}})
+    def test_login_is_limited_per_ip(self):
+        client = APIClient()
+        credentials = {'email': 'user@example.com', 'password': 'wrong'}
+        
+        self.assertEqual(client.post('/api/auth/login/', credentials, format='json').status_code, 401)
+        response = client.post('/api/auth/login/', credentials, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+    
+    @override_settings(RATE_LIMITS={'login': {'ip': '1/min'}})
+    def test_forwarded_for_cannot_be_spoofed(self):
+        client = APIClient()
+        credentials = {'email': 'user@example.com', 'password': 'wrong'}
+        
+        # The proxy appends the real address; what the client put before it is ignored
+        client.post('/api/auth/login/', credentials, format='json', HTTP_X_FORWARDED_FOR='1.1.1.1, 9.9.9.9')
+        response = client.post('/api/auth/login/', credentials, format='json', HTTP_X_FORWARDED_FOR='2.2.2.2, 9.9.9.9')
+        self.assertEqual(response.status_code, 429)
+    
+    @override_settings(RATE_LIMITS={'login': {'ip': '100/min', 'email': '1/min'}})
+    def test_login_is_limited_per_email(self):
+        wrong = {'email': 'User@Example.com', 'password': 'wrong'}
+        self.assertEqual(APIClient().post('/api/auth/login/', wrong, format='json', REMOTE_ADDR='1.1.1.1').status_code, 401)
+        
+        response = APIClient().post(
+            '/api/auth/login/', {'email': 'user@example.com', 'password': 'wrong'}, format='json', REMOTE_ADDR='2.2.2.2'
+        )
+        self.assertEqual(response.status_code, 429)
+        
+        other = {'email': 'other@example.com', 'password': 'wrong'}
+        self.assertEqual(APIClient().post('/api/auth/login/', other, format='json').status_code, 401)
+    
+    async def test_async_check_keeps_redis_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        
+        class FakeRedisStore(RedisBucketStore):
+            def __init__(self):
+                self.threads = []
+            
+            def take(self, buckets):
+                self.threads.append(threading.get_ident())
+                return None
+        
+        store = FakeRedisStore()
+        with mock.patch.object(RateLimiter, 'store', return_value=store):
+            self.assertIsNone(await RateLimiter.acheck('send', user_id=1, ip='1.1.1.1'))
+        self.assertEqual(len(store.threads), 1)
+        self.assertNotEqual(store.threads[0], loop_thread)
+    
+    def test_local_buckets_stay_bounded(self):
+        store = LocalBucketStore()
+        now = time.monotonic()
+        
+        with mock.patch('chat.rate_limit.time.monotonic', return_value=now):
+            store.take([('fast', 10, 100.0)])
+            store.take([('slow', 10, 0.1)])
+        # The refilled least recently used bucket is dropped, the one still refilling is kept
+        with mock.patch('chat.rate_limit.time.monotonic', return_value=now + 1):
+            store.take([('new', 10, 0.1)])
+        self.assertEqual(list(store._buckets), ['slow', 'new'])
+        
+        with override_settings(RATE_LIMIT_LOCAL_MAX_KEYS=2):
+            store.take([('newest', 10, 0.1)])
+        self.assertEqual(list(store._buckets), ['new', 'newest'])
+
+
+class AsyncSendTests(ChatTestCase):
+    """The async send endpoint awaits N8N and saves the turn like the sync one"""
+    
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('send-message-async', args=[self.conversation.id])
+        self.headers = self.bearer(self.user)
+        self.n8n_reply = {'success': True, 'bot_response': 'Hi there', 'metadata': {}}
+    
+    async def test_reply_is_saved_and_returned(self):
+        with mock.patch.object(
+            N8NService, 'async_send_message_to_n8n', new=mock.AsyncMock(return_value=self.n8n_reply)
+        ) as send:
+            response = await self.async_client.post(
+                self.url, {'message_text': 'Hello'}, content_type='application/json', headers=self.headers
+            )
+        
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['user_message']['message_text'], 'Hello')
+        self.assertEqual(data['bot_message']['message_text'], 'Hi there')
+        self.assertTrue(data['n8n_success'])
+        self.assertEqual(send.await_args.kwargs['current_message'], 'Hello')
+        
+        messages = [message async for message in self.conversation.messages.order_by('id')]
+        self.assertEqual([message.sender_type for message in messages], ['user', 'bot'])
+    
+    async def test_requires_authentication_and_ownership(self):
+        other = await sync_to_async(self.make_user)('other@example.com')
+        other_headers = await sync_to_async(self.bearer)(other)
+        
+        response = await self.async_client.post(
+            self.url, {'message_text': 'Hello'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 401)
+        
+        response = await self.async_client.post(
+            self.url, {'message_text': 'Hello'}, content_type='application/json', headers=other_headers
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(await Message.objects.aexists())
+
+
+class StreamingSendTests(ChatTestCase):
+    """?stream=1 relays the reply as SSE and saves the turn once it completes"""
+    
+    def setUp(self):
+        super().setUp()
+        N8NGuard.reset()
+        self.addCleanup(N8NGuard.reset)
+        self.url = reverse('send-message', args=[self.conversation.id]) + '?stream=1'
+        self.headers = self.bearer(self.user)
+    
+    @staticmethod
+    async def fake_stream(payload):
+        yield {'type': 'delta', 'text': 'Hel'}
+        yield {'type': 'delta', 'text': 'lo'}
+        yield {'type': 'done', 'result': {
+            'success': True, 'bot_response': 'Hello', 'metadata': {'streamed': True}, 'outcome': 'success'
+        }}
+    
+    async def test_events_in_order_and_turn_saved(self):
+        with mock.patch.object(N8NService, '_astream', self.fake_stream):
+            response = await self.async_client.post(
+                self.url, {'message_text': 'Hi'}, content_type='application/json', headers=self.headers
+            )
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        frames = [frame.split('\n', 1) for frame in body.strip().split('\n\n')]
+        events = [(event[len('event: '):], json.loads(data[len('data: '):])) for event, data in frames]
+        self.assertEqual(
+            [event for event, _ in events],
+            ['delta', 'delta', 'user_message', 'bot_message', 'done']
+        )
+        self.assertEqual(''.join(data['text'] for event, data in events if event == 'delta'), 'Hello')
+        self.assertEqual(events[3][1]['message_text'], 'Hello')
+        
+        messages = [message async for message in self.conversation.messages.order_by('id')]
+        self.assertEqual([(m.sender_type, m.message_text) for m in messages], [('user', 'Hi'), ('bot', 'Hello')])
+        self.assertEqual(N8NGuard.limiter().snapshot()['in_flight'], 0)
+    
+    async def test_disconnect_releases_slots_and_saves_nothing(self):
+        keys = SendDeduplicator.keys(self.user.id, self.conversation.id, 'Hi')
+        claim, record = await SendDeduplicator.abegin(keys)
+        self.assertIsNone(record)
+        
+        with mock.patch.object(N8NService, '_astream', self.fake_stream):
+            stream = _stream_bot_reply(self.conversation, self.user, 'Hi', [], '', dedup_claim=claim)
+            self.assertTrue((await anext(stream)).startswith('event: delta'))
+            self.assertEqual(N8NGuard.limiter().snapshot()['in_flight'], 1)
+            await stream.aclose()  # What the server does when the client goes away
+        
+        self.assertEqual(N8NGuard.limiter().snapshot()['in_flight'], 0)
+        self.assertIsNone(await cache.aget(keys[0]))
+        self.assertFalse(await Message.objects.aexists())
+    
+    @override_settings(N8N_CIRCUIT_SLOW_CALL_SECONDS=0.05, N8N_LATENCY_TARGET=0.05)
+    async def test_long_healthy_stream_is_not_a_slow_call(self):
+        async def slow_stream(payload):
+            yield {'type': 'delta', 'text': 'Hel'}
+            await asyncio.sleep(0.1)  # Longer than both limits, after the first byte
+            yield {'type': 'delta', 'text': 'lo'}
+            yield {'type': 'done', 'result': {'success': True, 'bot_response': 'Hello', 'metadata': {}}}
+        
+        with mock.patch.object(N8NService, '_astream', slow_stream):
+            for _ in range(settings.N8N_CIRCUIT_FAILURE_THRESHOLD):
+                chunks = [chunk async for chunk in N8NService.async_stream_message_to_n8n(1, 1, 'Hi', [])]
+                self.assertEqual(chunks[-1]['result']['bot_response'], 'Hello')
+        
+        snapshot = N8NGuard.snapshot()
+        self.assertEqual(snapshot['circuit']['state'], CircuitBreaker.CLOSED)
+        self.assertEqual(snapshot['circuit']['consecutive_failures'], 0)
+        self.assertEqual(snapshot['concurrency']['limit'], settings.N8N_CONCURRENCY_MAX)
+
+
+class ReplyJobTests(ChatTestCase):
+    """?async=1 queues the N8N call; workers retry with backoff and store the reply"""
+    
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('send-message', args=[self.conversation.id]) + '?async=1'
+        self.success = {'success': True, 'bot_response': 'Hi there', 'metadata': {}}
+        self.failure = {'success': False, 'bot_response': 'Sorry', 'metadata': {'error': 'timeout'}}
+    
+    def queue(self, text='Hello'):
+        response = self.client.post(self.url, {'message_text': text}, format='json')
+        self.assertEqual(response.status_code, 202)
+        return ReplyJob.objects.get(id=response.data['job']['id'])
+    
+    def run_once(self, n8n_response):
+        ReplyJob.objects.filter(status=ReplyJob.STATUS_PENDING).update(available_at=timezone.now())
+        jobs = ReplyJobQueue.claim(10)
+        with mock.patch.object(N8NService, 'send_message_to_n8n', return_value=n8n_response):
+            return [ReplyJobQueue.process(job) for job in jobs]
+    
+    def test_send_queues_job_without_calling_n8n(self):
+        with mock.patch.object(N8NService, 'send_message_to_n8n') as send:
+            job = self.queue()
+        
+        send.assert_not_called()
+        self.assertEqual(job.status, ReplyJob.STATUS_PENDING)
+        self.assertEqual(job.user_message.message_text, 'Hello')
+        self.assertEqual(self.conversation.messages.count(), 1)
+    
+    def test_claim_is_exclusive(self):
+        job = self.queue()
+        
+        claimed = ReplyJobQueue.claim(10)
+        self.assertEqual([claimed_job.id for claimed_job in claimed], [job.id])
+        self.assertEqual(claimed[0].status, ReplyJob.STATUS_RUNNING)
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(ReplyJobQueue.claim(10), [])
+    
+    def test_done_job_is_served_to_owner_only(self):
+        job = self.queue()
+        self.assertEqual(self.run_once(self.success), [ReplyJob.STATUS_DONE])
+        
+        response = self.client.get(reverse('reply-job', args=[job.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], ReplyJob.STATUS_DONE)
+        self.assertEqual(response.data['bot_message']['message_text'], 'Hi there')
+        
+        other = self.make_user('other@example.com')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(reverse('reply-job', args=[job.id])).status_code, 404)
+    
+    def test_failures_back_off_then_fail(self):
+        job = self.queue()
+        delays = []
+        for _ in range(settings.CHAT_JOB_MAX_ATTEMPTS - 1):
+            before = timezone.now()
+            self.assertEqual(self.run_once(self.failure), [ReplyJob.STATUS_PENDING])
+            job.refresh_from_db()
+            delays.append(round((job.available_at - before).total_seconds()))
+            self.assertEqual(job.last_error, 'timeout')
+            self.assertIsNone(job.bot_message)
+        
+        self.assertEqual(delays, [settings.CHAT_JOB_RETRY_DELAY * 2 ** n for n in range(len(delays))])
+        self.assertEqual(self.run_once(self.failure), [ReplyJob.STATUS_FAILED])
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, settings.CHAT_JOB_MAX_ATTEMPTS)
+        self.assertEqual(job.bot_message.message_text, 'Sorry')
@@ -3,7 +3,13 @@ from .views import (
     conversation_list_create_view,
     conversation_detail_view,
     send_message_view,
-    conversation_messages_view
+    async_send_message_view,
+    conversation_messages_view,
+    message_search_view,
+    realtime_events_view,
+    sync_view,
+    reply_job_view,
+    n8n_status_view
 )
 
 urlpatterns = [
@@ -11,4 +17,10 @@ urlpatterns = [
     path('conversations/<int:conversation_id>/', conversation_detail_view, name='conversation-detail'),
     path('conversations/<int:conversation_id>/messages/', conversation_messages_view, name='conversation-messages'),
     path('conversations/<int:conversation_id>/send/', send_message_view, name='send-message'),
+    path('conversations/<int:conversation_id>/send-async/', async_send_message_view, name='send-message-async'),
+    path('search/', message_search_view, name='message-search'),
+    path('events/', realtime_events_view, name='realtime-events'),
+    path('sync/', sync_view, name='sync'),
+    path('jobs/<int:job_id>/', reply_job_view, name='reply-job'),
+    path('n8n/status/', n8n_status_view, name='n8n-status'),
 ]
\ No newline at end of file
@@ -1,20 +1,52 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.exceptions import AuthenticationFailed
+from accounts.authentication import CachedJWTAuthentication
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from .models import Conversation, Message
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from contextlib import aclosing
+import asyncio
+import hmac
+import json
+import logging
+import time
+from .models import Conversation, ReplyJob
 from .serializers import (
     ConversationSerializer,
     ConversationDetailSerializer,
     MessageSerializer,
+    ReplyJobSerializer,
     SendMessageSerializer
 )
 from .n8n_service import N8NService
+from .circuit_breaker import N8NGuard
+from .history_window import HistoryWindow
+from .jobs import ReplyJobQueue
+from .idempotency import SendDeduplicator
+from .persistence import TurnWriter
+from .pagination import ConversationCursorPagination, MessageCursorPagination, SearchPagination
+from .search import MessageSearch
+from .rate_limit import RateLimiter, SendRateThrottle
+from .sync import DeltaSync
+from .etags import conversation_etag, conversation_list_etag
+from .realtime import RealtimeEvents
+from .structured_logging import log_event
+from . import metrics
+
+logger = logging.getLogger(__name__)
 
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=conversation_list_etag)
 def conversation_list_create_view(request):
     """
     GET: List all conversations for the logged-in user
@@ -28,8 +60,11 @@ def conversation_list_create_view(request):
                 user=request.user, 
                 is_archived=False
             )
-            serializer = ConversationSerializer(conversations, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            
+            paginator = ConversationCursorPagination()
+            page = paginator.paginate_queryset(conversations, request)
+            serializer = ConversationSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
         
         elif request.method == 'POST':
             # Create new conversation
@@ -45,9 +80,7 @@ def conversation_list_create_view(request):
     
     except Exception as e:
         # Log the error for debugging
-        import traceback
-        print("Error in conversation_list_create_view:")
-        print(traceback.format_exc())
+        log_event(logger, logging.ERROR, 'view.error', exc_info=True, view='conversation_list_create_view')
         
         return Response({
             'error': 'Failed to process request',
@@ -57,9 +90,10 @@ def conversation_list_create_view(request):
 
 @api_view(['GET', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=conversation_etag)
 def conversation_detail_view(request, conversation_id):
     """
-    GET: Get conversation details with all messages
+    GET: Get conversation details with its most recent messages
     DELETE: Delete a conversation
     """
     
@@ -87,9 +121,7 @@ def conversation_detail_view(request, conversation_id):
         }, status=status.HTTP_404_NOT_FOUND)
     
     except Exception as e:
-        import traceback
-        print("Error in conversation_detail_view:")
-        print(traceback.format_exc())
+        log_event(logger, logging.ERROR, 'view.error', exc_info=True, view='conversation_detail_view')
         
         return Response({
             'error': 'Failed to process request',
@@ -97,13 +129,123 @@ def conversation_detail_view(request, conversation_id):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _sse_event(event, data):
+    """Encode one Server-Sent Event frame"""
+    return RealtimeEvents.frame(event, data)
+
+
+async def _stream_bot_reply(conversation, user, message_text, conversation_history,
+                            conversation_summary, dedup_claim=None, started=None):
+    """
+    Relay the N8N reply as SSE and persist the turn once it completes
+    
+    Events: delta (one per chunk), user_message, bot_message, done. Nothing is
+    saved if the client disconnects before the reply is complete.
+    """
+    
+    completed = False
+    try:
+        n8n_response = None
+        # aclosing: on disconnect the N8N stream (and its concurrency slot) is
+        # released now, not whenever the event loop finalizes the generator
+        async with aclosing(N8NService.async_stream_message_to_n8n(
+            user_id=user.id,
+            conversation_id=conversation.id,
+            current_message=message_text,
+            conversation_history=conversation_history,
+            conversation_summary=conversation_summary
+        )) as chunks:
+            async for chunk in chunks:
+                if chunk['type'] == 'delta':
+                    if dedup_claim:
+                        await SendDeduplicator.arefresh(dedup_claim)
+                    yield _sse_event('delta', {'text': chunk['text']})
+                else:
+                    n8n_response = chunk['result']
+        
+        # Save both messages
+        user_message, bot_message = await TurnWriter.asave_turn(conversation, message_text, n8n_response)
+        
+        data = {
+            'user_message': MessageSerializer(user_message).data,
+            'bot_message': MessageSerializer(bot_message).data,
+            'n8n_success': n8n_response['success']
+        }
+        if dedup_claim:
+            await SendDeduplicator.acomplete(dedup_claim, status.HTTP_201_CREATED, data)
+        completed = True
+        if started is not None:
+            metrics.observe_send('stream', started)
+        
+        yield _sse_event('user_message', data['user_message'])
+        yield _sse_event('bot_message', data['bot_message'])
+        yield _sse_event('done', {'n8n_success': data['n8n_success']})
+    
+    finally:
+        if dedup_claim and not completed:
+            await SendDeduplicator.aabort(dedup_claim)
+
+
+async def _replay_sse(data):
+    """Replay a stored send response as the same SSE events a live stream emits"""
+    if 'bot_message' in data:
+        yield _sse_event('delta', {'text': data['bot_message']['message_text']})
+    yield _sse_event('user_message', data['user_message'])
+    if 'bot_message' in data:
+        yield _sse_event('bot_message', data['bot_message'])
+        yield _sse_event('done', {'n8n_success': data['n8n_success']})
+
+
+def _sse_response(content):
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _duplicate_error(record):
+    """409 body for a repeated send whose first request is in flight (record) or failed (None)"""
+    if record is None:
+        return {'error': 'A request with the same content or Idempotency-Key failed; send it again'}
+    return {'error': 'A request with the same content or Idempotency-Key is still in progress'}
+
+
+def _replay_send(record, stream=False):
+    """Answer a repeated send from the stored record (409 if it is not done)"""
+    if record is None or record['state'] != SendDeduplicator.DONE:
+        response = Response(_duplicate_error(record), status=status.HTTP_409_CONFLICT)
+        response['Retry-After'] = '1'
+        return response
+    
+    if stream and record['status'] == status.HTTP_201_CREATED:
+        response = _sse_response(_replay_sse(record['data']))
+    else:
+        response = Response(record['data'], status=record['status'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([SendRateThrottle])
 def send_message_view(request, conversation_id):
     """
     POST: Send a message in a conversation and get bot response
+    
+    With ?stream=1 the reply is streamed as Server-Sent Events instead
+    (see _stream_bot_reply). Streaming needs the ASGI server.
+    
+    With ?async=1 the N8N call is queued and 202 is returned with a job to
+    poll at /api/chat/jobs/<id>/ (needs manage.py run_reply_worker).
+    
+    Repeats with the same Idempotency-Key header, or identical messages sent
+    while the first is in flight, replay the first response (409 with
+    Retry-After while it is still in flight).
     """
     
+    dedup_claim = None
+    started = time.monotonic()
+    
     try:
         # Get conversation and ensure it belongs to the user
         conversation = get_object_or_404(
@@ -118,45 +260,65 @@ def send_message_view(request, conversation_id):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         message_text = serializer.validated_data['message_text']
+        stream = request.query_params.get('stream') in ('1', 'true')
         
-        # Save user message
-        user_message = Message.objects.create(
-            conversation=conversation,
-            sender_type='user',
-            message_text=message_text
+        # Replay duplicates instead of creating new messages and N8N calls
+        keys = SendDeduplicator.keys(
+            request.user.id, conversation.id, message_text, request.headers.get('Idempotency-Key')
         )
+        dedup_claim, record = SendDeduplicator.begin(keys)
+        if record is not None:
+            record = SendDeduplicator.wait(keys, record, settings.CHAT_DEDUP_SYNC_WAIT)
+            response = _replay_send(record, stream)
+            metrics.observe_send('replay', started)
+            return response
         
-        # Get conversation history (last 10 messages before this one)
-        previous_messages = conversation.messages.exclude(
-            id=user_message.id
-        ).order_by('-created_at')[:10]
+        # Get conversation history that fits the budget (cached) and summary
+        conversation_history, conversation_summary = HistoryWindow.build(conversation)
         
-        conversation_history = N8NService.format_conversation_history(
-            previous_messages
-        )
+        # Queue the N8N round trip for the reply worker
+        if request.query_params.get('async') in ('1', 'true'):
+            with transaction.atomic():
+                user_message = TurnWriter.save_user_message(conversation, message_text)
+                job = ReplyJobQueue.enqueue(
+                    conversation, user_message, conversation_history, conversation_summary
+                )
+            data = {
+                'user_message': MessageSerializer(user_message).data,
+                'job': ReplyJobSerializer(job).data
+            }
+            SendDeduplicator.complete(dedup_claim, status.HTTP_202_ACCEPTED, data)
+            metrics.observe_send('queued', started)
+            return Response(data, status=status.HTTP_202_ACCEPTED)
+        
+        # Stream the reply as it is generated
+        if stream:
+            return _sse_response(_stream_bot_reply(
+                conversation, request.user, message_text,
+                conversation_history, conversation_summary, dedup_claim, started
+            ))
         
         # Send to N8N
         n8n_response = N8NService.send_message_to_n8n(
             user_id=request.user.id,
             conversation_id=conversation.id,
             current_message=message_text,
-            conversation_history=conversation_history
+            conversation_history=conversation_history,
+            conversation_summary=conversation_summary
         )
         
-        # Save bot response
-        bot_message = Message.objects.create(
-            conversation=conversation,
-            sender_type='bot',
-            message_text=n8n_response['bot_response'],
-            n8n_metadata=n8n_response.get('metadata', {})
-        )
+        # Save both messages and touch the conversation in one transaction
+        user_message, bot_message = TurnWriter.save_turn(conversation, message_text, n8n_response)
         
         # Return both messages
-        return Response({
+        data = {
             'user_message': MessageSerializer(user_message).data,
             'bot_message': MessageSerializer(bot_message).data,
             'n8n_success': n8n_response['success']
-        }, status=status.HTTP_201_CREATED)
+        }
+        SendDeduplicator.complete(dedup_claim, status.HTTP_201_CREATED, data)
+        metrics.observe_send('sync', started)
+        return Response(data, status=status.HTTP_201_CREATED)
     
     except Conversation.DoesNotExist:
         return Response({
@@ -164,9 +326,10 @@ def send_message_view(request, conversation_id):
         }, status=status.HTTP_404_NOT_FOUND)
     
     except Exception as e:
-        import traceback
-        print("Error in send_message_view:")
-        print(traceback.format_exc())
+        if dedup_claim:
+            SendDeduplicator.abort(dedup_claim)
+        
+        log_event(logger, logging.ERROR, 'view.error', exc_info=True, view='send_message_view')
         
         return Response({
             'error': 'Failed to send message',
@@ -176,9 +339,16 @@ def send_message_view(request, conversation_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condition(etag_func=conversation_etag)
 def conversation_messages_view(request, conversation_id):
     """
-    GET: Get all messages in a conversation
+    GET: Get messages in a conversation, newest first
+    
+    Paginated by cursor: follow `next` to load older messages. Responses
+    carry an ETag; send it back as If-None-Match to get 304 when unchanged.
+    
+    With `after=<message id>`, returns only newer messages, oldest first, as
+    {results, has_more} (delta sync for a client that has the rest).
     """
     
     try:
@@ -189,11 +359,25 @@ def conversation_messages_view(request, conversation_id):
             user=request.user
         )
         
-        # Get all messages
-        messages = conversation.messages.all()
-        serializer = MessageSerializer(messages, many=True)
+        after = request.query_params.get('after')
+        if after is not None:
+            if not after.isdigit():
+                return Response({
+                    'error': 'after must be a message ID'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            messages, has_more = DeltaSync.messages_after(conversation, int(after))
+            return Response({
+                'results': MessageSerializer(messages, many=True).data,
+                'has_more': has_more
+            }, status=status.HTTP_200_OK)
+        
+        # Get one page of messages
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_queryset(conversation.messages.all(), request)
+        serializer = MessageSerializer(page, many=True)
         
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return paginator.get_paginated_response(serializer.data)
     
     except Conversation.DoesNotExist:
         return Response({
@@ -201,11 +385,307 @@ def conversation_messages_view(request, conversation_id):
         }, status=status.HTTP_404_NOT_FOUND)
     
     except Exception as e:
-        import traceback
-        print("Error in conversation_messages_view:")
-        print(traceback.format_exc())
+        log_event(logger, logging.ERROR, 'view.error', exc_info=True, view='conversation_messages_view')
         
         return Response({
             'error': 'Failed to get messages',
             'detail': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def message_search_view(request):
+    """
+    GET: Full-text search across the user's messages, best match first
+    
+    Query params: q (required), conversation (optional ID), page, page_size.
+    Each result has a `snippet` with HTML-escaped text and <mark> around matches.
+    """
+    
+    try:
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({
+                'error': 'Query parameter q is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        conversation_id = request.query_params.get('conversation')
+        if conversation_id is not None and not conversation_id.isdigit():
+            return Response({
+                'error': 'conversation must be a conversation ID'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        paginator = SearchPagination()
+        results = paginator.paginate_search(
+            lambda limit, offset: MessageSearch.search(
+                request.user,
+                text,
+                conversation_id=int(conversation_id) if conversation_id else None,
+                limit=limit,
+                offset=offset
+            ),
+            request
+        )
+        return paginator.get_paginated_response(results)
+    
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'view.error', exc_info=True, view='message_search_view')
+        
+        return Response({
+            'error': 'Failed to search messages',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_view(request):
+    """
+    GET: Conversations changed and deletions since the `since` watermark
+    
+    Pass the `watermark` of the previous response as `since`. When `reset`
+    is true (first call, a watermark older than the tombstone TTL, or too
+    many changes) the client must reload its conversations instead.
+    """
+    
+    try:
+        try:
+            since = DeltaSync.parse_since(request.query_params.get('since'))
+        except ValueError:
+            return Response({
+                'error': 'since must be an ISO 8601 datetime'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        changes = DeltaSync.changes(request.user, since)
+        changes['conversations'] = ConversationSerializer(changes['conversations'], many=True).data
+        return Response(changes, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'view.error', exc_info=True, view='sync_view')
+        
+        return Response({
+            'error': 'Failed to sync',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reply_job_view(request, job_id):
+    """
+    GET: Get the status of a queued bot reply, with the bot message once done
+    """
+    
+    try:
+        # Get job and ensure its conversation belongs to the user
+        job = ReplyJob.objects.select_related('bot_message').get(
+            id=job_id,
+            conversation__user=request.user
+        )
+        
+        serializer = ReplyJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+    
+    except ReplyJob.DoesNotExist:
+        return Response({
+            'error': 'Job not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'view.error', exc_info=True, view='reply_job_view')
+        
+        return Response({
+            'error': 'Failed to get job',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def n8n_status_view(request):
+    """
+    GET: Circuit breaker and concurrency limiter state for this process (staff only)
+    """
+    return Response(N8NGuard.snapshot(), status=status.HTTP_200_OK)
+
+
+def metrics_view(request):
+    """
+    GET: Prometheus metrics for all worker processes
+    
+    Requires `Authorization: Bearer <METRICS_TOKEN>`; answers 404 while no
+    METRICS_TOKEN is configured.
+    """
+    
+    token = settings.METRICS_TOKEN
+    if not token:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    
+    body, content_type = metrics.render()
+    return HttpResponse(body, content_type=content_type)
+
+
+async def _authenticate_async(request):
+    """Run the JWT authentication used by the DRF views from an async view"""
+    try:
+        result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    if result is None:
+        return None
+    return result[0]
+
+
+@csrf_exempt
+@require_POST
+async def async_send_message_view(request, conversation_id):
+    """
+    POST: Send a message in a conversation and get bot response (async)
+    
+    Same contract as send_message_view, but the N8N round trip is awaited
+    instead of blocking a worker. Serve config.asgi:application to benefit.
+    """
+    
+    dedup_claim = None
+    started = time.monotonic()
+    
+    try:
+        user = await _authenticate_async(request)
+        if user is None:
+            return JsonResponse({
+                'detail': 'Authentication credentials were not provided.'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+        
+        # Same limits as send_message_view's SendRateThrottle
+        wait = await RateLimiter.acheck('send', user_id=user.id, ip=SendRateThrottle().get_ident(request))
+        if wait is not None:
+            response = JsonResponse({
+                'detail': f'Request was throttled. Expected available in {RateLimiter.retry_after(wait)} seconds.'
+            }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = RateLimiter.retry_after(wait)
+            return response
+        
+        # Get conversation and ensure it belongs to the user
+        try:
+            conversation = await Conversation.objects.aget(
+                id=conversation_id,
+                user=user
+            )
+        except Conversation.DoesNotExist:
+            return JsonResponse({
+                'error': 'Conversation not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # Validate message
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({
+                'error': 'Invalid JSON body'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = SendMessageSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        message_text = serializer.validated_data['message_text']
+        
+        # Replay duplicates instead of creating new messages and N8N calls
+        keys = SendDeduplicator.keys(
+            user.id, conversation.id, message_text, request.headers.get('Idempotency-Key')
+        )
+        dedup_claim, record = await SendDeduplicator.abegin(keys)
+        if record is not None:
+            record = await SendDeduplicator.await_done(keys, record)
+            if record is None or record['state'] != SendDeduplicator.DONE:
+                response = JsonResponse(_duplicate_error(record), status=status.HTTP_409_CONFLICT)
+                response['Retry-After'] = '1'
+                return response
+            response = JsonResponse(record['data'], status=record['status'])
+            response['Idempotent-Replayed'] = 'true'
+            metrics.observe_send('replay', started)
+            return response
+        
+        # Get conversation history that fits the budget (cached) and summary
+        conversation_history, conversation_summary = await HistoryWindow.abuild(conversation)
+        
+        # Send to N8N without blocking the event loop
+        n8n_response = await N8NService.async_send_message_to_n8n(
+            user_id=user.id,
+            conversation_id=conversation.id,
+            current_message=message_text,
+            conversation_history=conversation_history,
+            conversation_summary=conversation_summary
+        )
+        
+        # Save both messages and touch the conversation in one transaction
+        user_message, bot_message = await TurnWriter.asave_turn(conversation, message_text, n8n_response)
+        
+        # Return both messages
+        data = {
+            'user_message': MessageSerializer(user_message).data,
+            'bot_message': MessageSerializer(bot_message).data,
+            'n8n_success': n8n_response['success']
+        }
+        await SendDeduplicator.acomplete(dedup_claim, status.HTTP_201_CREATED, data)
+        metrics.observe_send('async', started)
+        return JsonResponse(data, status=status.HTTP_201_CREATED)
+    
+    except Exception as e:
+        if dedup_claim:
+            await SendDeduplicator.aabort(dedup_claim)
+        
+        log_event(logger, logging.ERROR, 'view.error', exc_info=True, view='async_send_message_view')
+        
+        return JsonResponse({
+            'error': 'Failed to send message',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def _event_stream(user_id):
+    """Relay the frames published for the user, with a comment line as heartbeat while idle"""
+    hub = RealtimeEvents.hub()
+    subscription = hub.subscribe(user_id)
+    try:
+        yield f"retry: {settings.CHAT_REALTIME_RETRY_MS}\n\n"
+        while True:
+            try:
+                frame = await asyncio.wait_for(subscription.get(), settings.CHAT_REALTIME_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if frame is None:
+                return  # Fell behind; the client reconnects and refetches
+            yield frame
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@require_GET
+async def realtime_events_view(request):
+    """
+    GET: Server-Sent Events with the user's conversation and message changes
+    
+    Lets the client apply deltas instead of refetching lists; see
+    RealtimeEvents for the event names. Needs config.asgi:application: a
+    WSGI server (runserver) buffers the whole never-ending stream in a
+    worker thread, so it answers 501 there and the client polls
+    GET /api/chat/sync/ instead.
+    """
+    
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({
+            'detail': 'Realtime events need the ASGI server; poll /api/chat/sync/ instead.'
+        }, status=status.HTTP_501_NOT_IMPLEMENTED)
+    
+    user = await _authenticate_async(request)
+    if user is None:
+        return JsonResponse({
+            'detail': 'Authentication credentials were not provided.'
+        }, status=status.HTTP_401_UNAUTHORIZED)
+    
+    return _sse_response(_event_stream(user.id))
@@ -0,0 +1,65 @@
+from urllib.parse import parse_qsl, unquote, urlparse
+
+
+def database_settings(url, environ, base_dir):
+    """
+    Build DATABASES from a DATABASE_URL
+    
+    postgres:// and postgresql:// select PostgreSQL (DB_POOL and
+    DB_PGBOUNCER in `environ` tune it); anything else is a SQLite file.
+    sqlite:///db.sqlite3 is relative to base_dir and sqlite:////tmp/db.sqlite3
+    is absolute.
+    
+    Args:
+        url: The DATABASE_URL
+        environ: Environment to read the DB_* options from
+        base_dir: Directory relative SQLite paths start from
+    
+    Returns:
+        dict: The DATABASES setting
+    """
+    url = urlparse(url)
+    
+    if url.scheme in ('postgres', 'postgresql'):
+        default = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': unquote(url.path.lstrip('/')),
+            'USER': unquote(url.username or ''),
+            'PASSWORD': unquote(url.password or ''),
+            'HOST': url.hostname or '',
+            'PORT': url.port or '',
+            # Persistent connections leak under ASGI (each request's sync thread
+            # opens its own), so reuse comes from DB_POOL or PgBouncer instead
+            'CONN_MAX_AGE': int(environ.get('DB_CONN_MAX_AGE', 0)),
+            'CONN_HEALTH_CHECKS': True,  # Check reused connections before each request
+            'OPTIONS': dict(parse_qsl(url.query)),  # e.g. ?sslmode=require
+        }
+        
+        # Django's own pool (psycopg 3 with the pool extra, see requirements.txt)
+        if environ.get('DB_POOL') == 'True':
+            default['CONN_MAX_AGE'] = 0  # The pool keeps the connections
+            default['OPTIONS']['pool'] = {
+                'min_size': int(environ.get('DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(environ.get('DB_POOL_MAX_SIZE', 10)),
+                'timeout': 10,
+            }
+        
+        # PgBouncer in transaction mode cannot keep server-side cursors open
+        if environ.get('DB_PGBOUNCER') == 'True':
+            default['DISABLE_SERVER_SIDE_CURSORS'] = True
+        return {'default': default}
+    
+    # Only the separator after the host goes: a fourth slash makes the path absolute
+    path = unquote(url.path[1:] if url.path.startswith('/') else url.path)
+    return {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': base_dir / (path or 'db.sqlite3'),
+            'OPTIONS': {
+                # WAL lets readers run while a worker writes; NORMAL is safe with WAL
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                'timeout': 20,  # Seconds to wait for the write lock (busy timeout)
+                'transaction_mode': 'IMMEDIATE',  # Take the write lock up front, avoiding upgrade deadlocks
+            },
+        }
+    }
@@ -1,6 +1,9 @@
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
+from corsheaders.defaults import default_headers
+from .database import database_settings
 
 # Build paths inside the project
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,6 +50,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'chat.middleware.ProfilingMiddleware',  # Opt-in Server-Timing and slow request reports
+    'chat.middleware.RequestMetricsMiddleware',  # Per-view latency and DB query metrics
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -72,13 +77,45 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
-# Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Database (DATABASE_URL selects PostgreSQL; without it a tuned SQLite file is used)
+DATABASES = database_settings(os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite3'), os.environ, BASE_DIR)
+
+# Cache (local memory by default; set REDIS_URL to share it between workers)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
+
+# Password hashing: argon2 (default), scrypt or pbkdf2. The others stay
+# listed so existing hashes still verify; they are rehashed with the
+# preferred hasher and current costs on the next successful login.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'argon2')
+_PASSWORD_HASHER_CLASSES = {
+    'argon2': 'accounts.hashers.Argon2PasswordHasher',
+    'scrypt': 'accounts.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'accounts.hashers.PBKDF2PasswordHasher',
 }
+PASSWORD_HASHERS = [_PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+]
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2))  # Passes over memory
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 19 * 1024))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 1))
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.environ.get('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))  # N, a power of 2
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.environ.get('PASSWORD_SCRYPT_BLOCK_SIZE', 8))
+PASSWORD_SCRYPT_PARALLELISM = int(os.environ.get('PASSWORD_SCRYPT_PARALLELISM', 1))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))  # Concurrent hashes per process
+PASSWORD_HASH_WAIT_TIMEOUT = 5  # Seconds a login waits for a hashing slot before a 503
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -117,12 +154,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [],  # Empty - we handle permissions in views
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
     ),
+    # Proxies in front of the app (Railway's edge is one). The client IP used by
+    # the rate limits is the X-Forwarded-For entry this many hops from the end;
+    # 0 ignores the header and uses REMOTE_ADDR
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1)),
 }
 
 # JWT Settings
@@ -134,6 +175,11 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Seconds a user resolved from an access token stays cached (0 queries every request).
+# Keep it short: queryset .update() bypasses the invalidation signals, so a user
+# deactivated that way stays signed in until the entry expires
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', 60))
+
 # CORS Settings (allow frontend to connect)
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # React default port
@@ -144,11 +190,127 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Request headers the frontend sends beyond the defaults, and the ETag it
+# reads back for conditional GETs
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match', 'idempotency-key', 'x-profile')
+CORS_EXPOSE_HEADERS = ['ETag']
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
 # N8N Webhook URL (we'll update this later when N8N is ready)
-N8N_WEBHOOK_URL = 'https://waleedahmedpti.app.n8n.cloud/webhook/mental-health'
+N8N_WEBHOOK_URL = os.environ.get(
+    'N8N_WEBHOOK_URL',
+    'https://waleedahmedpti.app.n8n.cloud/webhook/mental-health'
+)  # Point at manage.py fake_n8n for benchmarks
+
+# N8N HTTP connection pool (shared per process, recreated after fork)
+N8N_POOL_CONNECTIONS = int(os.environ.get('N8N_POOL_CONNECTIONS', 10))  # Distinct hosts kept in the pool
+N8N_POOL_MAXSIZE = int(os.environ.get('N8N_POOL_MAXSIZE', 20))  # Connections kept per host (async: max open)
+N8N_KEEPALIVE_EXPIRY = float(os.environ.get('N8N_KEEPALIVE_EXPIRY', 60))  # Seconds an idle connection is kept
+N8N_CONNECT_TIMEOUT = float(os.environ.get('N8N_CONNECT_TIMEOUT', 5))
+N8N_READ_TIMEOUT = float(os.environ.get('N8N_READ_TIMEOUT', 30))
+
+# N8N circuit breaker: open after N consecutive failures or a high error rate
+N8N_CIRCUIT_FAILURE_THRESHOLD = 5
+N8N_CIRCUIT_ERROR_RATE = 0.5  # Fraction of failed calls in the window
+N8N_CIRCUIT_WINDOW = 20  # Recent calls considered for the error rate
+N8N_CIRCUIT_MIN_CALLS = 10  # Calls needed before the error rate applies
+N8N_CIRCUIT_RESET_TIMEOUT = 30  # Seconds open before a trial call is allowed
+N8N_CIRCUIT_HALF_OPEN_CALLS = 1  # Trial calls allowed while half-open
+N8N_CIRCUIT_SLOW_CALL_SECONDS = float(os.environ.get('N8N_CIRCUIT_SLOW_CALL_SECONDS', 20))  # Slower successful calls (first byte for streams) count as failures
+
+# N8N adaptive concurrency limit per process (calls over it get the apology at once)
+N8N_CONCURRENCY_MIN = 2
+N8N_CONCURRENCY_MAX = int(os.environ.get('N8N_CONCURRENCY_MAX', 50))
+N8N_LATENCY_TARGET = float(os.environ.get('N8N_LATENCY_TARGET', 10))  # Seconds (first byte for streams); slower calls shrink the limit
+
+# Recent conversation history sent to N8N, cached per conversation
+CHAT_HISTORY_LIMIT = 10  # Max messages included in the N8N payload
+CHAT_HISTORY_CHAR_BUDGET = 8000  # Max characters of history (~2000 tokens)
+CHAT_HISTORY_SUMMARY_CHARS = 2000  # Rolling summary of older turns (0 disables)
+CHAT_HISTORY_SUMMARY_LINE_CHARS = 200  # Characters kept per summarized turn
+CHAT_HISTORY_CACHE_TTL = 60 * 60  # Seconds
+
+# Duplicate sends (Idempotency-Key header or identical in-flight messages)
+CHAT_IDEMPOTENCY_TTL = 24 * 60 * 60  # Seconds a response is replayed for an Idempotency-Key
+CHAT_DEDUP_RESULT_TTL = 10  # Seconds a finished send's response stays readable by requests waiting on it
+CHAT_DEDUP_SYNC_WAIT = 0  # Seconds a sync send waits for a duplicate in flight (holds a thread) before 409
+CHAT_DEDUP_POLL_INTERVAL = 0.1  # Seconds between checks while waiting for the first request
+
+# Background reply jobs (send with ?async=1, processed by run_reply_worker)
+CHAT_JOB_WORKERS = int(os.environ.get('CHAT_JOB_WORKERS', 4))  # Concurrent N8N calls per worker process
+CHAT_JOB_MAX_ATTEMPTS = 3
+CHAT_JOB_RETRY_DELAY = 2  # Seconds before the first retry, doubled for each later one
+CHAT_JOB_POLL_INTERVAL = 0.5  # Seconds between queue polls when idle
+CHAT_JOB_LOCK_TIMEOUT = 120  # Seconds before a running job from a dead worker is retried
+
+# Realtime events (GET /api/chat/events/)
+# Fan-out backend. LocalEventHub is in-process: with several gunicorn workers
+# (WEB_CONCURRENCY) or RUN_REPLY_WORKER, most events never reach the client
+CHAT_REALTIME_HUB = 'chat.realtime.LocalEventHub'
+CHAT_REALTIME_QUEUE_SIZE = 100  # Undelivered events per stream before a slow client is disconnected
+CHAT_REALTIME_HEARTBEAT = 15  # Seconds between keepalive comments on an idle stream
+CHAT_REALTIME_RETRY_MS = 3000  # Reconnect delay suggested to EventSource clients
+
+# Token-bucket rate limits per scope: '<requests>/<s|min|hour|day>' per
+# user, client IP and overall. Buckets live in Redis when REDIS_URL is set
+# (shared by all workers), otherwise in each process.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True') == 'True'
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'redis' if REDIS_URL else 'local')
+RATE_LIMITS = {
+    'send': {'user': '20/min', 'ip': '60/min', 'global': '1200/min'},
+    'login': {'ip': '10/min', 'email': '5/min', 'global': '300/min'},
+    'register': {'ip': '5/min', 'global': '100/min'},
+}
+RATE_LIMIT_LOCAL_MAX_KEYS = 100000  # In-process buckets kept; the least recently used go first
+
+# Delta sync (GET /api/chat/sync/ and messages/?after=)
+CHAT_SYNC_LIMIT = 200  # Max rows per delta; beyond this the client reloads
+CHAT_SYNC_OVERLAP = 5  # Seconds re-read before the watermark, for transactions committing late
+CHAT_SYNC_TOMBSTONE_TTL = 30 * 24 * 60 * 60  # Seconds deletions are remembered (manage.py prune_sync_tombstones)
+
+# Structured chat logging (one JSON object per line; message text is never logged)
+# Quiet under manage.py test so results stay readable; assertLogs still sees
+# every record, and CHAT_LOG_LEVEL=INFO shows them
+_TESTING = sys.argv[1:2] == ['test']
+CHAT_LOG_LEVEL = os.environ.get('CHAT_LOG_LEVEL', 'CRITICAL' if _TESTING else 'INFO')
+CHAT_LOG_SAMPLE_RATES = {
+    'n8n.call': float(os.environ.get('CHAT_LOG_CALL_SAMPLE_RATE', 1.0)),
+    'n8n.response': 0.1,  # Per-response debug detail
+}
+CHAT_LOG_MAX_FIELD_CHARS = 500
+
+# Prometheus metrics at /metrics (set PROMETHEUS_MULTIPROC_DIR with several workers)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Bearer token required to scrape; /metrics is off when empty
+
+# Request profiling (staff can also profile one request with an X-Profile: 1 or cprofile header)
+CHAT_PROFILING_ENABLED = os.environ.get('CHAT_PROFILING_ENABLED', 'False') == 'True'  # Timing headers on every response
+CHAT_PROFILING_SLOW_MS = 500  # Requests slower than this are logged with their query report
+CHAT_PROFILING_TOP_FUNCTIONS = 25  # Functions listed from a cProfile run
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'chat.structured_logging.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'chat_console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'chat': {
+            'handlers': ['chat_console'],
+            'level': CHAT_LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
 
 CSRF_TRUSTED_ORIGINS = [
     'https://mental-health-chatbot-production-3443.up.railway.app',
@@ -19,6 +19,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from .frontend_views import landing_page, register_page, login_page, chat_page
+from chat.views import metrics_view
 
 urlpatterns = [
     # Admin
@@ -28,6 +29,9 @@ urlpatterns = [
     path('api/auth/', include('accounts.urls')),
     path('api/chat/', include('chat.urls')),
     
+    # Prometheus metrics
+    path('metrics', metrics_view, name='metrics'),
+    
     # Frontend pages
     path('', landing_page, name='landing'),
     path('register/', register_page, name='register'),
@@ -0,0 +1,18 @@
+"""
+Gunicorn settings (start.sh and nixpacks.toml pass -c gunicorn.conf.py)
+
+Workers are chosen on the command line; this file only adds hooks.
+"""
+import os
+
+
+def child_exit(server, worker):
+    """
+    Forget an exited worker's live gauges in the Prometheus multiprocess directory
+    
+    Without this, gauges in 'livesum' / 'liveall' mode keep counting the
+    values of dead workers, and their files pile up across restarts.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
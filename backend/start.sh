@@ -1,4 +1,12 @@
 #!/bin/bash
 python manage.py migrate --noinput
+python manage.py prune_sync_tombstones
 python manage.py collectstatic --noinput
-gunicorn config.wsgi:application --bind 0.0.0.0:$PORT
+# Shared, empty metrics directory so /metrics covers every gunicorn worker
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+# Optional worker for messages sent with ?async=1
+if [ "$RUN_REPLY_WORKER" = "1" ]; then
+    python manage.py run_reply_worker &
+fi
+gunicorn config.asgi:application -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker --bind 0.0.0.0:$PORT
@@ -12,9 +12,13 @@ function saveToken(token) {
     localStorage.setItem('access_token', token);
 }
 
+// Last ETag and body per GET URL, for conditional requests
+const etagCache = new Map();
+
 // Remove token from localStorage
 function removeToken() {
     localStorage.removeItem('access_token');
+    etagCache.clear();
 }
 
 // Save user data
@@ -57,6 +61,13 @@ async function apiCall(endpoint, options = {}) {
         headers['Authorization'] = `Bearer ${token}`;
     }
     
+    // Revalidate cached GETs; the server answers 304 when nothing changed
+    const method = (options.method || 'GET').toUpperCase();
+    const cached = method === 'GET' ? etagCache.get(url) : null;
+    if (cached) {
+        headers['If-None-Match'] = cached.etag;
+    }
+    
     const config = {
         ...options,
         headers,
@@ -69,6 +80,11 @@ async function apiCall(endpoint, options = {}) {
         
         console.log('Response status:', response.status);
         
+        // Callers may modify what they get (e.g. reverse a page), so hand out copies
+        if (response.status === 304 && cached) {
+            return structuredClone(cached.data);
+        }
+        
         // Check if response is JSON
         const contentType = response.headers.get('content-type');
         if (!contentType || !contentType.includes('application/json')) {
@@ -88,7 +104,12 @@ async function apiCall(endpoint, options = {}) {
                 window.location.href = '/login/';
                 return;
             }
-            throw data;
+            throw Object.assign(data, { status: response.status });
+        }
+        
+        const etag = response.headers.get('ETag');
+        if (method === 'GET' && etag) {
+            etagCache.set(url, { etag, data: structuredClone(data) });
         }
         
         return data;
@@ -98,6 +119,68 @@ async function apiCall(endpoint, options = {}) {
     }
 }
 
+// Read a Server-Sent Events response, calling onEvent(eventName, data) per event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let eventName = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            
+            // Comment-only frames (keepalives) and retry hints carry no data
+            if (data) onEvent(eventName, JSON.parse(data));
+        }
+    }
+}
+
+// Extract the cursor parameter from a paginated `next`/`previous` URL
+function getCursor(pageUrl) {
+    if (!pageUrl) return null;
+    return new URL(pageUrl, window.location.origin).searchParams.get('cursor');
+}
+
+// Generate a unique key identifying one logical send
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+// Milliseconds to wait before each retry of a send
+const SEND_RETRY_DELAYS = [1000, 2000, 4000];
+
+// Run send(attempt), retrying network failures and 409/503 answers; send must
+// reuse one Idempotency-Key so the server replays a retry instead of saving it twice
+async function retrySend(send) {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            return await send(attempt);
+        } catch (error) {
+            const retryable = error instanceof TypeError || [409, 503].includes(error.status);
+            if (!retryable || attempt >= SEND_RETRY_DELAYS.length) throw error;
+            await new Promise(resolve => setTimeout(resolve, SEND_RETRY_DELAYS[attempt]));
+        }
+    }
+}
+
 // Auth API calls
 const authAPI = {
     register: (userData) => apiCall('/auth/register/', {
@@ -122,9 +205,11 @@ const authAPI = {
 
 // Chat API calls
 const chatAPI = {
-    getConversations: () => {
+    // Returns { next, previous, results }; pass the cursor from `next` for more
+    getConversations: (cursor = null) => {
         console.log('Getting conversations...');
-        return apiCall('/chat/conversations/', {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        return apiCall(`/chat/conversations/${query}`, {
             method: 'GET',
         });
     },
@@ -145,18 +230,106 @@ const chatAPI = {
         method: 'DELETE',
     }),
     
-    getMessages: (conversationId) => {
+    // Returns newest messages first as { next, previous, results };
+    // pass the cursor from `next` to load older messages
+    getMessages: (conversationId, cursor = null) => {
         console.log('Getting messages for conversation:', conversationId);
-        return apiCall(`/chat/conversations/${conversationId}/messages/`, {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        return apiCall(`/chat/conversations/${conversationId}/messages/${query}`, {
             method: 'GET',
         });
     },
     
-    sendMessage: (conversationId, messageText) => {
+    // Only the messages after afterId, oldest first, as { results, has_more }
+    getNewMessages: (conversationId, afterId) => apiCall(
+        `/chat/conversations/${conversationId}/messages/?after=${encodeURIComponent(afterId)}`, {
+        method: 'GET',
+    }),
+    
+    // Conversations changed and deletions since the watermark of the last
+    // sync; when the result has reset: true, reload the conversations instead
+    syncChanges: (since = null) => {
+        const query = since ? `?since=${encodeURIComponent(since)}` : '';
+        return apiCall(`/chat/sync/${query}`, {
+            method: 'GET',
+        });
+    },
+    
+    // Full-text search across the user's messages; snippets contain
+    // escaped text with <mark> around the matched words
+    searchMessages: (query, page = 1, conversationId = null) => {
+        console.log('Searching messages:', query);
+        const params = new URLSearchParams({ q: query, page });
+        if (conversationId) params.set('conversation', conversationId);
+        return apiCall(`/chat/search/?${params}`, {
+            method: 'GET',
+        });
+    },
+    
+    // Pass one newIdempotencyKey() per message and reuse it for every retry
+    // (see retrySend) so the server replays the first response
+    sendMessage: (conversationId, messageText, idempotencyKey) => {
         console.log('Sending message to conversation:', conversationId);
         return apiCall(`/chat/conversations/${conversationId}/send/`, {
             method: 'POST',
+            headers: { 'Idempotency-Key': idempotencyKey },
+            body: JSON.stringify({ message_text: messageText }),
+        });
+    },
+    
+    // Stream the bot reply as Server-Sent Events; onEvent(eventName, data) is
+    // called for delta, user_message, bot_message and done. Same idempotencyKey
+    // rules as sendMessage
+    streamMessage: async (conversationId, messageText, onEvent, idempotencyKey) => {
+        console.log('Streaming message to conversation:', conversationId);
+        const token = getToken();
+        
+        const response = await fetch(`${API_BASE_URL}/chat/conversations/${conversationId}/send/?stream=1`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+                'Authorization': `Bearer ${token}`,
+                'Idempotency-Key': idempotencyKey,
+            },
             body: JSON.stringify({ message_text: messageText }),
         });
+        
+        if (!response.ok) {
+            if (response.status === 401) {
+                removeToken();
+                removeUser();
+                window.location.href = '/login/';
+                return;
+            }
+            throw Object.assign(await response.json(), { status: response.status });
+        }
+        
+        await readEventStream(response, onEvent);
+    },
+    
+    // Listen for conversation.created/updated/deleted and message.created
+    // pushed by the server; resolves when the stream ends (abort with signal).
+    // Throws with status 501 when the server cannot push (not running ASGI)
+    subscribeEvents: async (onEvent, signal = null) => {
+        const response = await fetch(`${API_BASE_URL}/chat/events/`, {
+            headers: {
+                'Accept': 'text/event-stream',
+                'Authorization': `Bearer ${getToken()}`,
+            },
+            signal,
+        });
+        
+        if (!response.ok) {
+            if (response.status === 401) {
+                removeToken();
+                removeUser();
+                window.location.href = '/login/';
+                return;
+            }
+            throw Object.assign(new Error(`Event stream failed with status ${response.status}`), { status: response.status });
+        }
+        
+        await readEventStream(response, onEvent);
     },
 };
\ No newline at end of file
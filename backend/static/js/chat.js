@@ -1,6 +1,11 @@
 // Chat Page Script
 let currentConversationId = null;
 let conversations = [];
+let conversationsCursor = null;  // Cursor for the next page of conversations
+let olderMessagesCursor = null;  // Cursor for older messages in the open conversation
+let sendingConversationId = null;  // Conversation whose send is streaming in this tab
+let syncWatermark = null;  // Server time of the last delta sync
+const SYNC_POLL_INTERVAL = 15000;  // Milliseconds between syncs when the server cannot push events
 
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Chat page loaded');
@@ -21,7 +26,15 @@ function initializeChat() {
     
     // Load initial data
     loadUserInfo();
-    loadConversations();
+    syncChanges();
+    connectRealtime();
+    
+    // Catch up on what changed while the tab was in the background
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'visible') {
+            syncChanges();
+        }
+    });
     
     // Setup event listeners
     const newChatBtn = document.getElementById('new-chat-btn');
@@ -75,7 +88,9 @@ async function loadConversations() {
     console.log('Loading conversations...');
     
     try {
-        conversations = await chatAPI.getConversations();
+        const page = await chatAPI.getConversations();
+        conversations = page.results;
+        conversationsCursor = getCursor(page.next);
         console.log('Conversations loaded:', conversations.length);
         renderConversationsList();
         
@@ -89,6 +104,20 @@ async function loadConversations() {
     }
 }
 
+// Load the next page of conversations
+async function loadMoreConversations() {
+    if (!conversationsCursor) return;
+    
+    try {
+        const page = await chatAPI.getConversations(conversationsCursor);
+        conversations = conversations.concat(page.results);
+        conversationsCursor = getCursor(page.next);
+        renderConversationsList();
+    } catch (error) {
+        console.error('Failed to load more conversations:', error);
+    }
+}
+
 // Render conversations in sidebar
 function renderConversationsList() {
     const conversationsList = document.getElementById('conversations-list');
@@ -110,6 +139,12 @@ function renderConversationsList() {
             </button>
         </div>
     `).join('');
+    
+    if (conversationsCursor) {
+        conversationsList.insertAdjacentHTML('beforeend', `
+            <button class="load-more-btn" onclick="loadMoreConversations()">Show more</button>
+        `);
+    }
 }
 
 // Create new conversation
@@ -120,7 +155,7 @@ async function createNewConversation() {
         const newConv = await chatAPI.createConversation();
         console.log('New conversation created:', newConv);
         
-        conversations.unshift(newConv);
+        upsertConversation(newConv, true);
         currentConversationId = newConv.id;
         
         renderConversationsList();
@@ -151,7 +186,11 @@ async function loadConversation(conversationId) {
     currentConversationId = conversationId;
     
     try {
-        const messages = await chatAPI.getMessages(conversationId);
+        const page = await chatAPI.getMessages(conversationId);
+        olderMessagesCursor = getCursor(page.next);
+        
+        // API returns newest first; render chronologically
+        const messages = page.results.reverse();
         console.log('Messages loaded:', messages.length);
         
         renderMessages(messages);
@@ -164,6 +203,45 @@ async function loadConversation(conversationId) {
     }
 }
 
+// Load older messages above the ones already shown
+async function loadOlderMessages() {
+    if (!olderMessagesCursor || !currentConversationId) return;
+    
+    const messagesContainer = document.getElementById('messages-container');
+    if (!messagesContainer) return;
+    
+    try {
+        const page = await chatAPI.getMessages(currentConversationId, olderMessagesCursor);
+        olderMessagesCursor = getCursor(page.next);
+        
+        // Keep the scroll position while prepending
+        const previousHeight = messagesContainer.scrollHeight;
+        const loadOlderBtn = document.getElementById('load-older-btn');
+        if (loadOlderBtn) {
+            loadOlderBtn.remove();
+        }
+        
+        const olderHTML = page.results.reverse().map(buildMessageHTML).join('');
+        messagesContainer.insertAdjacentHTML('afterbegin', olderHTML);
+        renderLoadOlderButton();
+        
+        messagesContainer.scrollTop = messagesContainer.scrollHeight - previousHeight;
+    } catch (error) {
+        console.error('Failed to load older messages:', error);
+    }
+}
+
+// Show "Load older messages" at the top when there are more
+function renderLoadOlderButton() {
+    const messagesContainer = document.getElementById('messages-container');
+    
+    if (!messagesContainer || !olderMessagesCursor) return;
+    
+    messagesContainer.insertAdjacentHTML('afterbegin', `
+        <button class="load-more-btn" id="load-older-btn" onclick="loadOlderMessages()">Load older messages</button>
+    `);
+}
+
 // Render messages
 function renderMessages(messages) {
     const messagesContainer = document.getElementById('messages-container');
@@ -178,34 +256,36 @@ function renderMessages(messages) {
     }
     
     // Add all messages
-    messages.forEach(msg => {
-        const time = new Date(msg.created_at).toLocaleTimeString('en-US', {
-            hour: '2-digit',
-            minute: '2-digit'
-        });
-        
-        // Format message text with line breaks
-        let formattedText = escapeHtml(msg.message_text);
-        formattedText = formattedText.replace(/\n/g, '<br>');
-        
-        const messageHTML = `
-            <div class="message ${msg.sender_type}">
-                <div class="message-avatar">
-                    ${msg.sender_type === 'user' ? 'U' : 'AI'}
-                </div>
-                <div class="message-content">
-                    <p>${formattedText}</p>
-                    <div class="message-time">${time}</div>
-                </div>
-            </div>
-        `;
-        
-        messagesContainer.insertAdjacentHTML('beforeend', messageHTML);
-    });
+    messagesContainer.insertAdjacentHTML('beforeend', messages.map(buildMessageHTML).join(''));
+    renderLoadOlderButton();
     
     scrollToBottom();
 }
 
+// Build the HTML for one saved message
+function buildMessageHTML(msg) {
+    const time = new Date(msg.created_at).toLocaleTimeString('en-US', {
+        hour: '2-digit',
+        minute: '2-digit'
+    });
+    
+    // Format message text with line breaks
+    let formattedText = escapeHtml(msg.message_text);
+    formattedText = formattedText.replace(/\n/g, '<br>');
+    
+    return `
+        <div class="message ${msg.sender_type}" data-message-id="${msg.id}">
+            <div class="message-avatar">
+                ${msg.sender_type === 'user' ? 'U' : 'AI'}
+            </div>
+            <div class="message-content">
+                <p>${formattedText}</p>
+                <div class="message-time">${time}</div>
+            </div>
+        </div>
+    `;
+}
+
 // Send message
 async function sendMessage(e) {
     e.preventDefault();
@@ -234,23 +314,55 @@ async function sendMessage(e) {
     messageInput.value = '';
     messageInput.style.height = 'auto';
     
+    sendingConversationId = currentConversationId;
+    
     try {
         // Add user message to UI FIRST
-        addMessageToUI('user', messageText);
+        const userBubble = addMessageToUI('user', messageText);
         
         // Show typing indicator
         showTypingIndicator();
         
-        // Send to backend
-        console.log('Calling API to send message...');
-        const response = await chatAPI.sendMessage(currentConversationId, messageText);
-        console.log('Response received:', response);
+        // Send to backend and render the reply as it streams in; retries keep
+        // the key, so a send that already went through is replayed, not repeated
+        console.log('Calling API to stream message...');
+        const idempotencyKey = newIdempotencyKey();
+        let botText = '';
+        let botBubble = null;
         
-        // Remove typing indicator
-        removeTypingIndicator();
+        const onStreamEvent = (eventName, data) => {
+            if (eventName === 'delta') {
+                botText += data.text;
+                
+                // Replace typing indicator with the bot message on first chunk
+                if (!botBubble) {
+                    removeTypingIndicator();
+                    botBubble = addMessageToUI('bot', botText);
+                } else {
+                    updateMessageText(botBubble, botText);
+                }
+            } else if (eventName === 'user_message') {
+                userBubble.dataset.messageId = data.id;
+            } else if (eventName === 'bot_message') {
+                console.log('Bot message saved:', data.id);
+                if (!botBubble) {
+                    removeTypingIndicator();
+                    botBubble = addMessageToUI('bot', data.message_text);
+                } else {
+                    updateMessageText(botBubble, data.message_text);
+                }
+                botBubble.dataset.messageId = data.id;
+            }
+        };
         
-        // Add bot response to UI
-        addMessageToUI('bot', response.bot_message.message_text);
+        const conversationId = currentConversationId;
+        await retrySend(() => {
+            // A retried stream starts over from the first delta
+            botText = '';
+            return chatAPI.streamMessage(conversationId, messageText, onStreamEvent, idempotencyKey);
+        });
+        
+        removeTypingIndicator();
         
         // Update sidebar without reloading entire conversation list
         updateConversationInSidebar(currentConversationId, messageText);
@@ -260,6 +372,7 @@ async function sendMessage(e) {
         removeTypingIndicator();
         addMessageToUI('bot', 'Sorry, I encountered an error. Please try again.');
     } finally {
+        sendingConversationId = null;
         setInputLoading(false);
         if (messageInput) {
             messageInput.focus();
@@ -301,6 +414,20 @@ function addMessageToUI(senderType, text) {
     
     messagesContainer.insertAdjacentHTML('beforeend', messageHTML);
     scrollToBottom();
+    
+    return messagesContainer.lastElementChild;
+}
+
+// Update the text of a message already in the UI (used while streaming)
+function updateMessageText(messageEl, text) {
+    if (!messageEl) return;
+    
+    let formattedText = escapeHtml(text);
+    formattedText = formattedText.replace(/\n/g, '<br>');
+    formattedText = formattedText.replace(/(\d+)\.\s/g, '<br>$1. ');
+    
+    messageEl.querySelector('.message-content p').innerHTML = formattedText;
+    scrollToBottom();
 }
 
 // Show typing indicator
@@ -350,6 +477,173 @@ function updateConversationInSidebar(conversationId, lastMessage) {
     }
 }
 
+// Insert or replace a conversation in the sidebar list
+function upsertConversation(conv, moveToTop) {
+    const index = conversations.findIndex(c => c.id === conv.id);
+    if (index !== -1) {
+        if (!moveToTop) {
+            conversations[index] = conv;
+            return;
+        }
+        conversations.splice(index, 1);
+    }
+    conversations.unshift(conv);
+}
+
+// Fetch only what changed since the last sync (everything on the first call)
+async function syncChanges() {
+    try {
+        const changes = await chatAPI.syncChanges(syncWatermark);
+        
+        if (changes.reset) {
+            await loadConversations();
+            if (currentConversationId) {
+                await loadConversation(currentConversationId);
+            }
+        } else {
+            applyChanges(changes);
+        }
+        
+        syncWatermark = changes.watermark;
+    } catch (error) {
+        console.error('Failed to sync changes:', error);
+    }
+}
+
+// Apply a delta from the sync endpoint to the sidebar and open conversation
+async function applyChanges(changes) {
+    changes.conversations.forEach(conv => {
+        if (conv.is_archived) {
+            conversations = conversations.filter(c => c.id !== conv.id);
+        } else {
+            upsertConversation(conv, true);
+        }
+    });
+    
+    conversations = conversations.filter(c => !changes.deleted_conversations.includes(c.id));
+    if (changes.deleted_conversations.includes(currentConversationId)) {
+        currentConversationId = null;
+        const messagesContainer = document.getElementById('messages-container');
+        if (messagesContainer) {
+            messagesContainer.innerHTML = '';
+        }
+        showEmptyState();
+    }
+    
+    changes.deleted_messages.forEach(msg => {
+        const messageEl = document.querySelector(`[data-message-id="${msg.id}"]`);
+        if (messageEl) {
+            messageEl.remove();
+        }
+    });
+    
+    renderConversationsList();
+    
+    // A send streaming in this tab renders its own messages
+    const changed = changes.conversations.some(c => c.id === currentConversationId);
+    if (currentConversationId && changed && currentConversationId !== sendingConversationId) {
+        await loadNewMessages(currentConversationId);
+    }
+}
+
+// Append the messages saved after the newest one shown
+async function loadNewMessages(conversationId) {
+    const messagesContainer = document.getElementById('messages-container');
+    if (!messagesContainer) return;
+    
+    const shown = messagesContainer.querySelectorAll('[data-message-id]');
+    if (shown.length === 0) {
+        await loadConversation(conversationId);
+        return;
+    }
+    
+    let afterId = shown[shown.length - 1].dataset.messageId;
+    let hasMore = true;
+    while (hasMore && currentConversationId === conversationId) {
+        const page = await chatAPI.getNewMessages(conversationId, afterId);
+        page.results.forEach(msg => {
+            if (!document.querySelector(`[data-message-id="${msg.id}"]`)) {
+                messagesContainer.insertAdjacentHTML('beforeend', buildMessageHTML(msg));
+            }
+        });
+        if (page.results.length > 0) {
+            afterId = page.results[page.results.length - 1].id;
+            scrollToBottom();
+        }
+        hasMore = page.has_more;
+    }
+}
+
+// Keep the server-push stream open; after a drop, reconnect and resync once.
+// A server that cannot push (501, e.g. runserver) is polled instead
+async function connectRealtime() {
+    let delay = 1000;
+    let reconnecting = false;
+    
+    while (isLoggedIn()) {
+        try {
+            if (reconnecting) {
+                // Events sent while disconnected are lost; fetch what changed
+                syncChanges();
+            }
+            await chatAPI.subscribeEvents(handleRealtimeEvent);
+            delay = 1000;
+        } catch (error) {
+            if (error.status === 501) {
+                pollChanges();
+                return;
+            }
+            console.error('Realtime stream error:', error);
+            delay = Math.min(delay * 2, 30000);
+        }
+        
+        reconnecting = true;
+        await new Promise(resolve => setTimeout(resolve, delay));
+    }
+}
+
+// Sync periodically while the tab is visible (visibilitychange covers the rest)
+function pollChanges() {
+    setInterval(() => {
+        if (isLoggedIn() && document.visibilityState === 'visible') {
+            syncChanges();
+        }
+    }, SYNC_POLL_INTERVAL);
+}
+
+// Apply one pushed change instead of reloading lists
+function handleRealtimeEvent(eventName, data) {
+    if (eventName === 'conversation.created' || eventName === 'conversation.updated') {
+        upsertConversation(data, eventName === 'conversation.created');
+        renderConversationsList();
+    } else if (eventName === 'conversation.deleted') {
+        conversations = conversations.filter(c => c.id !== data.id);
+        if (currentConversationId === data.id) {
+            currentConversationId = null;
+            const messagesContainer = document.getElementById('messages-container');
+            if (messagesContainer) {
+                messagesContainer.innerHTML = '';
+            }
+            showEmptyState();
+        }
+        renderConversationsList();
+    } else if (eventName === 'message.created') {
+        upsertConversation(data.conversation, true);
+        renderConversationsList();
+        
+        // The sending tab renders its own turn from the send stream
+        const msg = data.message;
+        if (msg.conversation !== currentConversationId || msg.conversation === sendingConversationId) return;
+        if (document.querySelector(`[data-message-id="${msg.id}"]`)) return;
+        
+        const messagesContainer = document.getElementById('messages-container');
+        if (messagesContainer) {
+            messagesContainer.insertAdjacentHTML('beforeend', buildMessageHTML(msg));
+            scrollToBottom();
+        }
+    }
+}
+
 // Delete conversation
 async function deleteConversation(conversationId) {
     if (!confirm('Are you sure you want to delete this conversation?')) {